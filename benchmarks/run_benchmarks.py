@@ -0,0 +1,247 @@
+"""
+run_benchmarks.py - Benchmarks do pipeline com dados sinteticos
+Mede, para cada variante de schema raw, o tempo, o pico de RSS e os bytes de
+cada estagio do transform (API de estagios do transform.py) e do caminho de
+escrita do extract (write_partitions_direct), alem do tamanho, escrita e
+leitura do refined em cada perfil de armazenamento (storage_profiles.py).
+Os resultados sao gravados em JSON e podem ser comparados com um baseline.
+
+Uso:
+    python benchmarks/run_benchmarks.py --tickers 20 --years 1
+    python benchmarks/run_benchmarks.py --tickers 400 --years 20 --schemas long,wide --output big.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baselines/small.json --threshold 2.0
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'src'))
+sys.path.insert(0, str(ROOT / 'functions'))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from metrics import PeakRssSampler
+from synthetic import SCHEMAS, generate_raw_dataset, yfinance_frame
+
+TRANSFORM_STAGES = ['read', 'normalize', 'features', 'write_refined', 'aggregate', 'write_agg']
+
+# Regressao: valor atual > baseline * threshold + folga absoluta (ruido de tempos muito curtos)
+DEFAULT_THRESHOLD = 2.0
+MIN_SECONDS_SLACK = 0.5
+MIN_RSS_SLACK_MB = 64
+
+
+def measure(func):
+    """Executa func() e devolve (resultado, {'seconds', 'peak_rss_mb'})."""
+    with PeakRssSampler() as sampler:
+        started = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - started
+    return result, {'seconds': round(seconds, 4), 'peak_rss_mb': sampler.peak_mb}
+
+
+def written_bytes(written) -> int:
+    """Bytes gravados: lista de particoes (extract) ou relatorio de save_partitioned_by_date."""
+    partitions = written['partitions'] if isinstance(written, dict) else written or []
+    return sum(partition['bytes'] for partition in partitions)
+
+
+def isolated(func, *args):
+    """Executa func(*args) em um processo novo (pico de RSS sem a memoria retida por variantes anteriores)."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(func, *args).result()
+
+
+def bench_transform(schema: str, tickers: int, years: float, work_dir: Path, seed: int = 42,
+                    compact: bool = False) -> dict:
+    """Gera o dataset e mede cada estagio do transform (compact=True: COMPACT_DTYPES)."""
+    import transform
+
+    variant = f"{schema}+compact" if compact else schema
+    raw_dir = work_dir / schema / 'raw'
+    output_dir = work_dir / variant / 'out'
+    output_dir.mkdir(parents=True)
+    if raw_dir.exists():
+        dataset = json.loads((raw_dir.parent / 'dataset.json').read_text())
+        generation = {'seconds': 0.0, 'peak_rss_mb': 0.0}
+    else:
+        dataset, generation = measure(lambda: generate_raw_dataset(str(raw_dir), tickers, years, schema, seed))
+        (raw_dir.parent / 'dataset.json').write_text(json.dumps(dataset))
+
+    environ = {'BUCKET_NAME': str(output_dir), 'INPUT_PREFIX': str(raw_dir)}
+    if schema == 'canonical':
+        environ['RAW_SCHEMA'] = 'canonical'
+    if compact:
+        environ['COMPACT_DTYPES'] = 'true'
+
+    stages = {'generate': {**generation, 'bytes': dataset['bytes']}}
+    with contextlib.redirect_stdout(io.StringIO()):
+        config = transform.build_config(argv=['transform.py'], environ=environ)
+        ctx = {}
+        for stage in TRANSFORM_STAGES:
+            _, metrics = measure(lambda: transform.run_pipeline(config, [stage], ctx))
+            stages[stage] = metrics
+
+    stages['read']['bytes'] = dataset['bytes']
+    stages['write_refined']['bytes'] = written_bytes(ctx.get('written_refined'))
+    stages['write_agg']['bytes'] = written_bytes(ctx.get('written_agg'))
+    for metrics in stages.values():
+        metrics.setdefault('bytes', 0)
+
+    return {'rows': dataset['rows'], 'partitions': dataset['partitions'], 'stages': stages}
+
+
+def bench_extract_write(tickers: int, days: int, work_dir: Path, seed: int = 42) -> dict:
+    """Mede o caminho de escrita do extract (yfinance e canonico) para `days` pregoes."""
+    import extract
+    from object_store import LocalBackend
+
+    df = yfinance_frame(tickers, days, seed)
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for raw_schema in ['yfinance', 'canonical']:
+            backend = LocalBackend(work_dir / 'extract' / raw_schema)
+
+            def write():
+                frame = extract.to_canonical_long(df) if raw_schema == 'canonical' else df
+                return extract.write_partitions_direct(frame, backend, 'raw')
+
+            written, metrics = measure(write)
+            results[raw_schema] = {**metrics, 'bytes': written_bytes(written)}
+    return {'rows': len(df), 'days': days, 'stages': results}
+
+
+def bench_storage_profiles(refined_dir: Path, work_dir: Path) -> dict:
+    """
+    Regrava o refined de uma execucao com cada perfil de armazenamento e mede o
+    tamanho, o tempo de escrita e o tempo de leitura local (scan completo e
+    consulta seletiva por uma acao, que depende do min/max dos row groups).
+    """
+    import polars as pl
+    import transform
+    from storage_profiles import STORAGE_PROFILES, get_profile
+
+    df = pl.read_parquet(refined_dir / 'data_pregao=*' / 'data.parquet', hive_partitioning=True)
+    ticker = df['nome_acao'].max()
+    results = {}
+    for name in STORAGE_PROFILES:
+        output_dir = work_dir / 'profiles' / name
+        with contextlib.redirect_stdout(io.StringIO()):
+            report, metrics = measure(lambda: transform.save_partitioned_by_date(
+                df, str(output_dir), 'data_pregao', profile=get_profile(name)))
+
+        files = str(output_dir / 'data_pregao=*' / 'data.parquet')
+        started = time.perf_counter()
+        pl.scan_parquet(files).select(pl.col('fechamento').sum()).collect()
+        scan_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        pl.scan_parquet(files).filter(pl.col('nome_acao') == ticker).select(pl.col('fechamento').sum()).collect()
+        filtered_seconds = time.perf_counter() - started
+
+        results[name] = {**metrics, 'bytes': written_bytes(report),
+                         'scan_seconds': round(scan_seconds, 4), 'filtered_scan_seconds': round(filtered_seconds, 4)}
+    return {'rows': len(df), 'stages': results}
+
+
+def run_benchmarks(tickers: int = 20, years: float = 1, schemas: list = None, extract_days: int = 21,
+                   seed: int = 42) -> dict:
+    """
+    Executa a suite completa.
+
+    Returns:
+        Dict com 'config', 'machine' e 'results' {variante: {'stages': {estagio: metricas}}};
+        a variante '<schema>+compact' repete o primeiro schema com COMPACT_DTYPES
+    """
+    schemas = schemas or SCHEMAS
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        # Cada variante roda em um processo proprio; a primeira tambem no modo COMPACT_DTYPES
+        for schema in schemas:
+            results[schema] = isolated(bench_transform, schema, tickers, years, work_dir, seed)
+        results[f"{schemas[0]}+compact"] = isolated(bench_transform, schemas[0], tickers, years, work_dir, seed, True)
+        results['extract_write'] = bench_extract_write(tickers, extract_days, work_dir, seed)
+        results['storage_profiles'] = bench_storage_profiles(work_dir / schemas[0] / 'out' / 'refined', work_dir)
+
+    return {
+        'config': {'tickers': tickers, 'years': years, 'schemas': schemas,
+                   'extract_days': extract_days, 'seed': seed},
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                    'cpus': os.cpu_count()},
+        'results': results,
+    }
+
+
+def compare_to_baseline(current: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """
+    Compara tempo e pico de RSS de cada estagio com o baseline.
+
+    Returns:
+        Lista de regressoes: dicts com 'variant', 'stage', 'metric', 'baseline' e 'current'
+    """
+    regressions = []
+    slack = {'seconds': MIN_SECONDS_SLACK, 'peak_rss_mb': MIN_RSS_SLACK_MB}
+    for variant, result in current['results'].items():
+        base_stages = baseline.get('results', {}).get(variant, {}).get('stages', {})
+        for stage, metrics in result['stages'].items():
+            if stage not in base_stages:
+                continue
+            for metric, extra in slack.items():
+                limit = base_stages[stage][metric] * threshold + extra
+                if metrics[metric] > limit:
+                    regressions.append({'variant': variant, 'stage': stage, 'metric': metric,
+                                        'baseline': base_stages[stage][metric], 'current': metrics[metric]})
+    return regressions
+
+
+def print_report(report: dict):
+    print(f"{'variante':<17}{'estagio':<16}{'segundos':>10}{'pico RSS MB':>14}{'bytes':>16}{'scan s':>10}")
+    for variant, result in report['results'].items():
+        for stage, metrics in result['stages'].items():
+            scan = f"{metrics['scan_seconds']:>10.3f}" if 'scan_seconds' in metrics else ''
+            print(f"{variant:<17}{stage:<16}{metrics['seconds']:>10.3f}{metrics['peak_rss_mb']:>14.1f}"
+                  f"{metrics['bytes']:>16,}{scan}")
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks do pipeline com dados sinteticos")
+    parser.add_argument('--tickers', type=int, default=20)
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--schemas', default=','.join(SCHEMAS))
+    parser.add_argument('--extract-days', type=int, default=21)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Arquivo JSON com os resultados")
+    parser.add_argument('--baseline', help="Baseline JSON para comparacao")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.tickers, args.years, args.schemas.split(','), args.extract_days, args.seed)
+    print_report(report)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + '\n')
+        print(f"\n[OK] Resultados gravados em {args.output}")
+
+    if args.baseline:
+        regressions = compare_to_baseline(report, json.loads(Path(args.baseline).read_text()), args.threshold)
+        for r in regressions:
+            print(f"[REGRESSAO] {r['variant']}/{r['stage']} {r['metric']}: {r['baseline']} -> {r['current']}")
+        if regressions:
+            return 1
+        print(f"\n[OK] Nenhuma regressao acima de {args.threshold}x do baseline")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+startup.py - Partida a frio e invocacao quente da Lambda de extracao
+Cada repeticao roda em um processo Python novo (equivalente a um ambiente de
+execucao novo da Lambda) e mede: o init (import do extract.py), a primeira
+invocacao (partida a frio) e as invocacoes seguintes (quentes), no modo padrao
+e no modo de partida rapida (EXTRACT_FAST_START), com o tempo de import de cada
+dependencia pesada.
+
+As invocacoes usam dry_run e um cache de downloads (download_cache.py)
+pre-populado com o D-1 de cada ticker: nao ha acesso ao Yahoo nem a AWS.
+
+Uso:
+    python benchmarks/startup.py
+    python benchmarks/startup.py --repeats 5 --invocations 3 --output startup.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+MODES = {'eager': 'false', 'fast': 'true'}
+
+
+def child(invocations: int):
+    """Executado no processo novo: importa o extract e invoca o handler."""
+    started = time.perf_counter()
+    sys.path.insert(0, str(ROOT / 'functions'))
+    import extract
+    import_ms = (time.perf_counter() - started) * 1000
+
+    latencies = []
+    for _ in range(invocations):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = extract.lambda_handler({'dry_run': True}, None)
+        latencies.append(round((time.perf_counter() - started) * 1000, 1))
+        assert response['statusCode'] == 200, response
+
+    body = json.loads(response['body'])
+    print(json.dumps({
+        'import_ms': round(import_ms, 1),
+        'cold_invoke_ms': latencies[0],
+        'warm_invoke_ms': statistics.median(latencies[1:]) if len(latencies) > 1 else None,
+        'imports': extract.IMPORT_TIMINGS,
+        'cache_hits': body['cache']['hits'],
+    }))
+
+
+def populate_cache(cache_dir: str):
+    """Guarda no cache a resposta de D-1 de cada ticker (mesma chave usada pelo handler)."""
+    import pandas as pd
+
+    sys.path.insert(0, str(ROOT / 'src'))
+    from download_cache import DownloadCache
+
+    day = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    cache = DownloadCache(cache_dir)
+    for i, ticker in enumerate(['ITUB4.SA', 'BBDC4.SA', 'BBAS3.SA']):
+        frame = pd.DataFrame({'Date': [pd.Timestamp(day)], 'Close': [30.0 + i], 'High': [31.0 + i],
+                              'Low': [29.0 + i], 'Open': [29.5 + i], 'Volume': [1_000_000], 'Ticker': [ticker]})
+        cache.put(ticker, '1d', day, day, frame)
+
+
+def run_startup(repeats: int = 3, invocations: int = 3) -> dict:
+    """
+    Mede cada modo em `repeats` processos novos.
+
+    Returns:
+        Dict {modo: {'import_ms', 'cold_invoke_ms', 'warm_invoke_ms', 'imports'}} com medianas
+        (imports: tempo de cada dependencia carregada ate a ultima invocacao)
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        populate_cache(cache_dir)
+        for mode, fast_start in MODES.items():
+            environ = {**os.environ, 'EXTRACT_FAST_START': fast_start, 'DOWNLOAD_CACHE_DIR': cache_dir,
+                       'EMIT_METRICS': 'false', 'AWS_DEFAULT_REGION': os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')}
+            runs = []
+            for _ in range(repeats):
+                output = subprocess.run([sys.executable, __file__, '--child', '--invocations', str(invocations)],
+                                        env=environ, capture_output=True, text=True, check=True).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+
+            results[mode] = {
+                metric: round(statistics.median(run[metric] for run in runs), 1)
+                for metric in ['import_ms', 'cold_invoke_ms', 'warm_invoke_ms'] if runs[0][metric] is not None
+            }
+            results[mode]['imports'] = runs[-1]['imports']
+            results[mode]['cache_hits'] = runs[-1]['cache_hits']
+    return results
+
+
+def print_report(results: dict):
+    print(f"{'modo':<8}{'import ms':>12}{'1a invocacao ms':>18}{'quente ms':>12}")
+    for mode, result in results.items():
+        print(f"{mode:<8}{result['import_ms']:>12.1f}{result['cold_invoke_ms']:>18.1f}"
+              f"{result.get('warm_invoke_ms', 0.0):>12.1f}")
+    for mode, result in results.items():
+        imports = ', '.join(f"{name} {ms:.0f}" for name, ms in result['imports'].items())
+        print(f"  {mode} imports (ms): {imports}")
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Partida a frio e invocacao quente da Lambda de extracao")
+    parser.add_argument('--repeats', type=int, default=3, help="Processos novos por modo (mediana)")
+    parser.add_argument('--invocations', type=int, default=3, help="Invocacoes por processo (1a = fria)")
+    parser.add_argument('--output', help="Arquivo JSON com os resultados")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.invocations)
+        return 0
+
+    results = run_startup(args.repeats, args.invocations)
+    print_report(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + '\n')
+        print(f"\n[OK] Resultados gravados em {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
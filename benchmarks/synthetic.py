@@ -0,0 +1,135 @@
+"""
+synthetic.py - Geracao de datasets RAW sinteticos e reprodutiveis para benchmarks
+Gera N tickers x Y anos de pregoes (dias uteis) com precos em passeio aleatorio
+(seed fixa) no layout do extract.py (raw/YYYY-MM-DD/data.parquet), em qualquer
+variante de schema da camada raw:
+- long: Date, Ticker, Open, High, Low, Close, Volume (yf.download por ticker)
+- wide: MultiIndex do yfinance achatado (Close_T0001.SA, ...) + Ticker
+- mixed: primeira metade do historico long, segunda metade wide
+- canonical: long com os tipos canonicos (extract com raw_schema=canonical)
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+SCHEMAS = ['long', 'wide', 'mixed', 'canonical']
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+TRADING_DAYS_PER_YEAR = 252
+
+
+def ticker_names(tickers: int) -> list:
+    return [f"T{i:04d}.SA" for i in range(tickers)]
+
+
+def generate_prices(tickers: int, years: float, seed: int = 42, start: str = '2005-01-03') -> dict:
+    """
+    Gera precos OHLCV em passeio aleatorio.
+
+    Returns:
+        Dict com 'dates' (DatetimeIndex), 'tickers' (lista) e uma matriz
+        (dias x tickers) por campo de FIELDS
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=max(1, int(round(years * TRADING_DAYS_PER_YEAR))))
+    shape = (len(dates), tickers)
+
+    base = rng.uniform(5, 120, size=tickers)
+    close = base * np.exp(np.cumsum(rng.normal(0, 0.02, size=shape), axis=0))
+    open_ = close * (1 + rng.normal(0, 0.01, size=shape))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, size=shape)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, size=shape)))
+    volume = rng.integers(100_000, 50_000_000, size=shape)
+
+    return {
+        'dates': dates,
+        'tickers': ticker_names(tickers),
+        'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume,
+    }
+
+
+def long_table(prices: dict, day: int, canonical: bool = False) -> pa.Table:
+    """Long na ordem de colunas do yfinance (Date, Close, High, Low, Open, Volume, Ticker) ou canonica."""
+    tickers = prices['tickers']
+    date = prices['dates'][day]
+    columns = {
+        'Date': pa.array([date] * len(tickers), type=pa.timestamp('ns')),
+        'Ticker': pa.array(tickers, type=pa.string()),
+    }
+    for field in FIELDS:
+        values = prices[field][day]
+        columns[field] = pa.array(values, type=pa.int64() if field == 'Volume' else pa.float64())
+    order = ['Date', 'Ticker'] + FIELDS if canonical else ['Date', 'Close', 'High', 'Low', 'Open', 'Volume', 'Ticker']
+    return pa.table(columns).select(order)
+
+
+def wide_table(prices: dict, day: int) -> pa.Table:
+    """Uma linha por ticker; so as colunas do proprio ticker sao preenchidas (como no extract)."""
+    tickers = prices['tickers']
+    n = len(tickers)
+    date = prices['dates'][day]
+    diagonal = np.eye(n, dtype=bool)
+
+    columns = {'Date': pa.array([date] * n, type=pa.timestamp('ns'))}
+    for field in FIELDS:
+        values = prices[field][day]
+        dtype = pa.int64() if field == 'Volume' else pa.float64()
+        for k, ticker in enumerate(tickers):
+            column = np.zeros(n, dtype=values.dtype)
+            column[k] = values[k]
+            columns[f"{field}_{ticker}"] = pa.array(column, type=dtype, mask=~diagonal[k])
+    columns['Ticker'] = pa.array(tickers, type=pa.string())
+    return pa.table(columns)
+
+
+def generate_raw_dataset(output_dir: str, tickers: int = 20, years: float = 1, schema: str = 'long',
+                         seed: int = 42) -> dict:
+    """
+    Grava um dataset RAW sintetico em output_dir/YYYY-MM-DD/data.parquet.
+
+    Args:
+        output_dir: Diretorio da camada raw
+        tickers: Numero de tickers (ate 400 no cenario grande)
+        years: Anos de pregoes (ate 20 no cenario grande)
+        schema: Variante de schema (ver SCHEMAS)
+        seed: Semente do gerador (mesmo dataset para os mesmos parametros)
+
+    Returns:
+        Dict com 'rows', 'partitions' e 'bytes' gravados
+    """
+    if schema not in SCHEMAS:
+        raise ValueError(f"Schema invalido: {schema} (use {', '.join(SCHEMAS)})")
+
+    prices = generate_prices(tickers, years, seed)
+    days = len(prices['dates'])
+    root = Path(output_dir)
+    total_bytes = 0
+
+    for day in range(days):
+        if schema == 'wide' or (schema == 'mixed' and day >= days // 2):
+            table = wide_table(prices, day)
+        else:
+            table = long_table(prices, day, canonical=(schema == 'canonical'))
+
+        target = root / prices['dates'][day].strftime('%Y-%m-%d') / 'data.parquet'
+        target.parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table, target)
+        total_bytes += target.stat().st_size
+
+    return {'rows': days * tickers, 'partitions': days, 'bytes': total_bytes}
+
+
+def yfinance_frame(tickers: int, days: int, seed: int = 42) -> pd.DataFrame:
+    """DataFrame combinado como o do extract (colunas MultiIndex por ticker + Ticker)."""
+    prices = generate_prices(tickers, days / TRADING_DAYS_PER_YEAR, seed)
+    frames = []
+    for k, ticker in enumerate(prices['tickers']):
+        frame = pd.DataFrame({('Date', ''): prices['dates']})
+        for field in FIELDS:
+            frame[(field, ticker)] = prices[field][:, k]
+        frame[('Ticker', '')] = ticker
+        frame.columns = pd.MultiIndex.from_tuples(frame.columns)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
@@ -7,6 +7,9 @@ DROP TABLE IF EXISTS default.refined_stocks;
 DROP TABLE IF EXISTS default.aggregated_stocks_monthly;
 
 -- 2. RECRIAR TABELA REFINED_STOCKS (ajuste o bucket conforme necessário)
+-- O codec dos arquivos vem do perfil de armazenamento do transform (STORAGE_PROFILE,
+-- padrao zstd-sorted); a leitura independe dele. A propriedade abaixo so vale para
+-- dados gravados pelo proprio Athena (INSERT/CTAS).
 CREATE EXTERNAL TABLE IF NOT EXISTS default.refined_stocks (
     nome_acao STRING,
     abertura DOUBLE,
@@ -27,7 +30,7 @@ CREATE EXTERNAL TABLE IF NOT EXISTS default.refined_stocks (
 PARTITIONED BY (data_pregao STRING)
 STORED AS PARQUET
 LOCATION 's3://818392673747-data-lake-bucket/refined/'
-TBLPROPERTIES ('parquet.compress'='SNAPPY');
+TBLPROPERTIES ('parquet.compression'='ZSTD');
 
 -- 3. RECRIAR TABELA AGGREGATED_STOCKS_MONTHLY
 CREATE EXTERNAL TABLE IF NOT EXISTS default.aggregated_stocks_monthly (
@@ -44,7 +47,7 @@ CREATE EXTERNAL TABLE IF NOT EXISTS default.aggregated_stocks_monthly (
 PARTITIONED BY (mes_referencia STRING)
 STORED AS PARQUET
 LOCATION 's3://818392673747-data-lake-bucket/agg/'
-TBLPROPERTIES ('parquet.compress'='SNAPPY');
+TBLPROPERTIES ('parquet.compression'='ZSTD');
 
 -- 4. ADICIONAR PARTIÇÕES AUTOMATICAMENTE
 -- Essas queries vão descobrir automaticamente as partições no S3
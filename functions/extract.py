@@ -2,21 +2,104 @@
 extract.py - Extracao de dados de acoes brasileiras (Blue Chips B3)
 Baixa dados historicos via yfinance e salva em formato Parquet particionado por data.
 """
+from __future__ import annotations
+
+import time
+
+# Inicio da carga do modulo (init da Lambda): base do tempo de partida reportado
+INIT_STARTED = time.perf_counter()
+
+import importlib
 import json
 import os
+import socket
+import sys
+import threading
 from pathlib import Path
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    from object_store import DEFAULT_MAX_WORKERS, LocalBackend, S3Backend, join_key, put_many, with_retries
+    from metrics import emit, stage_metrics
+except ImportError:
+    # Execucao local: os modulos compartilhados ficam em src/ (no pacote da Lambda ficam ao lado)
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+    from object_store import DEFAULT_MAX_WORKERS, LocalBackend, S3Backend, join_key, put_many, with_retries
+    from metrics import emit, stage_metrics
+from download_cache import open_cache
+
+# Partida rapida: dependencias pesadas so sao importadas no primeiro uso (ex: o
+# yfinance nao e carregado se todos os tickers vierem do cache, nem o boto3 em dry_run)
+FAST_START = os.environ.get('EXTRACT_FAST_START', 'false').lower() in ('1', 'true', 'yes')
+
+# Teste de conectividade com o Yahoo: 'on_empty' (padrao, so como diagnostico quando
+# nada foi baixado), 'always' (antes do download) ou 'off'
+CONNECTIVITY_PROBE = os.environ.get('EXTRACT_CONNECTIVITY_PROBE', 'on_empty')
+
+# Tempo de import (ms) de cada dependencia pesada, na ordem de carga (cada modulo
+# conta apenas o que ainda nao tinha sido importado; ja importados ficam de fora)
+IMPORT_TIMINGS = {}
+_import_lock = threading.RLock()
+
+
+class LazyModule:
+    """Modulo importado no primeiro acesso a um atributo, com o tempo registrado em IMPORT_TIMINGS."""
+    
+    def __init__(self, name: str, before_import=None):
+        self._name = name
+        self._before_import = before_import
+        self._module = None
+    
+    def load(self):
+        if self._module is None:
+            with _import_lock:
+                if self._module is None:
+                    if self._before_import:
+                        self._before_import()
+                    loaded = self._name in sys.modules
+                    started = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    if not loaded:
+                        IMPORT_TIMINGS[self._name] = round((time.perf_counter() - started) * 1000, 1)
+                    self._module = module
+        return self._module
+    
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
 
-os.environ["HOME"] = "/tmp"
-Path("/tmp/.cache/py-yfinance").mkdir(parents=True, exist_ok=True)
+def _prepare_yfinance():
+    # O yfinance grava o cache de fusos em $HOME; na Lambda so /tmp e gravavel
+    os.environ["HOME"] = "/tmp"
+    Path("/tmp/.cache/py-yfinance").mkdir(parents=True, exist_ok=True)
 
-import pandas as pd
-import yfinance as yf
-import pyarrow as pa
-import pyarrow.parquet as pq
-import boto3
 
-s3_client = boto3.client('s3')
+pd = LazyModule('pandas')
+pa = LazyModule('pyarrow')
+pc = LazyModule('pyarrow.compute')
+pq = LazyModule('pyarrow.parquet')
+yf = LazyModule('yfinance', before_import=_prepare_yfinance)
+boto3 = LazyModule('boto3')
+partition_index = LazyModule('partition_index')
+storage_profiles = LazyModule('storage_profiles')
+HEAVY_MODULES = [pd, pa, pc, pq, yf, boto3, partition_index, storage_profiles]
+
+_s3_client = None
+
+
+def get_s3_client():
+    """Cliente S3 criado uma vez por ambiente de execucao e reaproveitado nas invocacoes quentes."""
+    global _s3_client
+    if _s3_client is None:
+        with _import_lock:
+            if _s3_client is None:
+                _s3_client = boto3.client('s3')
+    return _s3_client
+
+
+# Cache em disco das respostas do yfinance (download_cache.py): /tmp sobrevive entre invocacoes quentes
+download_cache = open_cache()
 
 TICKERS_BLUE_CHIPS = [
     'ITUB4.SA',
@@ -24,6 +107,44 @@ TICKERS_BLUE_CHIPS = [
     'BBAS3.SA'
 ]
 
+# Download concorrente: largura do pool, requisicoes por segundo e timeout por ticker
+DOWNLOAD_MAX_WORKERS = int(os.environ.get('DOWNLOAD_MAX_WORKERS', '4'))
+DOWNLOAD_RATE_PER_SECOND = float(os.environ.get('DOWNLOAD_RATE_PER_SECOND', '2'))
+DOWNLOAD_TIMEOUT_SECONDS = float(os.environ.get('DOWNLOAD_TIMEOUT_SECONDS', '30'))
+DOWNLOAD_INTERVAL = '1d'
+
+# Perfil Parquet da camada raw (storage_profiles.py): 'snappy-fast' (padrao) ou 'zstd-sorted'
+RAW_STORAGE_PROFILE = os.environ.get('RAW_STORAGE_PROFILE', 'snappy-fast')
+
+# Backfill: pedacos (meses) baixados simultaneamente e folga mantida antes do timeout da Lambda
+BACKFILL_MAX_WORKERS = int(os.environ.get('BACKFILL_MAX_WORKERS', '2'))
+BACKFILL_SAFETY_SECONDS = float(os.environ.get('BACKFILL_SAFETY_SECONDS', '60'))
+BACKFILL_CHECKPOINT_DIR = '_backfill'
+
+# Marker que dispara a transformacao, com o intervalo gravado na chave:
+# raw/_success/<inicio>_<fim>/_SUCCESS (a trigger_glue repassa START_DATE/END_DATE ao Glue)
+SUCCESS_MARKER_DIR = '_success'
+
+# Schema da camada raw: 'yfinance' (formato original, MultiIndex achatado) ou 'canonical' (longo)
+RAW_PRICE_FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+class RateLimiter:
+    """Limita o inicio de requisicoes a `rate_per_second` (compartilhado entre threads)."""
+    
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+    
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
 
 def download_ticker_data(ticker: str, start_date: str, end_date: str) -> pd.DataFrame:
     """
@@ -44,6 +165,7 @@ def download_ticker_data(ticker: str, start_date: str, end_date: str) -> pd.Data
             ticker, 
             start=start_date, 
             end=end_date, 
+            interval=DOWNLOAD_INTERVAL,
             progress=False,
             timeout=10
         )
@@ -60,7 +182,7 @@ def download_ticker_data(ticker: str, start_date: str, end_date: str) -> pd.Data
     try:
         print(f"  -> Tentando metodo alternativo...")
         ticker_obj = yf.Ticker(ticker)
-        df = ticker_obj.history(start=start_date, end=end_date)
+        df = ticker_obj.history(start=start_date, end=end_date, interval=DOWNLOAD_INTERVAL)
         
         if df.empty:
             print(f"  [WARN] Nenhum dado retornado para {ticker}")
@@ -78,35 +200,242 @@ def download_ticker_data(ticker: str, start_date: str, end_date: str) -> pd.Data
         return pd.DataFrame()
 
 
-def extract_all_tickers(tickers: list, start_date: str, end_date: str) -> pd.DataFrame:
+def download_tickers_batch(tickers: list, start_date: str, end_date: str) -> dict:
     """
-    Baixa dados de todos os tickers e combina em um unico DataFrame.
+    Baixa varios tickers em uma unica requisicao do yfinance e separa por ticker.
+    Cada DataFrame tem o mesmo formato retornado por download_ticker_data.
     
     Args:
-        tickers: Lista de tickers para extrair
+        tickers: Lista de tickers
         start_date: Data inicial no formato 'YYYY-MM-DD'
         end_date: Data final no formato 'YYYY-MM-DD'
     
     Returns:
-        DataFrame consolidado com todos os tickers ou DataFrame vazio
+        Dict {ticker: DataFrame} apenas com os tickers que retornaram dados
     """
-    all_data = []
+    print(f"Baixando {len(tickers)} tickers em lote...")
+    
+    df = yf.download(
+        tickers,
+        start=start_date,
+        end=end_date,
+        interval=DOWNLOAD_INTERVAL,
+        progress=False,
+        timeout=10,
+        group_by='column'
+    )
+    
+    result = {}
+    if df.empty or not isinstance(df.columns, pd.MultiIndex):
+        return result
     
+    available = set(df.columns.get_level_values(1))
     for ticker in tickers:
-        df = download_ticker_data(ticker, start_date, end_date)
-        if not df.empty:
-            all_data.append(df)
+        if ticker not in available:
+            continue
+        
+        df_ticker = df.xs(ticker, axis=1, level=1, drop_level=False).dropna(how='all')
+        if df_ticker.empty:
+            continue
+        
+        df_ticker = df_ticker.reset_index()
+        df_ticker['Ticker'] = ticker
+        result[ticker] = df_ticker
+        print(f"  [OK] {ticker}: {len(df_ticker)} registros (metodo lote)")
+    
+    return result
+
+
+def download_all_tickers(tickers: list, start_date: str, end_date: str,
+                         downloader=download_ticker_data,
+                         batch_downloader=download_tickers_batch,
+                         max_workers: int = DOWNLOAD_MAX_WORKERS,
+                         rate_per_second: float = DOWNLOAD_RATE_PER_SECOND,
+                         timeout: float = DOWNLOAD_TIMEOUT_SECONDS,
+                         cache=None):
+    """
+    Baixa os tickers primeiro em lote e depois, em paralelo, os que faltaram.
+    Com `cache`, tickers ja guardados para o mesmo periodo nao sao baixados e as
+    respostas novas sao guardadas.
+    
+    Args:
+        tickers: Lista de tickers para extrair
+        start_date: Data inicial no formato 'YYYY-MM-DD'
+        end_date: Data final no formato 'YYYY-MM-DD'
+        downloader: Funcao (ticker, start, end) -> DataFrame usada por ticker
+        batch_downloader: Funcao (tickers, start, end) -> {ticker: DataFrame}; None desativa o lote
+        max_workers: Numero maximo de downloads simultaneos
+        rate_per_second: Maximo de requisicoes iniciadas por segundo
+        timeout: Tempo maximo (s) de cada download individual
+        cache: DownloadCache (download_cache.py) ou None
+    
+    Returns:
+        Tupla (DataFrame consolidado ou vazio, dict {ticker: resultado})
+    """
+    frames = {}
+    report = {}
+    
+    # Carrega aqui (e nao dentro do cache) as dependencias usadas pelo cache, para o tempo
+    # de import ficar em IMPORT_TIMINGS no modo de partida rapida
+    pd.load()
+    if cache is not None:
+        pq.load()
+        for ticker in tickers:
+            df = cache.get(ticker, DOWNLOAD_INTERVAL, start_date, end_date)
+            if df is not None:
+                frames[ticker] = df
+                report[ticker] = {'status': 'ok', 'method': 'cache', 'records': len(df), 'seconds': 0.0}
+                print(f"  [OK] {ticker}: {len(df)} registros (cache)")
+    
+    batch_tickers = [ticker for ticker in tickers if ticker not in frames]
+    if batch_downloader is not None and len(batch_tickers) > 1:
+        started = time.monotonic()
+        batch_frames = {}
+        try:
+            batch_frames = batch_downloader(batch_tickers, start_date, end_date)
+        except Exception as e:
+            print(f"  [WARN] download em lote falhou: {type(e).__name__}: {str(e)}")
+        elapsed = round(time.monotonic() - started, 3)
+        
+        for ticker, df in batch_frames.items():
+            frames[ticker] = df
+            report[ticker] = {'status': 'ok', 'method': 'batch', 'records': len(df), 'seconds': elapsed}
+    
+    pending = [ticker for ticker in tickers if ticker not in frames]
+    if pending:
+        limiter = RateLimiter(rate_per_second)
+        started_at = {}
+        
+        def task(ticker):
+            limiter.wait()
+            started_at[ticker] = time.monotonic()
+            return downloader(ticker, start_date, end_date)
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        futures = {executor.submit(task, ticker): ticker for ticker in pending}
+        running = set(futures)
+        
+        while running:
+            done, running = wait(running, timeout=0.1, return_when=FIRST_COMPLETED)
+            
+            for future in done:
+                ticker = futures[future]
+                seconds = round(time.monotonic() - started_at.get(ticker, time.monotonic()), 3)
+                try:
+                    df = future.result()
+                except Exception as e:
+                    print(f"  [ERROR] Erro ao baixar {ticker}: {type(e).__name__}: {str(e)}")
+                    report[ticker] = {'status': 'error', 'method': 'single', 'records': 0,
+                                      'seconds': seconds, 'error': f"{type(e).__name__}: {str(e)}"}
+                    continue
+                
+                if df.empty:
+                    report[ticker] = {'status': 'empty', 'method': 'single', 'records': 0, 'seconds': seconds}
+                else:
+                    frames[ticker] = df
+                    report[ticker] = {'status': 'ok', 'method': 'single', 'records': len(df), 'seconds': seconds}
+            
+            # Downloads que passaram do timeout sao abandonados (a thread termina sozinha)
+            now = time.monotonic()
+            for future in list(running):
+                ticker = futures[future]
+                if ticker in started_at and now - started_at[ticker] > timeout:
+                    print(f"  [ERROR] Timeout ao baixar {ticker} ({timeout}s)")
+                    report[ticker] = {'status': 'timeout', 'method': 'single', 'records': 0,
+                                      'seconds': round(now - started_at[ticker], 3)}
+                    running.discard(future)
+        
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    if cache is not None:
+        for ticker, result in report.items():
+            if result['status'] == 'ok' and result['method'] != 'cache':
+                try:
+                    cache.put(ticker, DOWNLOAD_INTERVAL, start_date, end_date, frames[ticker])
+                except Exception as e:
+                    print(f"  [WARN] Falha ao gravar {ticker} no cache: {type(e).__name__}: {str(e)}")
+    
+    all_data = [frames[ticker] for ticker in tickers if ticker in frames]
     
     if not all_data:
         print("[ERROR] Nenhum dado foi baixado!")
-        return pd.DataFrame()
+        return pd.DataFrame(), report
     
     df_combined = pd.concat(all_data, ignore_index=True)
     
     print(f"\n[OK] Total de {len(df_combined)} registros combinados")
+    return df_combined, report
+
+
+def extract_all_tickers(tickers: list, start_date: str, end_date: str, **kwargs) -> pd.DataFrame:
+    """
+    Baixa dados de todos os tickers e combina em um unico DataFrame.
+    
+    Args:
+        tickers: Lista de tickers para extrair
+        start_date: Data inicial no formato 'YYYY-MM-DD'
+        end_date: Data final no formato 'YYYY-MM-DD'
+        **kwargs: Opcoes repassadas para download_all_tickers (downloader, max_workers, ...)
+    
+    Returns:
+        DataFrame consolidado com todos os tickers ou DataFrame vazio
+    """
+    df_combined, _ = download_all_tickers(tickers, start_date, end_date, **kwargs)
     return df_combined
 
 
+def flatten_column_names(columns: pd.MultiIndex) -> list:
+    """Achata o MultiIndex do yfinance: ('Close', 'ITUB4.SA') -> 'Close_ITUB4.SA'."""
+    return ['_'.join(col).strip('_') if col[1] else col[0] for col in columns.values]
+
+
+def to_canonical_long(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte o retorno do yfinance (MultiIndex/wide, longo ou misto) para o
+    schema longo canonico da camada raw: Date, Ticker, Open, High, Low, Close, Volume.
+    Com esse schema o transform le a camada raw sem deteccao de colunas (RAW_SCHEMA=canonical).
+    
+    Args:
+        df: DataFrame retornado por download_all_tickers
+    
+    Returns:
+        DataFrame longo ordenado por Ticker e Date (Date sem timezone, Volume Int64)
+    """
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.set_axis(flatten_column_names(df.columns), axis=1)
+    
+    dates = df['Date']
+    if dates.dtype == object:
+        # Concat de download (sem timezone) com history (com timezone): mantem a data local
+        dates = dates.map(lambda value: pd.Timestamp(value).tz_localize(None) if pd.Timestamp(value).tzinfo
+                          else pd.Timestamp(value))
+    dates = pd.to_datetime(dates)
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    dates = dates.dt.normalize()
+    
+    wide_tickers = sorted({
+        col.split('_', 1)[1] for col in df.columns
+        if '_' in col and col.split('_', 1)[0] in RAW_PRICE_FIELDS
+    })
+    
+    def build(ticker, columns):
+        part = pd.DataFrame({'Date': dates, 'Ticker': ticker})
+        for field, column in zip(RAW_PRICE_FIELDS, columns):
+            part[field] = df[column] if column in df.columns else float('nan')
+        return part
+    
+    parts = [build(ticker, [f"{field}_{ticker}" for field in RAW_PRICE_FIELDS]) for ticker in wide_tickers]
+    if 'Ticker' in df.columns and 'Close' in df.columns:
+        parts.append(build(df['Ticker'], RAW_PRICE_FIELDS))
+    
+    long_df = pd.concat(parts, ignore_index=True).dropna(subset=['Close'])
+    long_df = long_df.astype({'Ticker': 'string', 'Open': 'float64', 'High': 'float64',
+                              'Low': 'float64', 'Close': 'float64', 'Volume': 'Int64'})
+    
+    return long_df.sort_values(['Ticker', 'Date'], kind='stable').reset_index(drop=True)
+
+
 def save_to_parquet_partitioned(df: pd.DataFrame, output_dir: str):
     """
     Salva DataFrame em formato Parquet particionado por data.
@@ -119,8 +448,7 @@ def save_to_parquet_partitioned(df: pd.DataFrame, output_dir: str):
     
     if isinstance(df_copy.columns, pd.MultiIndex):
         print("  Achatando MultiIndex...")
-        df_copy.columns = ['_'.join(col).strip('_') if col[1] else col[0] 
-                           for col in df_copy.columns.values]
+        df_copy.columns = flatten_column_names(df_copy.columns)
     
     print(f"  Colunas: {list(df_copy.columns)}")
     
@@ -145,38 +473,350 @@ def save_to_parquet_partitioned(df: pd.DataFrame, output_dir: str):
     
     print(f"  [OK] Dados salvos localmente")
 
-def upload_to_s3(local_dir: str, bucket: str, s3_prefix: str):
+def write_partitions_direct(df: pd.DataFrame, backend, prefix: str,
+                            max_workers: int = DEFAULT_MAX_WORKERS, storage_profile: str = None) -> list:
+    """
+    Grava o DataFrame particionado por data direto no backend (S3 ou local),
+    sem passar por /tmp: converte para Arrow uma unica vez, ordena pela data
+    e serializa cada fatia (sem copia) em um buffer em memoria. Depois dos
+    uploads o indice da camada (_index.parquet) e atualizado em um unico PUT.
+    
+    Args:
+        df: DataFrame retornado pelo yfinance
+        backend: S3Backend ou LocalBackend (object_store)
+        prefix: Prefixo das chaves (ex: 'raw')
+        max_workers: Numero maximo de uploads simultaneos
+        storage_profile: Perfil Parquet (padrao: RAW_STORAGE_PROFILE)
+    
+    Returns:
+        Lista de dicts com 'partition', 'rows' e 'bytes' de cada particao gravada
+    """
+    if isinstance(df.columns, pd.MultiIndex):
+        print("  Achatando MultiIndex...")
+        df = df.set_axis(flatten_column_names(df.columns), axis=1)
+    
+    print(f"  Colunas: {list(df.columns)}")
+    
+    if not pd.api.types.is_datetime64_any_dtype(df['Date']):
+        df = df.assign(Date=pd.to_datetime(df['Date']))
+    
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    
+    # Ordenacao estavel pela data: cada particao vira uma fatia contigua da tabela
+    partition_keys = pc.strftime(table['Date'], format='%Y-%m-%d')
+    order = pc.sort_indices(partition_keys)
+    table = table.take(order)
+    partition_counts = pc.value_counts(partition_keys.take(order))
+    
+    profile = storage_profiles.get_profile(storage_profile or RAW_STORAGE_PROFILE)
+    print(f"  Particoes unicas: {len(partition_counts)}")
+    print(f"  Salvando em: {backend.uri(prefix)} (perfil {profile['name']})")
+    
+    uploads = []
+    written = []
+    offset = 0
+    for entry in partition_counts:
+        particao = entry['values'].as_py()
+        rows = entry['counts'].as_py()
+        
+        partition_table = table.slice(offset, rows)
+        uploads.append((join_key(prefix, particao, 'data.parquet'), storage_profiles.write_parquet_arrow(partition_table, profile)))
+        
+        tickers = []
+        if 'Ticker' in partition_table.column_names:
+            min_max = pc.min_max(partition_table['Ticker'])
+            tickers = [min_max['min'].as_py(), min_max['max'].as_py()]
+        written.append({'partition': particao, 'rows': rows, 'tickers': tickers})
+        offset += rows
+    
+    results = put_many(backend, uploads, max_workers=max_workers)
+    
+    for partition, result in zip(written, results):
+        partition['bytes'] = result['bytes']
+        print(f"    -> {partition['partition']}: {partition['rows']} registros, {result['bytes']:,} bytes")
+    
+    partition_index.update_index(backend, prefix, [
+        partition_index.index_entry(partition['partition'], f"{partition['partition']}/data.parquet",
+                    partition['rows'], partition['bytes'], tickers=partition.pop('tickers'))
+        for partition in written
+    ], bootstrap=partition_index.bootstrap_date_partitions)
+    
+    print(f"  [OK] {len(written)} particoes gravadas em {backend.uri(prefix)}")
+    return written
+
+
+def upload_to_s3(local_dir: str, bucket: str, s3_prefix: str, max_workers: int = DEFAULT_MAX_WORKERS):
     """
     Faz upload de um diretório local particionado para S3, mantendo a estrutura.
+    Os arquivos sao enviados em paralelo (object_store.put_many), com retries.
     
     Args:
         local_dir: Diretório local contendo os arquivos particionados
         bucket: Nome do bucket S3
         s3_prefix: Prefixo (caminho) no S3 (ex: 'raw')
+        max_workers: Numero maximo de uploads simultaneos
+    
+    Returns:
+        Lista de resultados do put_many ('key' e 'bytes' de cada arquivo)
     """
     try:
-        upload_count = 0
         local_path = Path(local_dir)
         
-        # Percorre todos os arquivos no diretório particionado
-        for file_path in local_path.rglob('*.parquet'):
-            # Calcula o caminho relativo para manter a estrutura de partições
-            relative_path = file_path.relative_to(local_path)
-            s3_key = f"{s3_prefix.strip('/')}/{relative_path.as_posix()}"
-            
-            print(f"  Uploading: {relative_path} -> s3://{bucket}/{s3_key}")
-            
-            with open(file_path, 'rb') as f:
-                s3_client.put_object(Bucket=bucket, Key=s3_key, Body=f.read())
-            
-            upload_count += 1
+        # Calcula o caminho relativo para manter a estrutura de partições
+        uploads = [
+            (join_key(s3_prefix, file_path.relative_to(local_path).as_posix()), file_path)
+            for file_path in sorted(local_path.rglob('*.parquet'))
+        ]
+        
+        for s3_key, file_path in uploads:
+            print(f"  Uploading: {file_path.relative_to(local_path)} -> s3://{bucket}/{s3_key}")
         
-        print(f"[OK] {upload_count} arquivos enviados para S3: s3://{bucket}/{s3_prefix}")
+        backend = S3Backend(bucket, client=get_s3_client())
+        results = put_many(backend, uploads, max_workers=max_workers)
+        
+        partition_index.update_index(backend, s3_prefix, [
+            partition_index.index_entry(file_path.parent.name, file_path.relative_to(local_path).as_posix(),
+                        pq.read_metadata(file_path).num_rows, result['bytes'])
+            for (_, file_path), result in zip(uploads, results)
+        ], bootstrap=partition_index.bootstrap_date_partitions)
+        
+        print(f"[OK] {len(results)} arquivos enviados para S3: s3://{bucket}/{s3_prefix}")
+        return results
         
     except Exception as e:
         print(f"[ERROR] Falha ao enviar para S3: {type(e).__name__}: {str(e)}")
         raise
 
+
+def probe_connectivity(timeout: float = 5) -> bool:
+    """Testa a conexao TCP com o Yahoo Finance (diagnostico; nao interrompe a extracao)."""
+    print("[INFO] Testando conectividade com Yahoo Finance...")
+    try:
+        socket.create_connection(("finance.yahoo.com", 443), timeout=timeout).close()
+        print("[OK] Conectividade OK\n")
+        return True
+    except Exception as e:
+        print(f"[WARN] Problema de conectividade: {e}\n")
+        return False
+
+
+def begin_invocation():
+    """Conta a invocacao; na primeira do ambiente (partida a frio) emite a metrica do init."""
+    global _invocations
+    _invocations += 1
+    if _invocations == 1:
+        emit({'duration_ms': INIT_MS, 'import_ms': round(sum(IMPORT_TIMINGS.values()), 1)},
+             {'component': 'extract', 'stage': 'init'},
+             {'fast_start': FAST_START, 'imports': dict(IMPORT_TIMINGS)})
+
+
+def startup_summary() -> dict:
+    """Partida da invocacao atual: modo, partida a frio, duracao do init e imports ja feitos."""
+    return {'fast_start': FAST_START, 'cold_start': _invocations == 1, 'init_ms': INIT_MS,
+            'import_ms': dict(IMPORT_TIMINGS)}
+
+
+def cache_summary() -> dict:
+    """Acertos/falhas do cache de downloads na invocacao atual (None se desativado)."""
+    if download_cache is None:
+        return None
+    summary = download_cache.summary()
+    print(f"[INFO] Cache de downloads: {summary['hits']} acertos, {summary['misses']} falhas ({summary['directory']})")
+    return summary
+
+
+def success_marker_key(prefix: str, start_date: str, end_date: str) -> str:
+    """Chave do marker _SUCCESS de uma gravacao do intervalo [start_date, end_date]."""
+    return join_key(prefix, SUCCESS_MARKER_DIR, f"{start_date}_{end_date}", '_SUCCESS')
+
+
+def month_chunks(start_date: str, end_date: str) -> list:
+    """
+    Divide o intervalo [start_date, end_date] (inclusivo) em pedacos por mes civil.
+
+    Returns:
+        Lista de tuplas (inicio, fim) no formato 'YYYY-MM-DD', em ordem
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d').date()
+    end = datetime.strptime(end_date, '%Y-%m-%d').date()
+    if start > end:
+        raise ValueError(f"Intervalo de backfill invalido: {start_date} > {end_date}")
+
+    chunks = []
+    while start <= end:
+        next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        chunks.append((start.isoformat(), min(end, next_month - timedelta(days=1)).isoformat()))
+        start = next_month
+    return chunks
+
+
+def backfill_checkpoint_key(prefix: str, start_date: str, end_date: str) -> str:
+    return join_key(prefix, BACKFILL_CHECKPOINT_DIR, f"{start_date}_{end_date}.json")
+
+
+def read_backfill_checkpoint(backend, key: str) -> dict:
+    """Checkpoint de um backfill ({'completed': {inicio do pedaco: resumo}}); vazio se nao existir."""
+    try:
+        return json.loads(backend.get(key))
+    except Exception:
+        return {}
+
+
+def run_backfill(backend, prefix: str, start_date: str, end_date: str, tickers: list = TICKERS_BLUE_CHIPS,
+                 raw_schema: str = 'yfinance', remaining_seconds=None, restart: bool = False,
+                 max_workers: int = BACKFILL_MAX_WORKERS, safety_seconds: float = BACKFILL_SAFETY_SECONDS,
+                 **download_kwargs) -> dict:
+    """
+    Baixa um intervalo historico em pedacos mensais e grava as particoes raw.
+
+    Os pedacos sao baixados em paralelo (max_workers) e cada um e gravado em lote
+    (write_partitions_direct) assim que termina. Depois de cada gravacao o
+    checkpoint (<prefix>/_backfill/<inicio>_<fim>.json) registra o pedaco como
+    concluido: uma nova execucao com o mesmo intervalo retoma dos pedacos que
+    faltam. Nenhum pedaco novo e iniciado quando o tempo restante fica abaixo de
+    safety_seconds. Pedacos com tickers em erro ou timeout sao gravados, mas nao
+    marcados como concluidos (serao baixados de novo).
+
+    Args:
+        backend: S3Backend ou LocalBackend (object_store)
+        prefix: Prefixo da camada raw
+        start_date: Data inicial no formato 'YYYY-MM-DD' (inclusiva)
+        end_date: Data final no formato 'YYYY-MM-DD' (inclusiva)
+        tickers: Lista de tickers
+        raw_schema: 'yfinance' ou 'canonical'
+        remaining_seconds: Funcao () -> segundos restantes (None: sem limite)
+        restart: Ignora o checkpoint e baixa o intervalo inteiro
+        max_workers: Pedacos baixados simultaneamente
+        safety_seconds: Folga minima para iniciar um novo pedaco
+        **download_kwargs: Opcoes repassadas para download_all_tickers
+
+    Returns:
+        Dict com 'chunks', 'completed', 'failed', 'pending', 'rows', 'partitions' e 'bytes'
+        ('complete' indica que todos os pedacos foram concluidos)
+    """
+    chunks = month_chunks(start_date, end_date)
+    checkpoint_key = backfill_checkpoint_key(prefix, start_date, end_date)
+    checkpoint = {} if restart else read_backfill_checkpoint(backend, checkpoint_key)
+    completed = checkpoint.get('completed', {})
+
+    queue = [chunk for chunk in chunks if chunk[0] not in completed]
+    print(f"  {len(chunks)} pedacos mensais, {len(chunks) - len(queue)} ja concluidos (checkpoint {backend.uri(checkpoint_key)})")
+
+    def has_time():
+        return remaining_seconds is None or remaining_seconds() > safety_seconds
+
+    def fetch(chunk):
+        # yfinance trata a data final como exclusiva
+        end = (datetime.strptime(chunk[1], '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        return download_all_tickers(tickers, chunk[0], end, **download_kwargs)
+
+    report = {'rows': 0, 'partitions': 0, 'bytes': 0, 'failed': []}
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    running = {}
+    while queue or running:
+        while queue and len(running) < max(1, max_workers) and has_time():
+            chunk = queue.pop(0)
+            running[executor.submit(fetch, chunk)] = chunk
+        if not running:
+            print(f"  [WARN] Tempo restante abaixo de {safety_seconds}s: {len(queue)} pedacos ficam para a proxima execucao")
+            break
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            chunk = running.pop(future)
+            print(f"\n[INFO] Pedaco {chunk[0]} a {chunk[1]}")
+            try:
+                df, tickers_report = future.result()
+                if raw_schema == 'canonical' and not df.empty:
+                    df = to_canonical_long(df)
+                written = write_partitions_direct(df, backend, prefix) if not df.empty else []
+            except Exception as e:
+                print(f"  [ERROR] Pedaco {chunk[0]} falhou: {type(e).__name__}: {str(e)}")
+                report['failed'].append({'chunk': list(chunk), 'error': f"{type(e).__name__}: {str(e)}"})
+                continue
+
+            summary = {'end': chunk[1], 'rows': len(df), 'partitions': len(written),
+                       'bytes': sum(partition['bytes'] for partition in written)}
+            for field in ['rows', 'partitions', 'bytes']:
+                report[field] += summary[field]
+
+            failed_tickers = sorted(ticker for ticker, result in tickers_report.items()
+                                    if result['status'] in {'error', 'timeout'})
+            if failed_tickers:
+                print(f"  [WARN] Pedaco {chunk[0]} incompleto (tickers com falha: {', '.join(failed_tickers)})")
+                report['failed'].append({'chunk': list(chunk), 'tickers': failed_tickers})
+                continue
+
+            completed[chunk[0]] = summary
+            body = json.dumps({'start_date': start_date, 'end_date': end_date,
+                               'completed': dict(sorted(completed.items()))}, indent=1).encode()
+            with_retries(lambda: backend.put(checkpoint_key, body))
+
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    failed = {tuple(entry['chunk']) for entry in report['failed']}
+    return {
+        **report,
+        'chunks': len(chunks),
+        'completed': sorted(completed),
+        'pending': [list(chunk) for chunk in chunks if chunk[0] not in completed and chunk not in failed],
+        'complete': len(completed) == len(chunks),
+    }
+
+
+def backfill_handler(event: dict, context, dry_run: bool, raw_schema: str) -> dict:
+    """
+    Executa um backfill: event['backfill'] = {'start_date', 'end_date', 'restart' (opcional)}.
+    O marker _SUCCESS (com o intervalo do backfill na chave, ver success_marker_key)
+    so e criado quando todos os pedacos foram concluidos: a transformacao reprocessa
+    apenas [start_date, end_date]. Uma resposta 206 indica que a Lambda deve ser
+    invocada de novo com o mesmo evento.
+    """
+    backfill = event['backfill']
+    start_date, end_date = backfill['start_date'], backfill['end_date']
+
+    print("=" * 60)
+    print(f"BACKFILL DE DADOS - BLUE CHIPS B3: {start_date} a {end_date}")
+    if dry_run:
+        print("[MODO TESTE - DRY RUN: NÃO VAI SALVAR NO S3]")
+    print("=" * 60)
+
+    bucket_name = os.environ.get('BUCKET_NAME', 'meu-bucket-raw')
+    if dry_run:
+        backend, prefix = LocalBackend('/tmp/raw_data'), ''
+    else:
+        backend, prefix = S3Backend(bucket_name, client=get_s3_client()), 'raw'
+
+    remaining_seconds = None
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        remaining_seconds = lambda: context.get_remaining_time_in_millis() / 1000
+
+    with stage_metrics('extract', 'backfill', {'raw_schema': raw_schema}) as metrics:
+        result = run_backfill(backend, prefix, start_date, end_date, raw_schema=raw_schema,
+                              remaining_seconds=remaining_seconds, restart=bool(backfill.get('restart')),
+                              cache=download_cache)
+        metrics.update(rows=result['rows'], partitions=result['partitions'], bytes=result['bytes'])
+
+    body = {'start_date': start_date, 'end_date': end_date, 'dry_run': dry_run,
+            **{field: result[field] for field in ['chunks', 'completed', 'pending', 'failed',
+                                                  'rows', 'partitions', 'bytes']},
+            'cache': cache_summary(), 'startup': startup_summary()}
+
+    if not result['complete']:
+        print(f"\n[WARN] Backfill parcial: {len(result['completed'])}/{result['chunks']} pedacos concluidos")
+        print("   -> Invoque a Lambda de novo com o mesmo evento para continuar")
+        return {'statusCode': 206, 'body': json.dumps({'message': 'Backfill parcial; reenvie o evento para continuar.',
+                                                       **body})}
+
+    if not dry_run:
+        success_key = success_marker_key(prefix, start_date, end_date)
+        with_retries(lambda: backend.put(success_key, b''))
+        print(f"[OK] Marker criado: {backend.uri(success_key)}")
+
+    print(f"\n[OK] BACKFILL CONCLUIDO: {result['rows']} registros em {result['partitions']} particoes")
+    return {'statusCode': 200, 'body': json.dumps({'message': 'Backfill concluido com sucesso', **body})}
+
+
 def lambda_handler(event, context):
     """
     Handler principal da Lambda Function.
@@ -185,6 +825,11 @@ def lambda_handler(event, context):
     Args:
         event: Evento da Lambda. Pode conter:
             - dry_run: bool - Se True, apenas testa extração sem salvar no S3
+            - write_mode: 'direct' (padrao, memoria -> S3) ou 'tmp' (legado, via /tmp)
+            - raw_schema: 'yfinance' (padrao) ou 'canonical' (longo: Date, Ticker, Open, ..., Volume)
+            - backfill: {'start_date', 'end_date', 'restart'} - Baixa um intervalo historico
+              em pedacos mensais, retomavel (ver backfill_handler)
+            - connectivity_probe: 'always', 'on_empty' ou 'off' (padrao: EXTRACT_CONNECTIVITY_PROBE)
         context: Contexto da Lambda
     
     Returns:
@@ -192,6 +837,17 @@ def lambda_handler(event, context):
     """
     # Verifica se é execução em modo teste (dry-run)
     dry_run = event.get('dry_run', False) if isinstance(event, dict) else False
+    write_mode = event.get('write_mode') if isinstance(event, dict) else None
+    write_mode = write_mode or os.environ.get('EXTRACT_WRITE_MODE', 'direct')
+    raw_schema = event.get('raw_schema') if isinstance(event, dict) else None
+    raw_schema = raw_schema or os.environ.get('EXTRACT_RAW_SCHEMA', 'yfinance')
+    
+    begin_invocation()
+    if download_cache is not None:
+        download_cache.reset_stats()
+    
+    if isinstance(event, dict) and event.get('backfill'):
+        return backfill_handler(event, context, dry_run, raw_schema)
     
     print("=" * 60)
     print("INICIANDO EXTRACAO DE DADOS - BLUE CHIPS B3")
@@ -213,17 +869,15 @@ def lambda_handler(event, context):
     bucket_name = os.environ.get('BUCKET_NAME', 'meu-bucket-raw')
     print(f"Bucket S3: {bucket_name}\n")
     
-    print("[INFO] Testando conectividade com Yahoo Finance...")
-    try:
-        import socket
-        socket.create_connection(("finance.yahoo.com", 443), timeout=5)
-        print("[OK] Conectividade OK\n")
-    except Exception as e:
-        print(f"[WARN] Problema de conectividade: {e}\n")
+    probe = (event.get('connectivity_probe') if isinstance(event, dict) else None) or CONNECTIVITY_PROBE
+    connectivity = probe_connectivity() if probe == 'always' else None
     
     try:
         print("[INFO] Iniciando download dos tickers...\n")
-        df = extract_all_tickers(TICKERS_BLUE_CHIPS, start_date_str, end_date_str)
+        with stage_metrics('extract', 'download') as metrics:
+            df, tickers_report = download_all_tickers(TICKERS_BLUE_CHIPS, start_date_str, end_date_str,
+                                                      cache=download_cache)
+            metrics.update(rows=len(df), tickers=sum(r['status'] == 'ok' for r in tickers_report.values()))
         
         if df.empty:
             print("\n[WARN] DIAGNOSTICO:")
@@ -234,6 +888,8 @@ def lambda_handler(event, context):
             print("     * Dia sem pregao (final de semana ou feriado)")
             print(f"     * Data solicitada: {start_date_str}")
             print(f"     * Tickers solicitados: {TICKERS_BLUE_CHIPS}")
+            if probe == 'on_empty':
+                connectivity = probe_connectivity()
             
             return {
                 'statusCode': 204,
@@ -241,18 +897,46 @@ def lambda_handler(event, context):
                     'message': 'Nenhum dado foi extraido.',
                     'reason': 'Dia sem dados disponíveis (possivel fim de semana, feriado ou problema de conectividade)',
                     'date': start_date_str,
-                    'tickers': TICKERS_BLUE_CHIPS
+                    'tickers': TICKERS_BLUE_CHIPS,
+                    'tickers_report': tickers_report,
+                    'connectivity': connectivity,
+                    'cache': cache_summary(),
+                    'startup': startup_summary()
                 })
             }
         
-        # Salva localmente em formato particionado
+        if raw_schema == 'canonical':
+            df = to_canonical_long(df)
+            print(f"[INFO] Schema canonico longo: {len(df)} registros")
+        
+        # Em dry_run (modo teste) os dados sao gravados apenas localmente
         output_dir = '/tmp/raw_data'
-        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        s3_prefix = "raw"
         
-        print("\n[INFO] Salvando dados em formato Parquet particionado...")
-        save_to_parquet_partitioned(df, output_dir)
+        with stage_metrics('extract', 'write', {'write_mode': write_mode, 'raw_schema': raw_schema}) as metrics:
+            if write_mode == 'tmp':
+                # Modo legado: grava em /tmp e depois envia os arquivos para o S3
+                Path(output_dir).mkdir(parents=True, exist_ok=True)
+                
+                print("\n[INFO] Salvando dados em formato Parquet particionado...")
+                save_to_parquet_partitioned(df, output_dir)
+                
+                written = []
+                if not dry_run:
+                    print(f"\n[INFO] Fazendo upload para S3: s3://{bucket_name}/{s3_prefix}")
+                    written = upload_to_s3(output_dir, bucket_name, s3_prefix)
+            else:
+                if dry_run:
+                    backend, prefix = LocalBackend(output_dir), ''
+                else:
+                    backend, prefix = S3Backend(bucket_name, client=get_s3_client()), s3_prefix
+                
+                print("\n[INFO] Gravando particoes Parquet direto da memoria...")
+                written = write_partitions_direct(df, backend, prefix)
+            
+            metrics.update(rows=len(df), partitions=len(written),
+                           bytes=sum(partition['bytes'] for partition in written))
         
-        # Pula upload se for dry_run (modo teste)
         if dry_run:
             print("\n[DRY RUN] Pulando upload para S3 (modo teste)")
             print(f"   Dados salvos localmente em: {output_dir}")
@@ -264,19 +948,16 @@ def lambda_handler(event, context):
                     'message': 'Extracao concluida com sucesso (DRY RUN - nao salvou no S3)',
                     'records': len(df),
                     'tickers': len(df['Ticker'].unique()),
+                    'tickers_report': tickers_report,
+                    'cache': cache_summary(),
+                    'startup': startup_summary(),
                     'dry_run': True
                 })
             }
         
-        # Upload para S3 (apenas em produção)
-        s3_prefix = "raw"
-        
-        print(f"\n[INFO] Fazendo upload para S3: s3://{bucket_name}/{s3_prefix}")
-        upload_to_s3(output_dir, bucket_name, s3_prefix)
-        
-        # Cria marker _SUCCESS para triggar a Lambda de transformação
-        success_key = f"{s3_prefix}/_SUCCESS"
-        s3_client.put_object(Bucket=bucket_name, Key=success_key, Body=b'')
+        # Cria marker _SUCCESS para triggar a Lambda de transformação (so o dia extraido e reprocessado)
+        success_key = success_marker_key(s3_prefix, start_date_str, end_date_str)
+        get_s3_client().put_object(Bucket=bucket_name, Key=success_key, Body=b'')
         print(f"[OK] Marker criado: s3://{bucket_name}/{success_key}")
         print("   -> Isso vai triggar a Lambda s3_trigger_glue_transform")
         
@@ -290,6 +971,9 @@ def lambda_handler(event, context):
                 'message': 'Extracao concluida com sucesso',
                 'records': len(df),
                 'tickers': len(df['Ticker'].unique()),
+                'tickers_report': tickers_report,
+                'cache': cache_summary(),
+                'startup': startup_summary(),
                 's3_path': f"s3://{bucket_name}/{s3_prefix}"
             })
         }
@@ -299,15 +983,26 @@ def lambda_handler(event, context):
         raise
 
 
+if not FAST_START:
+    # Modo padrao: dependencias e cliente S3 carregados no init da Lambda
+    for module in HEAVY_MODULES:
+        module.load()
+    get_s3_client()
+
+# Duracao do init (carga deste modulo), reportada na primeira invocacao
+INIT_MS = round((time.perf_counter() - INIT_STARTED) * 1000, 1)
+_invocations = 0
+
+
 if __name__ == "__main__":
-    # Execução local para testes - usa período maior para garantir dados
+    # Execução local para testes - backfill de 6 meses em modo dry_run (grava em /tmp/raw_data)
     os.environ['BUCKET_NAME'] = 'test-bucket'
     
     end_date = datetime.now() - timedelta(days=1)
-    start_date = end_date - timedelta(days=180)  # 6 meses para testes locais
+    start_date = end_date - timedelta(days=180)
     
-    df = extract_all_tickers(
-        TICKERS_BLUE_CHIPS, 
-        start_date.strftime('%Y-%m-%d'),
-        end_date.strftime('%Y-%m-%d')
-    )
\ No newline at end of file
+    response = lambda_handler({
+        'dry_run': True,
+        'backfill': {'start_date': start_date.strftime('%Y-%m-%d'), 'end_date': end_date.strftime('%Y-%m-%d')},
+    }, None)
+    print(response['body'])
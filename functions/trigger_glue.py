@@ -2,30 +2,66 @@
 """
 trigger_glue.py - Lambda para acionar job Glue
 Recebe eventos S3 e inicia o job de transformacao no AWS Glue.
+
+Todos os registros de uma notificacao S3 sao lidos e deduplicados por prefixo e
+data; o job e iniciado uma unica vez por prefixo com os argumentos unidos.
+Disparos de prefixos diferentes nunca sao unidos: cada prefixo tem a sua
+execucao, uma de cada vez, e os demais aguardam na fila.
+
+Disparos que chegam com o job em execucao (ou com ConcurrentRunsExceeded) nao
+sao descartados: cada um vira um objeto JSON pequeno na fila duravel do S3
+(<TRIGGER_QUEUE_PREFIX>/<job>/). A proxima execucao recebe todos os pendentes
+do mesmo prefixo coalescidos em um unico intervalo de datas. A fila e drenada
+pelo proximo disparo ou pelo evento de fim do job (EventBridge "Glue Job State
+Change").
 """
 import boto3
 import json
 import os
+import re
+import time
 import urllib.parse
+import uuid
 from botocore.exceptions import ClientError
 
+try:
+    from metrics import stage_metrics
+    from object_store import DATE_PARTITION_PATTERN, S3Backend, join_key, with_retries
+except ImportError:
+    # Execucao local: os modulos compartilhados ficam em src/ (no pacote da Lambda ficam ao lado)
+    import sys
+    from pathlib import Path
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+    from metrics import stage_metrics
+    from object_store import DATE_PARTITION_PATTERN, S3Backend, join_key, with_retries
+
 glue = boto3.client('glue')
+s3 = boto3.client('s3')
+
+# Fila de disparos pendentes (um objeto por disparo; sem read-modify-write, sem corrida entre invocacoes)
+TRIGGER_QUEUE_PREFIX = os.environ.get('TRIGGER_QUEUE_PREFIX', '_trigger_queue')
 
+ACTIVE_RUN_STATES = {'STARTING', 'RUNNING', 'STOPPING'}
 
-def _has_active_run(glue_job_name: str) -> bool:
+# Marker com intervalo gravado pelo extract: "raw/_success/2024-01-02_2024-01-02/_SUCCESS"
+DATE_RANGE_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2})_(\d{4}-\d{2}-\d{2})$')
+
+
+def _has_active_run(glue_job_name: str, client=None) -> bool:
     """
     Verifica se existe uma execucao ativa do job Glue.
-    
+
     Args:
         glue_job_name: Nome do job Glue
-    
+        client: Cliente Glue (padrao: cliente do modulo)
+
     Returns:
         True se houver execucao ativa, False caso contrario
     """
     try:
-        response = glue.get_job_runs(JobName=glue_job_name, MaxResults=10)
+        response = (client or glue).get_job_runs(JobName=glue_job_name, MaxResults=10)
         for job_run in response.get('JobRuns', []):
-            if job_run.get('JobRunState') in {'STARTING', 'RUNNING', 'STOPPING'}:
+            if job_run.get('JobRunState') in ACTIVE_RUN_STATES:
                 return True
         return False
     except ClientError as e:
@@ -36,71 +72,225 @@ def _has_active_run(glue_job_name: str) -> bool:
         raise
 
 
-def lambda_handler(event, context):
+def trigger_request(bucket: str, key: str = None, prefix: str = None, dates: list = None) -> dict:
+    """
+    Normaliza um disparo.
+
+    Um marker dentro de uma particao diaria (raw/2024-01-02/_SUCCESS) aponta para
+    a camada (raw/) e acrescenta a data da particao. Um marker com intervalo em um
+    diretorio de controle (raw/_success/2024-01-01_2024-06-30/_SUCCESS, gravado
+    pelo extract diario e pelo backfill) aponta para a camada e acrescenta o
+    inicio e o fim do intervalo.
+
+    Returns:
+        Dict {'bucket', 'prefix', 'dates'}; dates None processa o historico inteiro
+    """
+    if not prefix:
+        prefix = key.rsplit('/', 1)[0] + '/' if '/' in key else ''
+
+    # Marker dentro de uma particao diaria: "raw/2024-01-02/_SUCCESS" ou "raw/data=2024-01-02/_SUCCESS"
+    parts = prefix.rstrip('/').split('/')
+    match = DATE_PARTITION_PATTERN.match(parts[-1])
+    date_range = DATE_RANGE_PATTERN.match(parts[-1])
+    if match:
+        prefix = '/'.join(parts[:-1]) + '/' if len(parts) > 1 else ''
+        dates = list(dates or []) + [match.group(1)]
+    elif date_range and len(parts) > 1 and parts[-2].startswith('_'):
+        prefix = '/'.join(parts[:-2]) + '/' if len(parts) > 2 else ''
+        dates = list(dates or []) + [date_range.group(1), date_range.group(2)]
+
+    return {'bucket': bucket, 'prefix': prefix, 'dates': sorted(set(dates)) if dates else None}
+
+
+def parse_event(event):
+    """
+    Extrai os disparos do evento.
+
+    Returns:
+        Lista de disparos (trigger_request), um por registro S3 sem repeticao de
+        prefixo/datas; vazia para o evento de fim do job (so drena a fila); None
+        se o evento for invalido
+    """
+    if isinstance(event, dict) and event.get('source') == 'aws.glue':
+        return []
+
+    if isinstance(event, dict) and 'Records' in event and event['Records']:
+        # Uma notificacao pode trazer varios objetos (ex: markers diarios de um backfill)
+        requests = []
+        for record in event['Records']:
+            key = urllib.parse.unquote_plus(record['s3']['object']['key'], encoding='utf-8')
+            request = trigger_request(record['s3']['bucket']['name'], key=key)
+            if request not in requests:
+                requests.append(request)
+        return requests
+
+    if isinstance(event, dict) and event.get('bucket') and (event.get('key') or event.get('prefix')):
+        dates = event.get('dates') or [event[field] for field in ('start_date', 'end_date') if event.get(field)]
+        return [trigger_request(event['bucket'], key=event.get('key'), prefix=event.get('prefix'), dates=dates)]
+
+    return None
+
+
+def group_by_prefix(requests: list) -> dict:
+    """Agrupa disparos por (bucket, prefixo), na ordem de chegada do primeiro de cada grupo."""
+    groups = {}
+    for request in requests:
+        groups.setdefault((request['bucket'], request['prefix']), []).append(request)
+    return groups
+
+
+def coalesce(requests: list) -> dict:
+    """
+    Une disparos do mesmo bucket e prefixo em um so, com o intervalo de datas de todos.
+    Se algum disparo pedir o historico inteiro (dates None), o resultado tambem pede.
+
+    Raises:
+        ValueError: se os disparos forem de prefixos diferentes (use group_by_prefix;
+            um prefixo comum poderia virar a raiz do bucket)
+    """
+    if len(group_by_prefix(requests)) > 1:
+        raise ValueError(f"Disparos de prefixos diferentes: {sorted(group_by_prefix(requests))}")
+    dates = None
+    if all(request['dates'] for request in requests):
+        dates = sorted({day for request in requests for day in request['dates']})
+    return {
+        'bucket': requests[0]['bucket'],
+        'prefix': requests[0]['prefix'],
+        'dates': dates,
+    }
+
+
+def job_arguments(request: dict) -> dict:
+    """Argumentos do job Glue para um disparo (coalescido): intervalo START_DATE/END_DATE se houver datas."""
+    arguments = {
+        '--BUCKET_NAME': request['bucket'],
+        '--INPUT_PREFIX': request['prefix'],
+        '--additional-python-modules': 'polars,yfinance'
+    }
+    if request['dates']:
+        arguments['--START_DATE'] = request['dates'][0]
+        arguments['--END_DATE'] = request['dates'][-1]
+    return arguments
+
+
+def queue_prefix(glue_job_name: str) -> str:
+    return join_key(TRIGGER_QUEUE_PREFIX, glue_job_name) + '/'
+
+
+def enqueue(backend, glue_job_name: str, requests: list, reason: str) -> list:
+    """Grava cada disparo como um objeto da fila. Returns: chaves gravadas."""
+    keys = []
+    for request in requests:
+        key = join_key(queue_prefix(glue_job_name), f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.json")
+        body = json.dumps({**request, 'reason': reason, 'queued_at': int(time.time())}).encode()
+        with_retries(lambda: backend.put(key, body))
+        keys.append(key)
+    return keys
+
+
+def read_queue(backend, glue_job_name: str) -> dict:
+    """Disparos pendentes: {chave: disparo}, em ordem de chegada."""
+    pending = {}
+    for key in backend.list(queue_prefix(glue_job_name)):
+        if key.endswith('.json'):
+            pending[key] = json.loads(backend.get(key))
+    return pending
+
+
+def lambda_handler(event, context, glue_client=None, queue_backend=None):
     """
     Handler principal da Lambda Function.
     Processa evento S3 e inicia job Glue para transformacao de dados.
-    
+
     Args:
-        event: Evento S3 ou invocacao manual com bucket/key/prefix
+        event: Evento S3, invocacao manual com bucket/key/prefix (e opcionalmente
+            dates ou start_date/end_date) ou evento "Glue Job State Change" (drena a fila)
         context: Contexto da Lambda
-    
+        glue_client: Cliente Glue (testes: stub local)
+        queue_backend: Backend do object_store da fila (padrao: S3 em TRIGGER_QUEUE_BUCKET
+            ou no bucket do evento; testes: LocalBackend)
+
     Returns:
         Dict com statusCode e body contendo resultado da execucao
     """
     glue_job_name = os.environ.get('GLUE_JOB_NAME', 'transform_job')
+    glue_client = glue_client or glue
 
-    bucket = None
-    key = None
-    prefix = None
-
-    if isinstance(event, dict) and 'Records' in event and event['Records']:
-        bucket = event['Records'][0]['s3']['bucket']['name']
-        key = urllib.parse.unquote_plus(event['Records'][0]['s3']['object']['key'], encoding='utf-8')
-
-    elif isinstance(event, dict) and 'bucket' in event and ('key' in event or 'prefix' in event):
-        bucket = event['bucket']
-        key = event.get('key')
-        prefix = event.get('prefix')
-
-    if not bucket or (not key and not prefix):
+    requests = parse_event(event)
+    if requests is None:
         print('Evento inesperado (sem Records e sem bucket/key/prefix).')
         print(json.dumps(event))
         return {'statusCode': 400, 'body': 'Evento invalido: esperado S3 Records ou bucket/key/prefix.'}
 
-    if not prefix:
-        if not key:
-            return {'statusCode': 400, 'body': 'Evento invalido: key ausente.'}
-        if key.endswith('_SUCCESS'):
-            prefix = key.rsplit('/', 1)[0] + '/'
-        else:
-            prefix = key.rsplit('/', 1)[0] + '/'
-
-    print(f"Prefixo detectado: s3://{bucket}/{prefix}")
-    
-    try:
-        if _has_active_run(glue_job_name):
-            print(f"Glue Job '{glue_job_name}' ja esta em execucao. Ignorando novo disparo.")
-            return {'statusCode': 202, 'body': 'Job ja em execucao; trigger ignorado.'}
-
-        arguments = {
-            '--BUCKET_NAME': bucket,
-            '--INPUT_PREFIX': prefix,
-            '--additional-python-modules': 'polars,yfinance'
-        }
-        
-        response = glue.start_job_run(JobName=glue_job_name, Arguments=arguments)
-        print(f"Glue Job iniciado: {response['JobRunId']}")
-        return {'statusCode': 200, 'body': 'Job iniciado.'}
-        
-    except ClientError as e:
-        code = e.response.get('Error', {}).get('Code')
-        if code == 'ConcurrentRunsExceededException':
-            print(f"Concurrent runs exceeded para '{glue_job_name}'. Considerando OK (ja existe execucao em andamento).")
-            return {'statusCode': 202, 'body': 'Job ja em execucao; concorrencia excedida.'}
+    for request in requests:
+        print(f"Prefixo detectado: s3://{request['bucket']}/{request['prefix']} (datas: {request['dates'] or 'todas'})")
+    if len({request['bucket'] for request in requests}) > 1:
+        return {'statusCode': 400, 'body': 'Evento invalido: registros de buckets diferentes.'}
 
-        print(e)
-        raise
-    except Exception as e:
-        print(e)
-        raise
\ No newline at end of file
+    if queue_backend is None:
+        queue_bucket = os.environ.get('TRIGGER_QUEUE_BUCKET') or (requests[0]['bucket'] if requests else None)
+        if not queue_bucket:
+            print('Evento de fim do job sem TRIGGER_QUEUE_BUCKET configurado; nada a drenar.')
+            return {'statusCode': 200, 'body': 'Fila nao configurada.'}
+        queue_backend = S3Backend(queue_bucket, client=s3)
+
+    properties = {'job_name': glue_job_name, 'records': len(event['Records']) if 'Records' in event else 0}
+    with stage_metrics('trigger_glue', 'start_job', properties) as metrics:
+        metrics.update(jobs_started=0, triggers_queued=0, triggers_coalesced=0)
+        try:
+            # Os registros do evento viram um disparo por prefixo (um objeto na fila, se precisar)
+            batch = [coalesce(group) for group in group_by_prefix(requests).values()]
+            if _has_active_run(glue_job_name, glue_client):
+                enqueue(queue_backend, glue_job_name, batch, 'active_run')
+                metrics['triggers_queued'] = len(requests)
+                print(f"Glue Job '{glue_job_name}' ja esta em execucao. {len(requests)} disparo(s) na fila.")
+                return {'statusCode': 202, 'body': 'Job ja em execucao; trigger enfileirado.'}
+
+            queued = read_queue(queue_backend, glue_job_name)
+            if not queued and not batch:
+                print("Nenhum disparo pendente.")
+                return {'statusCode': 200, 'body': 'Nada pendente.'}
+
+            # Uma execucao por prefixo (max_concurrent_runs = 1): inicia o prefixo mais
+            # antigo; os demais ficam na fila para o proximo fim de job
+            groups = {}
+            for key, pending in [*queued.items(), *((None, request) for request in batch)]:
+                groups.setdefault((pending['bucket'], pending['prefix']), []).append((key, pending))
+            (selected, *deferred) = groups.values()
+
+            request = coalesce([pending for _, pending in selected])
+            properties['prefix'] = request['prefix']
+            if len(selected) > 1:
+                print(f"{len(selected)} disparo(s) coalescido(s) em {request['prefix']}: datas {request['dates'] or 'todas'}")
+
+            response = glue_client.start_job_run(JobName=glue_job_name, Arguments=job_arguments(request))
+            metrics.update(jobs_started=1, triggers_coalesced=len(selected))
+            print(f"Glue Job iniciado: {response['JobRunId']}")
+
+            # So remove o que foi lido: disparos enfileirados durante o start ficam para a proxima
+            for key, _ in selected:
+                if key:
+                    queue_backend.delete(key)
+
+            # Disparos novos de outros prefixos entram na fila; os ja enfileirados continuam la
+            waiting = [pending for group in deferred for key, pending in group if key is None]
+            enqueue(queue_backend, glue_job_name, waiting, 'other_prefix')
+            metrics['triggers_queued'] = len(waiting)
+            if deferred:
+                print(f"{len(deferred)} prefixo(s) aguardando a proxima execucao: "
+                      f"{[prefix for _, prefix in groups][1:]}")
+            return {'statusCode': 200, 'body': 'Job iniciado.'}
+
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code == 'ConcurrentRunsExceededException':
+                enqueue(queue_backend, glue_job_name, batch, 'concurrent_runs_exceeded')
+                metrics['triggers_queued'] = len(requests)
+                print(f"Concurrent runs exceeded para '{glue_job_name}'. {len(requests)} disparo(s) na fila.")
+                return {'statusCode': 202, 'body': 'Job ja em execucao; concorrencia excedida; trigger enfileirado.'}
+
+            print(e)
+            raise
+        except Exception as e:
+            print(e)
+            raise
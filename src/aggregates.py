@@ -0,0 +1,149 @@
+"""
+aggregates.py - Agregacao mensal incremental da camada agg
+Mantem estados parciais mesclaveis por acao/mes (contagens, somas, minimo e
+maximo) em agg_state/mes_referencia=YYYY-MM-01/. Um processamento diario soma
+apenas as novas linhas de data_pregao ao estado do mes, sem reler o mes inteiro.
+
+As somas de valores ja arredondados em 2 casas (fechamento, variacao, volatilidade)
+sao guardadas em centavos inteiros: a ordem das somas nao altera o resultado, e o
+agregado final e identico ao de uma reconstrucao completa.
+"""
+from io import BytesIO
+from datetime import date
+
+import polars as pl
+import polars.selectors as cs
+
+from object_store import open_store, join_key
+from partition_index import prune, read_index
+
+STATE_DIR = 'agg_state'
+STATE_PARTITION = 'mes_referencia'
+
+STATE_KEYS = ['nome_acao', 'mes_referencia']
+
+# Como cada coluna do estado e combinada ao mesclar dois estados do mesmo mes
+STATE_MERGE = {
+    'linhas': 'sum',
+    'dias': 'sum',
+    'soma_fechamento_centavos': 'sum',
+    'min_fechamento': 'min',
+    'max_fechamento': 'max',
+    'soma_volume': 'sum',
+    'soma_variacao_centavos': 'sum',
+    'soma_volatilidade_centavos': 'sum',
+    'ultima_data': 'max',
+}
+
+
+def to_cents(column: str) -> pl.Expr:
+    return (pl.col(column) * 100).round(0).cast(pl.Int64)
+
+
+def partial_states(lf_refined: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Calcula o estado parcial por acao/mes a partir de linhas refined.
+
+    Args:
+        lf_refined: LazyFrame com data_pregao, nome_acao, fechamento,
+            volume_negociado, variacao_pct_dia e volatilidade_7d
+
+    Returns:
+        LazyFrame com STATE_KEYS + colunas de STATE_MERGE
+    """
+    return lf_refined.group_by([
+        "nome_acao",
+        pl.col("data_pregao").dt.truncate("1mo").alias("mes_referencia"),
+    ]).agg([
+        pl.len().cast(pl.Int64).alias("linhas"),
+        pl.col("data_pregao").n_unique().cast(pl.Int64).alias("dias"),
+        to_cents("fechamento").sum().alias("soma_fechamento_centavos"),
+        pl.col("fechamento").min().alias("min_fechamento"),
+        pl.col("fechamento").max().alias("max_fechamento"),
+        pl.col("volume_negociado").sum().cast(pl.Int64).alias("soma_volume"),
+        to_cents("variacao_pct_dia").sum().alias("soma_variacao_centavos"),
+        to_cents("volatilidade_7d").sum().alias("soma_volatilidade_centavos"),
+        pl.col("data_pregao").max().alias("ultima_data"),
+    ])
+
+
+def merge_states(*states: pl.LazyFrame) -> pl.LazyFrame:
+    """Mescla estados parciais do mesmo mes (datas disjuntas) em um unico estado."""
+    aggregations = {
+        'sum': lambda col: pl.col(col).sum(),
+        'min': lambda col: pl.col(col).min(),
+        'max': lambda col: pl.col(col).max(),
+    }
+    return pl.concat(states, how='diagonal_relaxed').group_by(STATE_KEYS).agg([
+        aggregations[how](col).alias(col) for col, how in STATE_MERGE.items()
+    ])
+
+
+def finalize_states(states: pl.LazyFrame) -> pl.LazyFrame:
+    """Converte estados em linhas da camada agg (mesmas colunas e arredondamento)."""
+    linhas = pl.col("linhas")
+    return states.select([
+        "nome_acao",
+        "mes_referencia",
+        (pl.col("soma_fechamento_centavos") / linhas / 100).alias("preco_medio_mensal"),
+        pl.col("min_fechamento").alias("preco_minimo_mensal"),
+        pl.col("max_fechamento").alias("preco_maximo_mensal"),
+        pl.col("soma_volume").alias("volume_total_mensal"),
+        (pl.col("soma_volume") / linhas).alias("volume_medio_diario"),
+        (pl.col("soma_variacao_centavos") / linhas / 100).alias("variacao_media_diaria_pct"),
+        (pl.col("soma_volatilidade_centavos") / linhas / 100).alias("volatilidade_media_mensal"),
+        pl.col("dias").cast(pl.UInt32).alias("dias_negociacao"),
+    ]).sort(["nome_acao", "mes_referencia"]).with_columns(cs.float().round(2))
+
+
+def read_states(state_path: str, months: list) -> pl.DataFrame:
+    """
+    Le os estados gravados para os meses informados (pelo indice da camada,
+    quando existir, sem listar os prefixos de cada mes).
+
+    Args:
+        state_path: Caminho base dos estados (local ou S3), ex: s3://bucket/agg_state
+        months: Lista de datas (primeiro dia de cada mes)
+
+    Returns:
+        DataFrame com os estados encontrados (vazio se nenhum mes tiver estado)
+    """
+    backend, prefix = open_store(state_path)
+    entries = read_index(backend, prefix)
+    frames = []
+    for month in months:
+        partition = f"{STATE_PARTITION}={month.isoformat()}"
+        if entries is not None:
+            keys = [join_key(prefix, entry['path']) for entry in prune(entries, month, month)]
+        else:
+            keys = [key for key in backend.list(join_key(prefix, partition)) if key.endswith('.parquet')]
+        for key in keys:
+            frames.append(
+                pl.read_parquet(BytesIO(backend.get(key)))
+                .with_columns(pl.lit(month).alias("mes_referencia"))
+            )
+    if not frames:
+        return pl.DataFrame()
+    return pl.concat(frames, how='diagonal_relaxed')
+
+
+def can_fold(previous: pl.DataFrame, start: date, raw_dates) -> bool:
+    """
+    Indica se as linhas a partir de `start` podem ser somadas aos estados existentes:
+    - todos os estados terminam antes de `start` (datas disjuntas)
+    - so o mes de `start` tem estado (meses seguintes ainda nao foram processados)
+    - nenhuma particao raw entre o fim do estado e `start` ficou de fora
+
+    Args:
+        previous: Estados lidos com read_states
+        start: Primeira data a ser somada
+        raw_dates: Datas das particoes raw disponiveis
+    """
+    if previous.is_empty():
+        return False
+    last_folded = previous["ultima_data"].max()
+    return (
+        last_folded < start
+        and previous["mes_referencia"].unique().to_list() == [start.replace(day=1)]
+        and not any(last_folded < day < start for day in raw_dates)
+    )
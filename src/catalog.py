@@ -0,0 +1,367 @@
+"""
+catalog.py - Catalogacao das tabelas refined/agg no Glue Catalog
+Cria/atualiza as tabelas e registra apenas as particoes gravadas na execucao
+(ALTER TABLE ADD IF NOT EXISTS PARTITION via Athena, com fallback na API do Glue),
+em vez de MSCK REPAIR TABLE, que lista o prefixo inteiro a cada execucao.
+Opcionalmente configura partition projection: o Athena calcula as particoes a
+partir do template de location e nenhum registro e necessario.
+"""
+import os
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from object_store import DEFAULT_MAX_RETRIES, DEFAULT_BACKOFF_SECONDS
+
+PARQUET_STORAGE = {
+    'InputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat',
+    'OutputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat',
+    'SerdeInfo': {
+        'SerializationLibrary': 'org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe'
+    },
+}
+
+# Particoes por comando ALTER TABLE (limite de 256 KB por query no Athena)
+ATHENA_PARTITIONS_PER_QUERY = 500
+ATHENA_TIMEOUT_SECONDS = 60
+ATHENA_POLL_INITIAL_SECONDS = 0.25
+ATHENA_POLL_MAX_SECONDS = 4.0
+
+# Fallback na API do Glue: ate 100 particoes por batch_create_partition, lotes em paralelo
+GLUE_BATCH_SIZE = 100
+CATALOG_MAX_WORKERS = int(os.environ.get('CATALOG_MAX_WORKERS', '4'))
+
+# Intervalo de cada chave de particao quando a projecao esta habilitada
+PROJECTION_INTERVALS = {
+    'data_pregao': ('1', 'DAYS'),
+    'mes_referencia': ('1', 'MONTHS'),
+}
+PROJECTION_START = '2000-01-01'
+
+
+def projection_parameters(location: str, partition_key: str) -> dict:
+    """Parametros de partition projection (tipo date) para a chave de particao."""
+    interval, unit = PROJECTION_INTERVALS[partition_key]
+    return {
+        'projection.enabled': 'true',
+        f'projection.{partition_key}.type': 'date',
+        f'projection.{partition_key}.format': 'yyyy-MM-dd',
+        f'projection.{partition_key}.range': f'{PROJECTION_START},NOW',
+        f'projection.{partition_key}.interval': interval,
+        f'projection.{partition_key}.interval.unit': unit,
+        'storage.location.template': f"{location}/{partition_key}=${{{partition_key}}}/",
+    }
+
+
+def table_input(name: str, columns: list, location: str, partition_key: str,
+                projection: bool = False) -> dict:
+    """Monta o TableInput de uma tabela Parquet externa particionada por data."""
+    return {
+        'Name': name,
+        'StorageDescriptor': {
+            'Columns': columns,
+            'Location': location + '/',
+            **PARQUET_STORAGE,
+        },
+        'PartitionKeys': [
+            {'Name': partition_key, 'Type': 'string'}
+        ],
+        'TableType': 'EXTERNAL_TABLE',
+        'Parameters': {
+            'classification': 'parquet',
+            **(projection_parameters(location, partition_key) if projection else {}),
+        },
+    }
+
+
+def ensure_table(glue_client, database_name: str, table: dict):
+    """Cria a tabela; se ja existir, atualiza (e recria se a atualizacao falhar)."""
+    name = table['Name']
+    try:
+        glue_client.create_table(DatabaseName=database_name, TableInput=table)
+        print(f"[OK] Tabela '{name}' criada no database '{database_name}'")
+    except glue_client.exceptions.AlreadyExistsException:
+        try:
+            glue_client.update_table(DatabaseName=database_name, TableInput=table)
+            print(f"[OK] Tabela '{name}' atualizada no database '{database_name}'")
+        except Exception as update_error:
+            print(f"[WARN] Erro ao atualizar tabela: {update_error}")
+            print(f"[INFO] Deletando e recriando tabela '{name}'...")
+            glue_client.delete_table(DatabaseName=database_name, Name=name)
+            glue_client.create_table(DatabaseName=database_name, TableInput=table)
+            print(f"[OK] Tabela '{name}' recriada com sucesso")
+
+
+def partition_location(location: str, partition_key: str, value: str) -> str:
+    return f"{location}/{partition_key}={value}/"
+
+
+def add_partition_queries(database_name: str, table_name: str, location: str, partition_key: str,
+                          values: list, chunk_size: int = ATHENA_PARTITIONS_PER_QUERY) -> list:
+    """Monta os comandos ALTER TABLE ADD IF NOT EXISTS PARTITION para as particoes gravadas."""
+    queries = []
+    for i in range(0, len(values), chunk_size):
+        clauses = ' '.join(
+            f"PARTITION ({partition_key} = '{value}') "
+            f"LOCATION '{partition_location(location, partition_key, value)}'"
+            for value in values[i:i + chunk_size]
+        )
+        queries.append(f"ALTER TABLE {database_name}.{table_name} ADD IF NOT EXISTS {clauses}")
+    return queries
+
+
+def run_athena_queries(athena_client, queries: list, database_name: str, output_location: str,
+                       timeout: float = ATHENA_TIMEOUT_SECONDS,
+                       initial_delay: float = ATHENA_POLL_INITIAL_SECONDS,
+                       max_delay: float = ATHENA_POLL_MAX_SECONDS) -> list:
+    """
+    Submete todas as queries de uma vez e aguarda em conjunto, com backoff exponencial
+    entre as consultas de status (batch_get_query_execution, ate 50 ids por chamada).
+    O tempo total e limitado pela query mais lenta, nao pela soma.
+
+    Args:
+        athena_client: Cliente boto3 do Athena
+        queries: Lista de comandos SQL
+        database_name: Database de contexto
+        output_location: Local dos resultados (s3://...)
+        timeout: Tempo maximo de espera (todas as queries)
+        initial_delay: Primeira espera entre consultas de status
+        max_delay: Espera maxima entre consultas de status
+
+    Returns:
+        Lista (na ordem de `queries`) de dicts com 'query', 'query_id', 'state'
+        ('SUCCEEDED', 'FAILED', 'CANCELLED' ou 'TIMEOUT'), 'reason' e 'seconds'
+    """
+    started = time.monotonic()
+    results = []
+    for query in queries:
+        result = {'query': query, 'query_id': None, 'state': None, 'reason': None, 'seconds': None}
+        try:
+            response = athena_client.start_query_execution(
+                QueryString=query,
+                QueryExecutionContext={'Database': database_name},
+                ResultConfiguration={'OutputLocation': output_location}
+            )
+            result['query_id'] = response['QueryExecutionId']
+        except Exception as e:
+            result.update(state='FAILED', reason=f"{type(e).__name__}: {e}", seconds=0.0)
+        results.append(result)
+
+    pending = {r['query_id']: r for r in results if r['state'] is None}
+    delay = initial_delay
+
+    while pending:
+        elapsed = time.monotonic() - started
+        if elapsed >= timeout:
+            for result in pending.values():
+                result.update(state='TIMEOUT', reason=f"timeout após {timeout:.0f}s", seconds=round(elapsed, 3))
+            break
+
+        time.sleep(min(delay, max(0.0, timeout - elapsed)))
+        delay = min(delay * 2, max_delay)
+
+        ids = list(pending)
+        for i in range(0, len(ids), 50):
+            response = athena_client.batch_get_query_execution(QueryExecutionIds=ids[i:i + 50])
+            for execution in response.get('QueryExecutions', []):
+                status = execution['Status']
+                if status['State'] in ('SUCCEEDED', 'FAILED', 'CANCELLED'):
+                    result = pending.pop(execution['QueryExecutionId'])
+                    result.update(state=status['State'], reason=status.get('StateChangeReason'),
+                                  seconds=round(time.monotonic() - started, 3))
+
+    for result in results:
+        level = '[OK]' if result['state'] == 'SUCCEEDED' else '[WARN]'
+        detail = f" ({result['reason']})" if result['reason'] else ''
+        print(f"   {level} Query {result['query_id']}: {result['state']} em {result['seconds']}s{detail}")
+
+    return results
+
+
+def existing_partitions(glue_client, database_name: str, table_name: str) -> set:
+    """Valores de particao ja registrados na tabela (uma unica listagem paginada)."""
+    existing = set()
+    kwargs = {'DatabaseName': database_name, 'TableName': table_name, 'ExcludeColumnSchema': True}
+    while True:
+        response = glue_client.get_partitions(**kwargs)
+        existing.update(tuple(partition['Values']) for partition in response.get('Partitions', []))
+        if not response.get('NextToken'):
+            return existing
+        kwargs['NextToken'] = response['NextToken']
+
+
+def create_partition_batch(glue_client, database_name: str, table_name: str, inputs: list,
+                           max_retries: int = DEFAULT_MAX_RETRIES,
+                           backoff_seconds: float = DEFAULT_BACKOFF_SECONDS) -> dict:
+    """
+    Envia um lote ao batch_create_partition, reenviando apenas as entradas que falharam.
+
+    Returns:
+        Dict com 'created', 'existing' e 'failed' (lista de valores que nao foram registrados)
+    """
+    pending = inputs
+    result = {'created': 0, 'existing': 0, 'failed': []}
+
+    for attempt in range(max_retries + 1):
+        if attempt:
+            time.sleep(backoff_seconds * (2 ** (attempt - 1)) * (0.5 + random.random()))
+        try:
+            response = glue_client.batch_create_partition(
+                DatabaseName=database_name,
+                TableName=table_name,
+                PartitionInputList=pending,
+            )
+        except Exception as e:
+            print(f"[WARN] batch_create_partition falhou ({len(pending)} particoes): {e}")
+            continue
+
+        errors = {}
+        for error in response.get('Errors', []):
+            errors[tuple(error['PartitionValues'])] = error.get('ErrorDetail', {}).get('ErrorCode')
+
+        # Particao criada por outra execucao entre a listagem e o lote nao e erro
+        result['existing'] += sum(1 for code in errors.values() if code == 'AlreadyExistsException')
+        result['created'] += len(pending) - len(errors)
+        pending = [item for item in pending
+                   if errors.get(tuple(item['Values']), 'AlreadyExistsException') != 'AlreadyExistsException']
+        if not pending:
+            return result
+
+    result['failed'] = [item['Values'] for item in pending]
+    return result
+
+
+def create_partitions_glue(glue_client, database_name: str, table_name: str, columns: list,
+                           location: str, partition_key: str, values: list,
+                           batch_size: int = GLUE_BATCH_SIZE,
+                           max_workers: int = CATALOG_MAX_WORKERS,
+                           max_retries: int = DEFAULT_MAX_RETRIES,
+                           backoff_seconds: float = DEFAULT_BACKOFF_SECONDS) -> dict:
+    """
+    Registra as particoes direto na API do Glue (fallback quando o Athena falha):
+    ignora as ja existentes (get_partitions), envia lotes de ate 100 particoes
+    (limite do batch_create_partition) em paralelo e reenvia so as entradas com erro.
+
+    Returns:
+        Dict com 'created', 'skipped' e 'failed'
+    """
+    existing = existing_partitions(glue_client, database_name, table_name)
+    missing = [value for value in values if (value,) not in existing]
+
+    inputs = [
+        {
+            'Values': [value],
+            'StorageDescriptor': {
+                'Columns': columns,
+                'Location': partition_location(location, partition_key, value),
+                **PARQUET_STORAGE,
+            }
+        }
+        for value in missing
+    ]
+    batches = [inputs[i:i + batch_size] for i in range(0, len(inputs), batch_size)]
+
+    summary = {'created': 0, 'skipped': len(values) - len(missing), 'failed': []}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for result in executor.map(
+            lambda batch: create_partition_batch(glue_client, database_name, table_name, batch,
+                                                 max_retries, backoff_seconds),
+            batches
+        ):
+            summary['created'] += result['created']
+            summary['skipped'] += result['existing']
+            summary['failed'].extend(result['failed'])
+    return summary
+
+
+def register_partitions(glue_client, athena_client, database_name: str, tables: list,
+                        output_location: str) -> dict:
+    """
+    Registra apenas as particoes gravadas nesta execucao, para varias tabelas.
+    Os comandos ALTER TABLE de todas as tabelas rodam em paralelo no Athena; as
+    tabelas com alguma query sem sucesso caem no registro pela API do Glue.
+
+    Args:
+        tables: Lista de dicts com 'name', 'columns', 'location', 'partition_key' e 'values'
+
+    Returns:
+        Dict {tabela: {'partitions', 'method' ('athena'|'glue'|'none'), 'queries', 'glue'}}
+    """
+    report = {}
+    queries = []
+    for table in tables:
+        values = sorted(set(table['values']))
+        report[table['name']] = {'partitions': len(values), 'method': 'none', 'queries': [], 'glue': None}
+        if not values:
+            print(f"[INFO] Nenhuma particao nova para '{table['name']}'")
+            continue
+        print(f"[INFO] Registrando {len(values)} particao(oes) em '{table['name']}'...")
+        for query in add_partition_queries(database_name, table['name'], table['location'],
+                                           table['partition_key'], values):
+            queries.append((table['name'], query))
+
+    if not queries:
+        return report
+
+    try:
+        results = run_athena_queries(athena_client, [query for _, query in queries], database_name, output_location)
+    except Exception as e:
+        print(f"[WARN] Erro ao executar queries no Athena: {type(e).__name__}: {e}")
+        results = [{'query': query, 'query_id': None, 'state': 'FAILED', 'reason': str(e), 'seconds': None}
+                   for _, query in queries]
+
+    for (name, _), result in zip(queries, results):
+        report[name]['queries'].append({key: result[key] for key in ('query_id', 'state', 'reason', 'seconds')})
+
+    for table in tables:
+        entry = report[table['name']]
+        if not entry['queries']:
+            continue
+        if all(q['state'] == 'SUCCEEDED' for q in entry['queries']):
+            entry['method'] = 'athena'
+            print(f"[OK] {entry['partitions']} particao(oes) registradas em '{table['name']}'")
+            continue
+
+        print(f"[WARN] Registro via Athena incompleto para '{table['name']}'")
+        print("   Tentando registrar partições manualmente...")
+        entry['method'] = 'glue'
+        try:
+            summary = create_partitions_glue(glue_client, database_name, table['name'], table['columns'],
+                                             table['location'], table['partition_key'],
+                                             sorted(set(table['values'])))
+            entry['glue'] = summary
+            print(f"[OK] {summary['created']} partições registradas manualmente para tabela '{table['name']}' "
+                  f"({summary['skipped']} ja existentes)")
+            if summary['failed']:
+                print(f"[WARN] {len(summary['failed'])} partições nao registradas: {summary['failed'][:5]}")
+        except Exception as manual_error:
+            entry['glue'] = {'error': str(manual_error)}
+            print(f"[WARN] Erro no registro manual: {str(manual_error)}")
+
+    return report
+
+
+def catalog_tables(glue_client, athena_client, database_name: str, tables: list, output_location: str,
+                   projection: bool = False) -> dict:
+    """
+    Cria/atualiza as tabelas e registra as particoes gravadas de todas de uma vez.
+    Com partition projection habilitada o registro e dispensado.
+
+    Args:
+        tables: Lista de dicts com 'name', 'columns', 'location', 'partition_key' e 'values'
+
+    Returns:
+        Relatorio por tabela (ver register_partitions)
+    """
+    for table in tables:
+        ensure_table(glue_client, database_name,
+                     table_input(table['name'], table['columns'], table['location'],
+                                 table['partition_key'], projection))
+
+    if projection:
+        for table in tables:
+            print(f"[OK] Partition projection habilitada em '{table['name']}' (registro dispensado)")
+        return {table['name']: {'partitions': len(set(table['values'])), 'method': 'projection',
+                                'queries': [], 'glue': None} for table in tables}
+
+    return register_partitions(glue_client, athena_client, database_name, tables, output_location)
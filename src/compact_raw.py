@@ -0,0 +1,289 @@
+"""
+compact_raw.py - Compactacao da camada raw (problema de small files)
+Agrupa as particoes diarias raw/YYYY-MM-DD/ de meses (ou anos) ja fechados em
+um unico Parquet ordenado, com estatisticas por row group, e publica o novo
+layout de forma atomica via manifesto (raw/_compacted/_manifest.json).
+
+Ordem das operacoes (cada passo e seguro para leitores concorrentes):
+1. remove os arquivos substituidos pela execucao ANTERIOR
+2. grava o arquivo compactado com nome unico
+3. grava o manifesto (PUT unico -> troca atomica do layout), com os arquivos
+   substituidos agora em 'superseded'
+4. atualiza o indice da camada (raw/_index.parquet, ver partition_index.py)
+
+Os arquivos substituidos ficam no bucket ate a proxima compactacao (carencia de
+uma execucao, ~1 mes): um transform que resolveu os caminhos antes da troca
+continua lendo arquivos que existem. Um arquivo substituido que voltou ao indice
+(dia reextraido com a mesma chave) nao e removido.
+"""
+import os
+import sys
+import json
+import uuid
+from io import BytesIO
+from datetime import date, datetime, timezone
+
+import polars as pl
+
+from object_store import is_not_found, open_store, join_key
+from partition_index import (COMPACTED_DIR, COMPACTED_MANIFEST, bootstrap_date_partitions, compacted_entry,
+                             parse_partition_date, read_index, relative_key, update_index)
+
+DEFAULT_ROW_GROUP_SIZE = 128 * 1024
+
+
+def read_manifest(backend, prefix: str) -> dict:
+    """
+    Le o manifesto de compactacao da camada raw.
+
+    Returns:
+        Dict {'periods': {periodo: entrada}}; vazio se ainda nao houver compactacao
+
+    Raises:
+        Erros de leitura que nao sejam de objeto inexistente: um manifesto vazio
+        por engano faria a proxima gravacao descartar todos os periodos
+    """
+    try:
+        return json.loads(backend.get(join_key(prefix, COMPACTED_DIR, COMPACTED_MANIFEST)))
+    except Exception as e:
+        if is_not_found(e):
+            return {'periods': {}}
+        raise
+
+
+def write_manifest(backend, prefix: str, manifest: dict):
+    """Publica o manifesto (troca atomica do layout compactado)."""
+    manifest['updated_at'] = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    body = json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8')
+    backend.put(join_key(prefix, COMPACTED_DIR, COMPACTED_MANIFEST), body)
+
+
+def compacted_partitions(input_path: str) -> dict:
+    """
+    Mapeia cada data coberta pela compactacao para o arquivo compactado.
+
+    Args:
+        input_path: Caminho base dos dados raw (local ou S3)
+
+    Returns:
+        Dict {data: caminho completo do arquivo compactado}
+    """
+    backend, prefix = open_store(input_path)
+    manifest = read_manifest(backend, prefix)
+
+    partitions = {}
+    for entry in manifest.get('periods', {}).values():
+        uri = backend.uri(join_key(prefix, entry['path']))
+        for day in entry['dates']:
+            partitions[datetime.strptime(day, '%Y-%m-%d').date()] = uri
+    return partitions
+
+
+def superseded_partitions(input_path: str) -> set:
+    """
+    Particoes diarias com arquivos ja substituidos pela compactacao e ainda nao
+    removidos (carencia). Leitores que listam o bucket devem ignora-las.
+    """
+    backend, prefix = open_store(input_path)
+    return {key.split('/')[0] for key in read_manifest(backend, prefix).get('superseded', [])
+            if not key.startswith(f"{COMPACTED_DIR}/")}
+
+
+def list_daily_files(backend, prefix: str) -> dict:
+    """
+    Lista os arquivos das particoes diarias (fora de _compacted/).
+
+    Returns:
+        Dict {data: [chaves dos arquivos parquet]}
+    """
+    daily = {}
+    for key in backend.list(prefix):
+        relative = key[len(prefix):].lstrip('/') if prefix else key
+        parts = relative.split('/')
+        if len(parts) != 2 or not parts[1].endswith('.parquet'):
+            continue
+        day = parse_partition_date(parts[0])
+        if day:
+            daily.setdefault(day, []).append(key)
+    return daily
+
+
+def period_of(day: date, granularity: str) -> str:
+    """Periodo de compactacao de uma data: 'YYYY-MM' (month) ou 'YYYY' (year)."""
+    return day.strftime('%Y-%m') if granularity == 'month' else day.strftime('%Y')
+
+
+def read_raw_file(backend, key: str) -> pl.DataFrame:
+    """
+    Le um arquivo raw com Date normalizado para pl.Date.
+    Date pode vir com ou sem timezone (download vs history): sem a conversao o
+    concat de um mes com as duas variantes falha; a data local e o que o transform usa.
+    """
+    df = pl.read_parquet(BytesIO(backend.get(key)))
+    if 'Date' in df.columns:
+        df = df.with_columns(pl.col('Date').cast(pl.Date, strict=False))
+    return df
+
+
+def compact_period(backend, prefix: str, period: str, files_by_date: dict, previous: dict = None,
+                   row_group_size: int = DEFAULT_ROW_GROUP_SIZE) -> dict:
+    """
+    Le as particoes diarias de um periodo e grava um unico Parquet ordenado.
+
+    Args:
+        backend: Backend do object_store
+        prefix: Prefixo da camada raw
+        period: Periodo ('YYYY-MM' ou 'YYYY')
+        files_by_date: Dict {data: [chaves]} das particoes diarias a incluir
+        previous: Entrada anterior do manifesto, se o periodo ja foi compactado
+        row_group_size: Linhas por row group do arquivo compactado
+
+    Returns:
+        Entrada do manifesto para o periodo
+    """
+    frames = [
+        read_raw_file(backend, key)
+        for day in sorted(files_by_date)
+        for key in files_by_date[day]
+    ]
+    dates = set(files_by_date)
+
+    if previous:
+        # Datas que voltaram como particao diaria substituem as do arquivo anterior
+        df_previous = read_raw_file(backend, join_key(prefix, previous['path']))
+        df_previous = df_previous.filter(~pl.col('Date').is_in(sorted(files_by_date)))
+        frames.insert(0, df_previous)
+        dates.update(datetime.strptime(day, '%Y-%m-%d').date() for day in previous['dates'])
+
+    # Historico pode misturar schemas (wide/long, colunas extras do fallback do yfinance)
+    df = pl.concat(frames, how='diagonal_relaxed')
+
+    sort_columns = [col for col in ['Ticker', 'Date'] if col in df.columns]
+    if sort_columns:
+        df = df.sort(sort_columns)
+
+    buffer = BytesIO()
+    df.write_parquet(buffer, statistics=True, row_group_size=row_group_size)
+    body = buffer.getvalue()
+
+    path = join_key(COMPACTED_DIR, f"period={period}", f"data-{uuid.uuid4().hex[:12]}.parquet")
+    backend.put(join_key(prefix, path), body)
+
+    entry = {
+        'path': path,
+        'dates': [day.isoformat() for day in sorted(dates)],
+        'rows': len(df),
+        'bytes': len(body),
+        'source_files': sum(len(keys) for keys in files_by_date.values()),
+    }
+    if 'Ticker' in df.columns:
+        entry['min_ticker'], entry['max_ticker'] = df['Ticker'].min(), df['Ticker'].max()
+    return entry
+
+
+def compact_raw(input_path: str, granularity: str = 'month', today: date = None,
+                delete_daily: bool = True, row_group_size: int = DEFAULT_ROW_GROUP_SIZE) -> dict:
+    """
+    Compacta os periodos fechados (anteriores ao periodo atual) da camada raw.
+    Periodos ja compactados sao recompactados apenas se receberam novas particoes diarias.
+
+    Args:
+        input_path: Caminho base dos dados raw (local ou S3)
+        granularity: 'month' ou 'year'
+        today: Data de referencia para definir o periodo aberto (padrao: hoje)
+        delete_daily: Remove as particoes diarias substituidas (na execucao seguinte)
+        row_group_size: Linhas por row group dos arquivos compactados
+
+    Returns:
+        Resumo com periodos compactados, arquivos de origem e removidos
+    """
+    if granularity not in ('month', 'year'):
+        raise ValueError(f"Granularidade invalida: {granularity}")
+
+    backend, prefix = open_store(input_path)
+    manifest = read_manifest(backend, prefix)
+    manifest.setdefault('periods', {})
+    current_period = period_of(today or date.today(), granularity)
+
+    # Carencia: so sai o que a execucao anterior substituiu. Sem indice nao da para
+    # saber se uma chave voltou a ser usada, entao nada e removido.
+    superseded = manifest.get('superseded', [])
+    entries = read_index(backend, prefix)
+    live = {entry['path'] for entry in entries} if entries is not None else set(superseded)
+    expired = [key for key in superseded if key not in live]
+    deleted = 0
+    if delete_daily and expired:
+        for key in expired:
+            backend.delete(join_key(prefix, key))
+        deleted = len(expired)
+        print(f"[OK] {deleted} arquivos substituidos na compactacao anterior removidos")
+    pending = [] if delete_daily else expired
+
+    daily = list_daily_files(backend, prefix)
+    by_period = {}
+    for day, keys in daily.items():
+        period = period_of(day, granularity)
+        keys = [key for key in keys if relative_key(prefix, key) not in pending]
+        if period < current_period and keys:
+            by_period.setdefault(period, {})[day] = keys
+
+    if not by_period:
+        if superseded != pending:
+            manifest['superseded'] = pending
+            write_manifest(backend, prefix, manifest)
+        print("[INFO] Nenhum periodo fechado com particoes diarias para compactar")
+        return {'periods': [], 'source_files': 0, 'deleted_files': deleted}
+
+    print(f"[INFO] Compactando {len(by_period)} periodo(s) em {input_path}")
+
+    replaced = []
+    summary = {'periods': [], 'source_files': 0, 'deleted_files': deleted}
+
+    for period in sorted(by_period):
+        previous = manifest['periods'].get(period)
+        if previous:
+            replaced.append(join_key(prefix, previous['path']))
+
+        entry = compact_period(backend, prefix, period, by_period[period], previous, row_group_size)
+        manifest['periods'][period] = entry
+        summary['periods'].append(period)
+        summary['source_files'] += entry['source_files']
+        print(f"  -> {period}: {entry['source_files']} arquivos -> {entry['rows']:,} registros, "
+              f"{entry['bytes']:,} bytes ({entry['path']})")
+
+    replaced_keys = [relative_key(prefix, key) for key in replaced + [
+        key for files_by_date in by_period.values() for keys in files_by_date.values() for key in keys
+    ]]
+    if delete_daily:
+        manifest['superseded'] = sorted(set(pending + replaced_keys))
+    write_manifest(backend, prefix, manifest)
+    print(f"[OK] Manifesto publicado: {backend.uri(join_key(prefix, COMPACTED_DIR, COMPACTED_MANIFEST))}")
+
+    # O indice deixa de apontar para os substituidos; eles so saem na proxima execucao
+    update_index(
+        backend, prefix,
+        [compacted_entry(period, manifest['periods'][period]) for period in summary['periods']],
+        replaced_keys,
+        bootstrap=bootstrap_date_partitions,
+    )
+    if delete_daily:
+        print(f"[INFO] {len(replaced_keys)} arquivos substituidos ficam ate a proxima compactacao")
+
+    return summary
+
+
+if __name__ == "__main__":
+    try:
+        from awsglue.utils import getResolvedOptions
+        present = [opt for opt in ['GRANULARITY', 'KEEP_DAILY'] if f'--{opt}' in sys.argv]
+        args = getResolvedOptions(sys.argv, ['BUCKET_NAME', 'INPUT_PREFIX'] + present)
+        base_path = f"s3://{args['BUCKET_NAME']}/{args['INPUT_PREFIX']}"
+    except ImportError:
+        args = {key: os.environ[key] for key in ['GRANULARITY', 'KEEP_DAILY'] if os.environ.get(key)}
+        base_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('INPUT_PREFIX', 'raw/')
+
+    compact_raw(
+        base_path,
+        granularity=args.get('GRANULARITY', 'month'),
+        delete_daily=args.get('KEEP_DAILY', 'false').lower() != 'true',
+    )
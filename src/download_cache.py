@@ -0,0 +1,148 @@
+"""
+download_cache.py - Cache em disco das respostas do yfinance (extract.py)
+Cada resposta e guardada como um Parquet ZSTD, com chave por ticker, intervalo
+e periodo pedido. Retentativas, reexecucoes e backfills do mesmo periodo leem
+o arquivo em vez de baixar de novo.
+
+O diretorio e configuravel: na Lambda o padrao e /tmp (reaproveitado enquanto o
+ambiente de execucao fica quente); localmente pode ser qualquer diretorio. As
+entradas expiram apos o TTL e as mais antigas sao removidas quando o diretorio
+passa do tamanho maximo. Respostas vazias nao sao guardadas (D-1 ainda sem dados
+precisa ser baixado de novo).
+
+pandas e pyarrow sao importados no primeiro get/put: criar o cache nao pesa na
+partida da Lambda de extracao.
+"""
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = '/tmp/yfinance-cache'
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Colunas MultiIndex do yfinance (ex: ('Close', 'ITUB4.SA')) ficam nos metadados do arquivo
+COLUMNS_METADATA_KEY = b'download_cache.columns'
+
+
+class DownloadCache:
+    """Cache de DataFrames do yfinance em um diretorio local, com contadores de acertos."""
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+    def count(self, stat: str, value: int = 1):
+        with self.lock:
+            self.stats[stat] += value
+
+    def path(self, ticker: str, interval: str, start_date: str, end_date: str) -> Path:
+        safe_ticker = re.sub(r'[^A-Za-z0-9._^=-]', '_', ticker)
+        return self.directory / f"{safe_ticker}_{interval}_{start_date}_{end_date}.parquet"
+
+    def expired(self, path: Path, now: float = None) -> bool:
+        return (now or time.time()) - path.stat().st_mtime > self.ttl_seconds
+
+    def get(self, ticker: str, interval: str, start_date: str, end_date: str):
+        """DataFrame guardado para a chave, ou None (ausente, expirado ou ilegivel)."""
+        import pandas as pd
+        import pyarrow.parquet as pq
+
+        path = self.path(ticker, interval, start_date, end_date)
+        try:
+            if self.expired(path):
+                path.unlink(missing_ok=True)
+                self.count('evictions')
+                raise FileNotFoundError(path)
+            table = pq.read_table(path)
+        except Exception:
+            self.count('misses')
+            return None
+
+        df = table.to_pandas()
+        columns = (table.schema.metadata or {}).get(COLUMNS_METADATA_KEY)
+        if columns:
+            df.columns = pd.MultiIndex.from_tuples([tuple(col) for col in json.loads(columns)])
+        self.count('hits')
+        return df
+
+    def put(self, ticker: str, interval: str, start_date: str, end_date: str, df):
+        """Guarda o DataFrame (ignorado se vazio) e aplica o limite de tamanho."""
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if df is None or df.empty:
+            return
+        metadata = {}
+        if isinstance(df.columns, pd.MultiIndex):
+            metadata[COLUMNS_METADATA_KEY] = json.dumps([list(col) for col in df.columns]).encode()
+            df = df.set_axis([str(i) for i in range(len(df.columns))], axis=1)
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+
+        # Escrita atomica: arquivo temporario + rename (downloads paralelos nao veem arquivo pela metade)
+        path = self.path(ticker, interval, start_date, end_date)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        pq.write_table(table, tmp_file, compression='zstd')
+        os.replace(tmp_file, path)
+        self.count('writes')
+        self.evict()
+
+    def evict(self):
+        """Remove entradas expiradas e, acima de max_bytes, as mais antigas."""
+        now = time.time()
+        entries = []
+        for path in self.directory.glob('*.parquet'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.ttl_seconds:
+                path.unlink(missing_ok=True)
+                self.count('evictions')
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            self.count('evictions')
+
+    def summary(self) -> dict:
+        return {**self.stats, 'directory': self.directory.as_posix()}
+
+
+def open_cache(environ: dict = os.environ):
+    """
+    Cria o cache a partir das variaveis de ambiente.
+
+    DOWNLOAD_CACHE_DIR (padrao /tmp/yfinance-cache; 'off' desativa),
+    DOWNLOAD_CACHE_TTL_SECONDS (padrao 86400) e DOWNLOAD_CACHE_MAX_MB (padrao 256).
+
+    Returns:
+        DownloadCache ou None se desativado
+    """
+    directory = environ.get('DOWNLOAD_CACHE_DIR', DEFAULT_CACHE_DIR)
+    if directory.lower() in {'', 'off', 'false', 'none'}:
+        return None
+    return DownloadCache(
+        directory,
+        ttl_seconds=float(environ.get('DOWNLOAD_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS)),
+        max_bytes=int(float(environ.get('DOWNLOAD_CACHE_MAX_MB', DEFAULT_MAX_BYTES / 1024 / 1024)) * 1024 * 1024),
+    )
@@ -0,0 +1,125 @@
+"""
+features.py - Registro declarativo das features temporais da camada refined
+As janelas moveis e os lags sao configurados como dados (FEATURES) e calculados
+a partir de intermediarios compartilhados: o agrupamento por ticker e feito uma
+unica vez (posicao na serie + somas acumuladas de x e x^2) e cada janela vira uma
+diferenca de somas acumuladas, com custo O(1) por linha independente do tamanho.
+
+As somas sao inteiras (valores em milionesimos), portanto exatas: cada janela
+depende so dos seus valores, e nao do inicio da serie lida. Uma execucao com
+PROCESS_DATE (aquecimento curto) publica os mesmos valores arredondados que a
+reconstrucao completa, inclusive nos empates do round(2).
+"""
+import polars as pl
+
+# Tipos suportados: 'mean' e 'std' (janela em pregoes, ddof=1) e 'lag' (pregoes anteriores)
+FEATURES = [
+    {'name': 'media_movel_7d', 'kind': 'mean', 'window': 7},
+    {'name': 'media_movel_14d', 'kind': 'mean', 'window': 14},
+    {'name': 'media_movel_30d', 'kind': 'mean', 'window': 30},
+    {'name': 'volatilidade_7d', 'kind': 'std', 'window': 7},
+    {'name': 'lag_1d', 'kind': 'lag', 'periods': 1},
+    {'name': 'lag_2d', 'kind': 'lag', 'periods': 2},
+    {'name': 'lag_3d', 'kind': 'lag', 'periods': 3},
+]
+
+FEATURE_KINDS = ('mean', 'std', 'lag')
+
+# Escala das somas inteiras: precos com ate 6 casas sao representados sem erro
+SUM_SCALE = 1_000_000
+
+
+def validate_features(features: list):
+    """Valida o registro de features (nomes unicos, tipos e tamanhos de janela)."""
+    names = [feature['name'] for feature in features]
+    if len(names) != len(set(names)):
+        raise ValueError(f"Features com nome duplicado: {names}")
+
+    for feature in features:
+        kind = feature.get('kind')
+        if kind not in FEATURE_KINDS:
+            raise ValueError(f"Tipo de feature invalido em {feature['name']}: {kind}")
+        size = feature.get('periods' if kind == 'lag' else 'window')
+        minimum = 2 if kind == 'std' else 1
+        if not isinstance(size, int) or size < minimum:
+            raise ValueError(f"Janela invalida em {feature['name']}: {size}")
+
+
+def required_history(features: list = FEATURES) -> int:
+    """Pregoes anteriores necessarios para que todas as features estejam completas."""
+    return max((feature.get('window') or feature.get('periods') for feature in features), default=0)
+
+
+def add_features(lf: pl.LazyFrame, features: list = FEATURES, value: str = 'Close',
+                 partition: str = 'Ticker') -> pl.LazyFrame:
+    """
+    Adiciona as features do registro ao LazyFrame.
+
+    O LazyFrame deve estar ordenado por `partition` e data. As somas acumuladas sao
+    inteiras (Int64 para x, Int128 para x^2), logo a soma de cada janela e exata;
+    as janelas usam shift global, valido porque so sao emitidas quando toda a janela
+    pertence ao mesmo ticker (posicao >= janela - 1), como no rolling do Polars.
+
+    Args:
+        lf: LazyFrame ordenado por ticker e data
+        features: Registro de features (ver FEATURES)
+        value: Coluna de origem das features
+        partition: Coluna que identifica a serie (ticker)
+
+    Returns:
+        LazyFrame com uma coluna Float64 por feature (nula ate a janela completar)
+    """
+    validate_features(features)
+
+    windows = [feature for feature in features if feature['kind'] in ('mean', 'std')]
+    needs_squares = any(feature['kind'] == 'std' for feature in features)
+
+    # Intermediarios compartilhados: um unico agrupamento por ticker
+    intermediates = [
+        pl.int_range(pl.len()).over(partition).alias('_pos'),
+    ]
+    if windows:
+        scaled = (pl.col(value).cast(pl.Float64) * SUM_SCALE).round().cast(pl.Int64)
+        intermediates.append(scaled.cum_sum().over(partition).alias('_s1'))
+        if needs_squares:
+            squared = scaled.cast(pl.Int128) * scaled.cast(pl.Int128)
+            intermediates.append(squared.cum_sum().over(partition).alias('_s2'))
+
+    position = pl.col('_pos')
+
+    def window_sum(column: str, window: int) -> pl.Expr:
+        previous = pl.when(position >= window).then(pl.col(column).shift(window)).otherwise(0)
+        return pl.col(column) - previous
+
+    def window_divisor(window: int, scale: int) -> pl.Expr:
+        # Divisor como expressao, nao literal: o Polars troca a divisao por um literal
+        # pela multiplicacao pelo inverso, que nao e corretamente arredondada
+        return pl.min_horizontal(position + 1, window).cast(pl.Float64) * scale
+
+    expressions = []
+    for feature in features:
+        kind = feature['kind']
+
+        if kind == 'lag':
+            periods = feature['periods']
+            expr = pl.col(value).shift(periods).cast(pl.Float64)
+            complete = position >= periods
+        else:
+            window = feature['window']
+            s1 = window_sum('_s1', window)
+            if kind == 'mean':
+                expr = s1.cast(pl.Float64) / window_divisor(window, SUM_SCALE)
+            else:
+                s1 = s1.cast(pl.Int128)
+                numerator = window * window_sum('_s2', window) - s1 * s1
+                variance = numerator.cast(pl.Float64) / window_divisor(window, (window - 1) * SUM_SCALE ** 2)
+                expr = variance.clip(lower_bound=0.0).sqrt()
+            complete = position >= window - 1
+
+        expressions.append(pl.when(complete).then(expr).otherwise(None).alias(feature['name']))
+
+    return (
+        lf.with_columns(intermediates)
+        .with_columns(expressions)
+        .drop(['_pos', '_s1', '_s2'], strict=False)
+    )
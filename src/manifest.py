@@ -0,0 +1,86 @@
+"""
+manifest.py - Manifesto de conteudo das particoes de uma camada (refined, agg, agg_state)
+Guarda, em <camada>/_manifest.json, o hash SHA-256 do Parquet serializado, as
+linhas e os bytes de cada particao. Na gravacao, so as particoes cujo conteudo
+mudou sao enviadas; as que sumiram do intervalo reprocessado sao removidas.
+
+A serializacao do Polars e deterministica (mesmos dados -> mesmos bytes), entao
+um reprocessamento sem mudanca nos dados nao gera nenhum PUT de particao.
+"""
+import hashlib
+import json
+
+from object_store import is_not_found, join_key, with_retries
+
+MANIFEST_FILE = '_manifest.json'
+MANIFEST_VERSION = 1
+
+
+def content_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+def read_manifest(backend, prefix: str):
+    """
+    Le o manifesto da camada ({particao: {'sha256', 'rows', 'bytes'}}) com um GET.
+
+    Returns:
+        Dict de particoes; None se a camada nao tiver manifesto (ou se ele tiver
+        versao desconhecida): quem grava volta a listar a camada e regrava tudo
+    """
+    key = join_key(prefix, MANIFEST_FILE)
+    try:
+        manifest = json.loads(backend.get(key))
+    except Exception as e:
+        if is_not_found(e):
+            return None
+        raise
+    if manifest.get('version') != MANIFEST_VERSION:
+        print(f"  [WARN] Manifesto com versao desconhecida em {backend.uri(key)}; regravando tudo")
+        return None
+    return manifest['partitions']
+
+
+def write_manifest(backend, prefix: str, partitions: dict):
+    body = json.dumps({'version': MANIFEST_VERSION, 'partitions': dict(sorted(partitions.items()))},
+                      indent=1).encode()
+    with_retries(lambda: backend.put(join_key(prefix, MANIFEST_FILE), body))
+
+
+def partition_value(partition: str) -> str:
+    """'data_pregao=2024-01-02' -> '2024-01-02'."""
+    return partition.split('=', 1)[1]
+
+
+def plan_sync(manifest: dict, partitions: dict, existing_keys: set, prefix: str, prune=None) -> dict:
+    """
+    Decide o que gravar, pular e remover.
+
+    Args:
+        manifest: Manifesto atual (read_manifest)
+        partitions: {particao: {'sha256', 'rows', 'bytes'}} do conteudo novo
+        existing_keys: Chaves presentes na camada, ao menos as das particoes com
+            hash igual ao do manifesto (particoes apagadas fora do pipeline sao
+            regravadas mesmo com hash igual)
+        prefix: Prefixo da camada
+        prune: None (nao remove nada), 'all' (remove as particoes do manifesto
+            ausentes do conteudo novo) ou (inicio, fim) para remover so as do intervalo
+
+    Returns:
+        Dict com listas 'write', 'skip' e 'delete' de particoes
+    """
+    write, skip = [], []
+    for partition, entry in partitions.items():
+        unchanged = manifest.get(partition, {}).get('sha256') == entry['sha256']
+        present = join_key(prefix, partition, 'data.parquet') in existing_keys
+        (skip if unchanged and present else write).append(partition)
+
+    delete = []
+    if prune is not None:
+        for partition in manifest:
+            if partition in partitions:
+                continue
+            if prune == 'all' or str(prune[0]) <= partition_value(partition) <= str(prune[1]):
+                delete.append(partition)
+
+    return {'write': write, 'skip': skip, 'delete': sorted(delete)}
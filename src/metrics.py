@@ -0,0 +1,164 @@
+"""
+metrics.py - Metricas por estagio em CloudWatch Embedded Metric Format (EMF)
+Cada estagio medido gera uma linha JSON no stdout com duracao, pico de memoria
+(RSS, quando a plataforma permite medir) e contagens (linhas, particoes, bytes).
+Na Lambda o CloudWatch Logs extrai as metricas dessas linhas automaticamente; no
+Glue isso nao acontece (o log do job nao e processado como EMF): as linhas
+continuam consultaveis como JSON (Logs Insights, jq) e viram metricas apenas com
+um metric filter no log group do job.
+
+Uso:
+    with stage_metrics('transform', 'write_refined') as metrics:
+        written = save_partitioned_by_date(...)
+        metrics.update(rows=df.height, partitions=len(written), bytes=...)
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Windows: sem getrusage; o pico de RSS nao e medido (ver current_rss_mb)
+    resource = None
+
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'B3Pipeline')
+
+# Unidades aceitas pelo CloudWatch para cada metrica conhecida (as demais vao como 'None')
+UNITS = {
+    'duration_ms': 'Milliseconds',
+    'import_ms': 'Milliseconds',
+    'peak_rss_mb': 'Megabytes',
+    'rows': 'Count',
+    'partitions': 'Count',
+    'partitions_skipped': 'Count',
+    'partitions_deleted': 'Count',
+    'bytes': 'Bytes',
+    'tickers': 'Count',
+    'jobs_started': 'Count',
+    'triggers_queued': 'Count',
+    'triggers_coalesced': 'Count',
+}
+
+
+def metrics_enabled() -> bool:
+    return os.environ.get('EMIT_METRICS', 'true').lower() not in ('0', 'false', 'no')
+
+
+def current_rss_mb():
+    """
+    RSS atual do processo (Linux: /proc/self/statm; demais: pico via getrusage).
+    None quando nenhum dos dois esta disponivel (Windows).
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+class PeakRssSampler:
+    """
+    Amostra o RSS em uma thread enquanto o bloco executa e guarda o pico.
+    Inclui a memoria alocada fora do Python (Polars/Arrow), que o tracemalloc nao ve.
+    Sem medicao de RSS na plataforma, nao amostra nada e peak_mb fica None.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_mb = current_rss_mb()
+        self._thread = None
+        if self.peak_mb is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = round(max(self.peak_mb, current_rss_mb()), 1)
+
+
+def emf_record(values: dict, dimensions: dict, properties: dict = None, namespace: str = None,
+               timestamp_ms: int = None) -> dict:
+    """
+    Monta um registro EMF.
+
+    Args:
+        values: Metricas {nome: valor numerico}
+        dimensions: Dimensoes {nome: valor}, ex.: {'component': 'transform', 'stage': 'read'}
+        properties: Campos extras (nao viram metricas), ex.: run_id
+        namespace: Namespace no CloudWatch (padrao: METRICS_NAMESPACE ou B3Pipeline)
+        timestamp_ms: Epoch em milissegundos (padrao: agora)
+    """
+    return {
+        '_aws': {
+            'Timestamp': timestamp_ms if timestamp_ms is not None else int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace or NAMESPACE,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': UNITS.get(name, 'None')} for name in values],
+            }],
+        },
+        **(properties or {}),
+        **{key: str(value) for key, value in dimensions.items()},
+        **values,
+    }
+
+
+def emit(values: dict, dimensions: dict, properties: dict = None, stream=None) -> dict:
+    """Escreve o registro EMF como uma linha JSON (stdout por padrao) e o devolve."""
+    record = emf_record(values, dimensions, properties)
+    if metrics_enabled():
+        print(json.dumps(record, default=str), file=stream or sys.stdout, flush=True)
+    return record
+
+
+@contextmanager
+def stage_metrics(component: str, stage: str, properties: dict = None, stream=None):
+    """
+    Mede duracao e pico de RSS do bloco e emite um registro EMF ao final.
+
+    O dict devolvido recebe as contagens do estagio (rows, partitions, bytes ou
+    qualquer outra metrica numerica); o registro e emitido mesmo se o bloco falhar,
+    com a propriedade status='error'.
+
+    Args:
+        component: Componente do pipeline (transform, extract, trigger_glue)
+        stage: Nome do estagio
+        properties: Campos extras do registro (ex.: run_id, bucket)
+        stream: Destino das linhas (padrao: stdout)
+    """
+    values = {}
+    status = 'ok'
+    started = time.perf_counter()
+    sampler = PeakRssSampler(interval=0.05)
+    try:
+        with sampler:
+            yield values
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        values['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        if sampler.peak_mb is not None:
+            values['peak_rss_mb'] = sampler.peak_mb
+        emit(values, {'component': component, 'stage': stage}, {**(properties or {}), 'status': status}, stream)
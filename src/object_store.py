@@ -0,0 +1,307 @@
+"""
+object_store.py - Camada de I/O compartilhada entre extract.py e transform.py
+Grava objetos em S3 ou no sistema de arquivos local usando um pool de threads
+com largura configuravel, retries com backoff exponencial e multipart upload
+para objetos grandes.
+
+Objetos com varios escritores (ex: _index.parquet) usam escrita condicional:
+get_versioned devolve o conteudo e a versao lida (ETag no S3) e put_if so grava
+se o objeto ainda estiver nessa versao, senao levanta PreconditionFailed.
+"""
+import hashlib
+import os
+import re
+import time
+import random
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_MAX_WORKERS = int(os.environ.get('IO_MAX_WORKERS', '8'))
+DEFAULT_MAX_RETRIES = int(os.environ.get('IO_MAX_RETRIES', '3'))
+DEFAULT_BACKOFF_SECONDS = 0.5
+
+# Objetos acima do limite usam multipart upload (partes minimas de 5 MiB no S3)
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Particao de data: "YYYY-MM-DD" (extract.py) ou "coluna=YYYY-MM-DD" (Hive).
+# Fica aqui porque este e o unico modulo presente nas duas Lambdas e nos jobs Glue.
+DATE_PARTITION_PATTERN = re.compile(r'^(?:[^=/]+=)?(\d{4}-\d{2}-\d{2})$')
+
+
+class PreconditionFailed(Exception):
+    """Escrita condicional recusada: o objeto mudou (ou passou a existir) desde a leitura."""
+
+
+def is_not_found(error: Exception) -> bool:
+    """
+    True se a leitura falhou porque o objeto nao existe (FileNotFoundError no local,
+    NoSuchKey/404 no S3). Throttling, AccessDenied etc. nao contam como ausencia.
+    """
+    if isinstance(error, FileNotFoundError):
+        return True
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+    return code in {'NoSuchKey', 'NotFound', '404'}
+
+
+class LocalBackend:
+    """Backend de sistema de arquivos local (desenvolvimento, testes e benchmarks)."""
+
+    # Escritas condicionais sao serializadas entre as threads do processo
+    _conditional_lock = threading.Lock()
+
+    def __init__(self, base_path: str):
+        self.base_path = Path(base_path)
+
+    def uri(self, key: str) -> str:
+        return (self.base_path / key).as_posix()
+
+    def put(self, key: str, body: bytes):
+        target = self.base_path / key
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        # Escrita atomica: grava em arquivo temporario e renomeia (nome unico por
+        # processo e thread: put_many pode gravar a mesma chave em paralelo)
+        tmp_file = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_file.write_bytes(body)
+        os.replace(tmp_file, target)
+
+    def get(self, key: str) -> bytes:
+        return (self.base_path / key).read_bytes()
+
+    def get_versioned(self, key: str):
+        """Tupla (conteudo, versao); a versao e o hash do conteudo."""
+        body = self.get(key)
+        return body, hashlib.md5(body).hexdigest()
+
+    def exists(self, key: str) -> bool:
+        return (self.base_path / key).is_file()
+
+    def put_if(self, key: str, body: bytes, version: str = None):
+        """Grava se o objeto ainda estiver em `version` (None: se ainda nao existir)."""
+        with self._conditional_lock:
+            try:
+                _, current = self.get_versioned(key)
+            except FileNotFoundError:
+                current = None
+            if current != version:
+                raise PreconditionFailed(self.uri(key))
+            self.put(key, body)
+
+    def list(self, prefix: str = '') -> list:
+        root = self.base_path / prefix
+        if not root.exists():
+            return []
+        return sorted(
+            path.relative_to(self.base_path).as_posix()
+            for path in root.rglob('*') if path.is_file()
+        )
+
+    def delete(self, key: str):
+        target = self.base_path / key
+        target.unlink(missing_ok=True)
+
+        # Remove diretorios de particao vazios (equivalente a prefixo sem objetos no S3)
+        parent = target.parent
+        while parent != self.base_path and self.base_path in parent.parents and not any(parent.iterdir()):
+            parent.rmdir()
+            parent = parent.parent
+
+
+class S3Backend:
+    """Backend S3 via boto3, com multipart upload para objetos grandes."""
+
+    def __init__(self, bucket: str, client=None,
+                 multipart_threshold: int = MULTIPART_THRESHOLD,
+                 chunk_size: int = MULTIPART_CHUNK_SIZE):
+        if client is None:
+            import boto3
+            client = boto3.client('s3')
+        self.bucket = bucket
+        self.client = client
+        self.multipart_threshold = multipart_threshold
+        self.chunk_size = chunk_size
+
+    def uri(self, key: str) -> str:
+        return f"s3://{self.bucket}/{key}"
+
+    def put(self, key: str, body: bytes):
+        if len(body) <= self.multipart_threshold:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=body)
+            return
+
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)['UploadId']
+        try:
+            parts = []
+            for part_number, offset in enumerate(range(0, len(body), self.chunk_size), start=1):
+                response = self.client.upload_part(
+                    Bucket=self.bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=body[offset:offset + self.chunk_size],
+                )
+                parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts},
+            )
+        except Exception:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+    def get(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def get_versioned(self, key: str):
+        """Tupla (conteudo, ETag)."""
+        response = self.client.get_object(Bucket=self.bucket, Key=key)
+        return response['Body'].read(), response['ETag']
+
+    def exists(self, key: str) -> bool:
+        """HEAD do objeto: False so se ele nao existir (outros erros sobem)."""
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except Exception as e:
+            if is_not_found(e):
+                return False
+            raise
+
+    def supports_conditional_put(self) -> bool:
+        """False se o botocore instalado for anterior as escritas condicionais do S3 (sem IfMatch)."""
+        try:
+            members = self.client.meta.service_model.operation_model('PutObject').input_shape.members
+        except AttributeError:
+            return True
+        return 'IfMatch' in members
+
+    def put_if(self, key: str, body: bytes, version: str = None):
+        """
+        PUT condicional: IfMatch com o ETag lido ou, para objeto novo, IfNoneMatch='*'.
+        Sem suporte no botocore instalado a escrita e incondicional (com aviso).
+        """
+        if not self.supports_conditional_put():
+            print(f"  [WARN] botocore sem escrita condicional; {self.uri(key)} gravado sem checar a versao")
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=body)
+            return
+
+        condition = {'IfMatch': version} if version else {'IfNoneMatch': '*'}
+        try:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=body, **condition)
+        except Exception as e:
+            code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+            if code in {'PreconditionFailed', 'ConditionalRequestConflict'}:
+                raise PreconditionFailed(self.uri(key)) from e
+            raise
+
+    def list(self, prefix: str = '') -> list:
+        keys = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(obj['Key'] for obj in page.get('Contents', []))
+        return sorted(keys)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+def open_store(base_uri: str, client=None):
+    """
+    Cria o backend adequado para um caminho base.
+
+    Args:
+        base_uri: 's3://bucket/prefixo' ou caminho local
+        client: Cliente S3 opcional (reutilizado entre chamadas)
+
+    Returns:
+        Tupla (backend, prefixo) onde as chaves devem ser gravadas
+    """
+    if base_uri.startswith('s3://'):
+        bucket = base_uri.replace('s3://', '').split('/')[0]
+        prefix = '/'.join(base_uri.replace('s3://', '').split('/')[1:]).strip('/')
+        return S3Backend(bucket, client=client), prefix
+    return LocalBackend(base_uri), ''
+
+
+def join_key(prefix: str, *parts: str) -> str:
+    """Monta uma chave 'prefixo/parte1/parte2' ignorando prefixo vazio."""
+    return '/'.join(p.strip('/') for p in (prefix, *parts) if p and p.strip('/'))
+
+
+def with_retries(func, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_seconds: float = DEFAULT_BACKOFF_SECONDS):
+    """
+    Executa `func` com retries e backoff exponencial com jitter.
+
+    Returns:
+        Tupla (resultado, tentativas)
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return func(), attempt
+        except Exception:
+            if attempt > max_retries:
+                raise
+            time.sleep(backoff_seconds * (2 ** (attempt - 1)) * (0.5 + random.random()))
+
+
+def existing_keys(backend, keys, max_workers: int = DEFAULT_MAX_WORKERS) -> set:
+    """Quais das chaves existem, com um HEAD por chave em paralelo (sem LIST do prefixo)."""
+    keys = list(keys)
+    if not keys:
+        return set()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        found = executor.map(lambda key: with_retries(lambda: backend.exists(key))[0], keys)
+        return {key for key, present in zip(keys, found) if present}
+
+
+def put_many(backend, items, max_workers: int = DEFAULT_MAX_WORKERS,
+             max_retries: int = DEFAULT_MAX_RETRIES,
+             backoff_seconds: float = DEFAULT_BACKOFF_SECONDS) -> list:
+    """
+    Grava varios objetos em paralelo com um pool de threads de largura limitada.
+
+    Args:
+        backend: LocalBackend, S3Backend ou objeto com o mesmo metodo put(key, body)
+        items: Iteravel de (chave, conteudo); conteudo pode ser bytes ou Path local
+        max_workers: Numero maximo de uploads simultaneos
+        max_retries: Retries por objeto antes de falhar
+        backoff_seconds: Espera base do backoff exponencial
+
+    Returns:
+        Lista de dicts com 'key', 'bytes' e 'attempts', na ordem de `items`
+
+    Raises:
+        A primeira excecao de um objeto que falhou apos todos os retries
+        (os demais uploads em andamento sao concluidos antes)
+    """
+    items = list(items)
+
+    def upload(key, body):
+        if isinstance(body, Path):
+            body = body.read_bytes()
+        _, attempts = with_retries(lambda: backend.put(key, body), max_retries, backoff_seconds)
+        return {'key': key, 'bytes': len(body), 'attempts': attempts}
+
+    results = [None] * len(items)
+    errors = []
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(upload, key, body): i for i, (key, body) in enumerate(items)}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                errors.append(e)
+
+    if errors:
+        raise errors[0]
+
+    return results
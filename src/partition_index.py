@@ -0,0 +1,265 @@
+"""
+partition_index.py - Indice de particoes por camada (<camada>/_index.parquet)
+Lista cada arquivo de dados da camada com particao, caminho, linhas, bytes e
+minimo/maximo das colunas-chave (data e ticker). Os leitores consultam o indice
+com um unico GET em vez de listar o bucket (LIST cresce com o numero de prefixos).
+
+Os escritores gravam os dados primeiro e o indice por ultimo, em um PUT unico
+(no local: arquivo temporario + rename): o indice funciona como o commit da
+escrita, e leitores nunca veem uma particao pela metade. Quando a camada ainda
+nao tem indice, o primeiro escritor o cria a partir de uma listagem completa.
+
+Escritores concorrentes (extract diario, backfill, compactacao) atualizam o
+indice com PUT condicional (ETag lido): se outro escritor gravou no meio, a
+alteracao e reaplicada sobre o indice novo em vez de sobrescreve-lo.
+
+Usa apenas pyarrow (disponivel na Lambda de extracao e no Glue).
+"""
+import json
+import random
+import time
+from io import BytesIO
+from datetime import date, datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from object_store import DATE_PARTITION_PATTERN, PreconditionFailed, is_not_found, join_key, with_retries
+
+INDEX_FILE = '_index.parquet'
+
+# Tentativas de update_index quando outro escritor altera o indice entre a leitura e o PUT
+INDEX_UPDATE_ATTEMPTS = 8
+
+INDEX_SCHEMA = pa.schema([
+    ('partition', pa.string()),
+    ('path', pa.string()),
+    ('rows', pa.int64()),
+    ('bytes', pa.int64()),
+    ('min_date', pa.date32()),
+    ('max_date', pa.date32()),
+    ('min_ticker', pa.string()),
+    ('max_ticker', pa.string()),
+    ('dates', pa.list_(pa.date32())),
+])
+
+# Layout compactado da camada raw (ver compact_raw.py)
+COMPACTED_DIR = '_compacted'
+COMPACTED_MANIFEST = '_manifest.json'
+
+
+def parse_partition_date(partition: str):
+    """'2024-01-02' ou 'data_pregao=2024-01-02' -> date; None se nao for particao de data."""
+    match = DATE_PARTITION_PATTERN.match(partition)
+    return datetime.strptime(match.group(1), '%Y-%m-%d').date() if match else None
+
+
+def index_entry(partition: str, path: str, rows: int = None, size: int = None, dates: list = None,
+                tickers: list = None) -> dict:
+    """
+    Monta uma linha do indice.
+
+    Args:
+        partition: Nome da particao (ex: '2024-01-02', 'data_pregao=2024-01-02', 'period=2024-01')
+        path: Chave do arquivo relativa a camada
+        rows: Linhas do arquivo (None se desconhecido)
+        size: Bytes do arquivo (None se desconhecido)
+        dates: Datas cobertas pelo arquivo (padrao: a data da particao)
+        tickers: Tickers presentes (ou apenas o minimo e o maximo)
+    """
+    if dates is None:
+        day = parse_partition_date(partition)
+        dates = [day] if day else []
+    dates = sorted(set(dates))
+    tickers = sorted(ticker for ticker in tickers or [] if ticker is not None)
+    return {
+        'partition': partition,
+        'path': path,
+        'rows': rows,
+        'bytes': size,
+        'min_date': dates[0] if dates else None,
+        'max_date': dates[-1] if dates else None,
+        'min_ticker': tickers[0] if tickers else None,
+        'max_ticker': tickers[-1] if tickers else None,
+        'dates': dates,
+    }
+
+
+def read_index(backend, prefix: str):
+    """
+    Le o indice da camada.
+
+    Returns:
+        Lista de entradas (dicts de INDEX_SCHEMA) ou None se a camada nao tiver indice
+    """
+    return read_index_versioned(backend, prefix)[0]
+
+
+def read_index_versioned(backend, prefix: str):
+    """
+    Le o indice da camada e a versao lida (para o PUT condicional).
+
+    Returns:
+        Tupla (entradas ou None, versao ou None) - None se a camada nao tiver indice
+
+    Raises:
+        Erros de leitura que nao sejam de objeto inexistente (throttling, AccessDenied)
+    """
+    try:
+        body, version = backend.get_versioned(join_key(prefix, INDEX_FILE))
+    except Exception as e:
+        # So a ausencia do indice vira None; outros erros nao podem parecer "sem indice"
+        if is_not_found(e):
+            return None, None
+        raise
+    return pq.read_table(BytesIO(body)).to_pylist(), version
+
+
+def serialize_index(entries: list) -> bytes:
+    entries = sorted(entries, key=lambda entry: (entry['partition'], entry['path']))
+    table = pa.Table.from_pylist(entries, schema=INDEX_SCHEMA)
+    buffer = BytesIO()
+    pq.write_table(table, buffer, compression='zstd')
+    return buffer.getvalue()
+
+
+def write_index(backend, prefix: str, entries: list):
+    """Grava o indice completo em um unico PUT (ordenado por particao e caminho)."""
+    body = serialize_index(entries)
+    with_retries(lambda: backend.put(join_key(prefix, INDEX_FILE), body))
+
+
+def update_index(backend, prefix: str, upserts: list = (), removed_paths=(), bootstrap=None,
+                 max_attempts: int = INDEX_UPDATE_ATTEMPTS) -> list:
+    """
+    Aplica alteracoes ao indice e o regrava com PUT condicional.
+
+    Se outro escritor regravar o indice entre a leitura e o PUT, o indice e lido
+    de novo e as mesmas alteracoes sao reaplicadas (ate max_attempts vezes): as
+    particoes do outro escritor nao se perdem.
+
+    Args:
+        backend: Backend do object_store
+        prefix: Prefixo da camada
+        upserts: Entradas novas ou alteradas (substituem as de mesmo caminho)
+        removed_paths: Caminhos removidos da camada
+        bootstrap: Funcao (backend, prefix) -> entradas, usada quando o indice ainda
+            nao existe (ex: bootstrap_date_partitions); sem ela o indice comeca vazio
+        max_attempts: Leituras/gravacoes antes de desistir com PreconditionFailed
+
+    Returns:
+        Entradas gravadas
+    """
+    key = join_key(prefix, INDEX_FILE)
+    replaced = {entry['path'] for entry in upserts} | set(removed_paths)
+
+    for attempt in range(1, max_attempts + 1):
+        current, version = read_index_versioned(backend, prefix)
+        if current is None:
+            current = bootstrap(backend, prefix) if bootstrap else []
+
+        entries = [entry for entry in current if entry['path'] not in replaced] + list(upserts)
+        body = serialize_index(entries)
+
+        def conditional_put():
+            try:
+                backend.put_if(key, body, version)
+                return True
+            except PreconditionFailed:
+                return False
+
+        committed, _ = with_retries(conditional_put)
+        if committed:
+            return entries
+        if attempt == max_attempts:
+            raise PreconditionFailed(backend.uri(key))
+        print(f"  [WARN] {backend.uri(key)} alterado por outro escritor; reaplicando ({attempt}/{max_attempts})")
+        time.sleep(0.05 * attempt * (0.5 + random.random()))
+
+
+def relative_key(prefix: str, key: str) -> str:
+    return key[len(prefix):].lstrip('/') if prefix else key
+
+
+def bootstrap_date_partitions(backend, prefix: str) -> list:
+    """
+    Cria as entradas do indice listando a camada (uma unica vez, na criacao do indice).
+    Inclui as particoes de data (<particao>/<arquivo>.parquet) e os arquivos do
+    layout compactado da camada raw (_compacted/_manifest.json). Linhas e bytes
+    das particoes listadas ficam desconhecidos (nulos).
+    """
+    entries = []
+    for key in backend.list(prefix):
+        parts = relative_key(prefix, key).split('/')
+        if len(parts) == 2 and parts[1].endswith('.parquet') and parse_partition_date(parts[0]):
+            entries.append(index_entry(parts[0], '/'.join(parts)))
+
+    try:
+        compacted = json.loads(backend.get(join_key(prefix, COMPACTED_DIR, COMPACTED_MANIFEST)))
+    except Exception as e:
+        if not is_not_found(e):
+            raise
+        compacted = {}
+    for period, entry in compacted.get('periods', {}).items():
+        entries.append(compacted_entry(period, entry))
+    return entries
+
+
+def compacted_entry(period: str, entry: dict) -> dict:
+    """Entrada do indice para um arquivo compactado (entrada do manifesto de compact_raw)."""
+    return index_entry(
+        f"period={period}", entry['path'], entry.get('rows'), entry.get('bytes'),
+        [date.fromisoformat(day) for day in entry['dates']],
+        [entry.get('min_ticker'), entry.get('max_ticker')],
+    )
+
+
+def partition_files(entries: list, uri) -> dict:
+    """
+    Mapeia cada data para o que deve ser lido (mesmo formato de list_raw_partitions).
+
+    Cada data usa o arquivo da sua particao diaria (ou o padrao glob da particao,
+    se ela tiver varios arquivos); so datas sem particao diaria usam o compactado.
+    Uma particao diaria que coexiste com o compactado e uma reextracao posterior
+    a compactacao (ou um dia ainda nao removido por ela): ela tem os dados mais novos.
+
+    Args:
+        entries: Entradas do indice
+        uri: Funcao chave relativa -> caminho completo (local ou s3://)
+
+    Returns:
+        Dict {data: caminho ou padrao glob}
+    """
+    daily = {}
+    compacted = {}
+    for entry in entries:
+        if entry['path'].startswith(f"{COMPACTED_DIR}/"):
+            for day in entry['dates']:
+                compacted[day] = uri(entry['path'])
+        else:
+            for day in entry['dates']:
+                daily.setdefault(day, []).append(entry)
+
+    files = dict(compacted)
+    for day, day_entries in daily.items():
+        if len(day_entries) == 1:
+            files[day] = uri(day_entries[0]['path'])
+        else:
+            files[day] = uri(f"{day_entries[0]['partition']}/*.parquet")
+    return files
+
+
+def prune(entries: list, start: date = None, end: date = None, tickers: list = None) -> list:
+    """Entradas cujo intervalo [min, max] de data (e de ticker) pode conter linhas do filtro."""
+    selected = []
+    for entry in entries:
+        if start and entry['max_date'] and entry['max_date'] < start:
+            continue
+        if end and entry['min_date'] and entry['min_date'] > end:
+            continue
+        if tickers and entry['min_ticker'] is not None and not any(
+            entry['min_ticker'] <= ticker <= entry['max_ticker'] for ticker in tickers
+        ):
+            continue
+        selected.append(entry)
+    return selected
@@ -0,0 +1,109 @@
+"""
+storage_profiles.py - Perfis nomeados de gravacao Parquet por camada
+Cada perfil define codec, nivel de compressao, tamanho de row group, estatisticas
+e se as linhas sao ordenadas por ticker e data dentro de cada arquivo (o que
+torna o min/max de cada row group seletivo para o Athena e o Polars).
+
+Funciona com DataFrames Polars (transform) e Tabelas Arrow (extract), sem
+importar o Polars (a Lambda de extracao nao o tem).
+"""
+from io import BytesIO
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+STORAGE_PROFILES = {
+    # Menor arquivo e pruning por min/max: padrao das camadas do transform
+    'zstd-sorted': {
+        'compression': 'zstd',
+        'compression_level': 6,
+        'row_group_size': 128 * 1024,
+        'statistics': True,
+        'sort': True,
+    },
+    # Escrita mais rapida, arquivos maiores: padrao da camada raw (extract)
+    'snappy-fast': {
+        'compression': 'snappy',
+        'compression_level': None,
+        'row_group_size': None,
+        'statistics': True,
+        'sort': False,
+    },
+}
+
+# Perfil de cada camada quando STORAGE_PROFILE nao e informado
+DEFAULT_LAYER_PROFILES = {
+    'raw': 'snappy-fast',
+    'refined': 'zstd-sorted',
+    'agg': 'zstd-sorted',
+    'agg_state': 'zstd-sorted',
+}
+
+# Ordenacao dentro do arquivo: ticker primeiro, depois data (as que existirem)
+TICKER_COLUMNS = ['nome_acao', 'Ticker']
+DATE_COLUMNS = ['data_pregao', 'mes_referencia', 'Date']
+
+
+def get_profile(name: str) -> dict:
+    if name not in STORAGE_PROFILES:
+        raise ValueError(f"Perfil de armazenamento invalido: {name} (opcoes: {', '.join(STORAGE_PROFILES)})")
+    return {'name': name, **STORAGE_PROFILES[name]}
+
+
+def layer_profiles(value: str = None, defaults: dict = DEFAULT_LAYER_PROFILES) -> dict:
+    """
+    Resolve o perfil de cada camada.
+
+    Args:
+        value: None (padroes), um perfil para todas as camadas ('snappy-fast') ou
+            perfis por camada ('refined=zstd-sorted,agg=snappy-fast')
+
+    Returns:
+        Dict {camada: perfil (dict de get_profile)}
+    """
+    names = dict(defaults)
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        if '=' in item:
+            layer, name = (part.strip() for part in item.split('=', 1))
+            if layer not in names:
+                raise ValueError(f"Camada invalida em STORAGE_PROFILE: {layer}")
+            names[layer] = name
+        else:
+            names = {layer: item for layer in names}
+    return {layer: get_profile(name) for layer, name in names.items()}
+
+
+def sort_columns(columns: list) -> list:
+    return [col for col in TICKER_COLUMNS + DATE_COLUMNS if col in columns]
+
+
+def write_parquet_polars(df, profile: dict) -> bytes:
+    """Serializa um DataFrame Polars com o perfil informado."""
+    keys = sort_columns(df.columns) if profile['sort'] else []
+    if keys:
+        df = df.sort(keys)
+    buffer = BytesIO()
+    df.write_parquet(
+        buffer,
+        compression=profile['compression'],
+        compression_level=profile['compression_level'],
+        statistics=profile['statistics'],
+        row_group_size=profile['row_group_size'],
+    )
+    return buffer.getvalue()
+
+
+def write_parquet_arrow(table: pa.Table, profile: dict) -> bytes:
+    """Serializa uma Tabela Arrow com o perfil informado."""
+    keys = sort_columns(table.column_names) if profile['sort'] else []
+    if keys:
+        table = table.sort_by([(key, 'ascending') for key in keys])
+    buffer = pa.BufferOutputStream()
+    pq.write_table(
+        table, buffer,
+        compression=profile['compression'],
+        compression_level=profile['compression_level'],
+        write_statistics=profile['statistics'],
+        row_group_size=profile['row_group_size'],
+    )
+    return buffer.getvalue().to_pybytes()
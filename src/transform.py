@@ -3,15 +3,33 @@ transform.py - Transformacao de dados de acoes
 Processa dados brutos (raw), aplica feature engineering e salva em:
 - /refined: dados transformados particionados por data e nome da acao
 - /agg: dados agregados mensalmente
+
+O job e dividido em estagios importaveis (read, normalize, features,
+write_refined, aggregate, write_agg, catalog) executados por run_pipeline;
+main() e o ponto de entrada do Glue.
 """
 import sys
 import os
+import re
+import time
 from pathlib import Path
-from io import BytesIO
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import polars as pl
 import polars.selectors as cs
 import boto3
 
+from object_store import DEFAULT_MAX_WORKERS, existing_keys, open_store, join_key, put_many, with_retries
+from manifest import content_hash, read_manifest, write_manifest, plan_sync
+from partition_index import (COMPACTED_DIR, INDEX_FILE, index_entry, parse_partition_date, partition_files, read_index,
+                             relative_key, update_index, write_index)
+from storage_profiles import get_profile, layer_profiles, write_parquet_polars
+from compact_raw import compacted_partitions, superseded_partitions
+from features import FEATURES, add_features, required_history
+from catalog import catalog_tables
+from metrics import stage_metrics
+from aggregates import STATE_DIR, partial_states, merge_states, finalize_states, read_states, can_fold
+
 try:
     from awsglue.utils import getResolvedOptions
     RUNNING_ON_GLUE = True
@@ -27,190 +45,439 @@ except ImportError:
                     result[key] = args[i + 1]
         return result
 
-def save_partitioned_by_date(df: pl.DataFrame, output_path: str, date_column: str):
+# Janela de aquecimento (em pregoes) lida antes do periodo processado,
+# suficiente para a maior janela movel e o maior lag do registro de features
+WARMUP_TRADING_DAYS = required_history(FEATURES)
+
+# Schema longo canonico da camada raw e colunas wide do MultiIndex achatado (Close_ITUB4.SA)
+RAW_PRICE_FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+CANONICAL_RAW_COLUMNS = ['Date', 'Ticker'] + RAW_PRICE_FIELDS
+WIDE_COLUMN_PATTERN = re.compile(r'^(Open|High|Low|Close|Volume)_(.+)$')
+
+
+def get_optional_args(options: list, argv: list = None, environ: dict = None) -> dict:
+    """
+    Le argumentos opcionais do job sem falhar quando estao ausentes.
+    No Glue usa getResolvedOptions apenas para os argumentos presentes em sys.argv;
+    localmente tambem aceita variaveis de ambiente com o mesmo nome.
+
+    Args:
+        options: Nomes dos argumentos (sem o prefixo '--')
+        argv: Argumentos da linha de comando (padrao: sys.argv)
+        environ: Variaveis de ambiente (padrao: os.environ)
+
+    Returns:
+        Dict com os argumentos informados
+    """
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+
+    present = [opt for opt in options if f'--{opt}' in argv]
+    result = getResolvedOptions(argv, present) if present else {}
+
+    if not RUNNING_ON_GLUE:
+        for opt in options:
+            if opt not in result and environ.get(opt):
+                result[opt] = environ[opt]
+
+    return result
+
+
+def resolve_processing_range(optional_args: dict):
+    """
+    Define o periodo a processar a partir de START_DATE/END_DATE ou PROCESS_DATE.
+
+    Args:
+        optional_args: Argumentos opcionais do job
+
+    Returns:
+        Tupla (data_inicial, data_final) ou None para processar todo o historico
+    """
+    start = optional_args.get('START_DATE') or optional_args.get('PROCESS_DATE')
+    end = optional_args.get('END_DATE') or optional_args.get('PROCESS_DATE') or start
+
+    if not start:
+        if end:
+            raise ValueError("END_DATE informado sem START_DATE")
+        return None
+
+    start_date = datetime.strptime(start, '%Y-%m-%d').date()
+    end_date = datetime.strptime(end, '%Y-%m-%d').date()
+
+    if end_date < start_date:
+        raise ValueError(f"Periodo invalido: {start_date} > {end_date}")
+
+    return start_date, end_date
+
+
+def month_bounds(start_date: date, end_date: date):
+    """Expande o periodo para meses completos (necessario para recalcular o /agg)."""
+    month_start = start_date.replace(day=1)
+    next_month = (end_date.replace(day=1) + timedelta(days=32)).replace(day=1)
+    return month_start, next_month - timedelta(days=1)
+
+
+def month_starts(start: date, end: date) -> list:
+    """Primeiro dia de cada mes entre start e end (inclusive)."""
+    months = []
+    current = start.replace(day=1)
+    while current <= end:
+        months.append(current)
+        current = (current + timedelta(days=32)).replace(day=1)
+    return months
+
+
+def list_raw_partitions(input_path: str) -> dict:
+    """
+    Lista as particoes diarias da camada raw sem ler os arquivos.
+    Datas ja compactadas (compact_raw.py) apontam para o arquivo compactado;
+    particoes diarias continuam sendo lidas diretamente e, se coexistirem com o
+    compactado (dia reextraido depois da compactacao), prevalecem sobre ele.
+    Diarias ja substituidas pela compactacao e ainda nao removidas sao ignoradas.
+    Se a camada tiver indice (_index.parquet), ele substitui a listagem do bucket.
+
+    Args:
+        input_path: Caminho base dos dados raw (local ou S3)
+
+    Returns:
+        Dict {data: padrao glob ou arquivo parquet com os dados da data}
+    """
+    base = input_path.rstrip('/')
+
+    backend, prefix = open_store(base)
+    entries = read_index(backend, prefix)
+    if entries is not None:
+        print(f"   Indice de particoes: {len(entries)} arquivos em {backend.uri(join_key(prefix, INDEX_FILE))}")
+        return partition_files(entries, lambda key: backend.uri(join_key(prefix, key)))
+
+    partitions = compacted_partitions(input_path)
+    # Diarias ja compactadas aguardando remocao (carencia do compact_raw) nao sao lidas
+    superseded = superseded_partitions(input_path)
+
+    if base.startswith('s3://'):
+        bucket = base.replace('s3://', '').split('/')[0]
+        prefix = '/'.join(base.replace('s3://', '').split('/')[1:])
+        prefix = f"{prefix}/" if prefix else ''
+
+        paginator = boto3.client('s3').get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+            for common_prefix in page.get('CommonPrefixes', []):
+                name = common_prefix['Prefix'][len(prefix):].rstrip('/')
+                partition_date = parse_partition_date(name)
+                if partition_date and name not in superseded:
+                    partitions[partition_date] = f"s3://{bucket}/{common_prefix['Prefix']}*.parquet"
+    else:
+        for partition_dir in Path(base).iterdir():
+            partition_date = parse_partition_date(partition_dir.name)
+            if partition_dir.is_dir() and partition_date and partition_dir.name not in superseded:
+                partitions[partition_date] = f"{partition_dir.as_posix()}/*.parquet"
+
+    return partitions
+
+
+def select_partitions(partitions: dict, start_date: date, end_date: date,
+                      warmup_days: int = WARMUP_TRADING_DAYS) -> list:
+    """
+    Seleciona as particoes do periodo mais os `warmup_days` pregoes anteriores.
+
+    Args:
+        partitions: Dict {data: caminho} retornado por list_raw_partitions
+        start_date: Primeira data a processar
+        end_date: Ultima data a processar
+        warmup_days: Quantidade de pregoes anteriores lidos para aquecer as janelas
+
+    Returns:
+        Lista ordenada (sem repeticao) de caminhos a serem lidos
+    """
+    dates = sorted(partitions)
+    in_range = [d for d in dates if start_date <= d <= end_date]
+    before = [d for d in dates if d < start_date]
+    warmup = before[-warmup_days:] if warmup_days > 0 else []
+
+    # Varias datas podem apontar para o mesmo arquivo compactado
+    return list(dict.fromkeys(partitions[d] for d in warmup + in_range))
+
+
+def compacted_file_dates(partitions: dict, paths: list) -> dict:
+    """
+    Datas que cada arquivo compactado selecionado fornece ({caminho: [datas]}).
+    Um dia reextraido depois da compactacao aponta para a particao diaria: as
+    linhas antigas dele no compactado sao descartadas na leitura.
+    """
+    selected = set(paths)
+    dates = {}
+    for day in sorted(partitions):
+        path = partitions[day]
+        if path in selected and f"/{COMPACTED_DIR}/" in path:
+            dates.setdefault(path, []).append(day)
+    return dates
+
+
+def scan_raw_files(paths: list, raw_schema: str = 'auto', max_workers: int = 16,
+                   only_dates: dict = None) -> pl.LazyFrame:
+    """
+    Cria o scan lazy dos arquivos raw (compactados e diarios).
+    No modo 'auto' le apenas o footer de cada arquivo (em paralelo), agrupa os
+    arquivos por schema e cria um scan por grupo, concatenados de forma diagonal;
+    assim historicos mistos (wide/longo/canonico) sao lidos em uma unica passada.
+    No modo 'canonical' todos os arquivos ja seguem CANONICAL_RAW_COLUMNS.
+
+    Args:
+        paths: Caminhos/padroes glob retornados por select_partitions
+        raw_schema: 'auto' ou 'canonical'
+        max_workers: Leituras de footer simultaneas no modo 'auto'
+        only_dates: {caminho: [datas]} dos arquivos lidos apenas nessas datas
+            (compactados, ver compacted_file_dates); cada um vira um scan filtrado
+
+    Returns:
+        LazyFrame com todos os dados raw selecionados
+    """
+    only_dates = only_dates or {}
+
+    def restrict(scan, path):
+        if path not in only_dates:
+            return scan
+        return scan.filter(pl.col('Date').cast(pl.Date, strict=False).is_in(only_dates[path]))
+
+    if raw_schema == 'canonical':
+        plain = [path for path in paths if path not in only_dates]
+        scans = [pl.scan_parquet(plain)] if plain else []
+        scans += [restrict(pl.scan_parquet(path), path) for path in paths if path in only_dates]
+        scans = [scan.select(CANONICAL_RAW_COLUMNS) for scan in scans]
+        return scans[0] if len(scans) == 1 else pl.concat(scans)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        schemas = list(executor.map(lambda path: pl.scan_parquet(path).collect_schema(), paths))
+
+    groups = {}
+    for path, schema in zip(paths, schemas):
+        groups.setdefault((tuple(schema.items()), path if path in only_dates else None), []).append(path)
+
+    scans = []
+    for (schema, restricted), group in groups.items():
+        scan = pl.scan_parquet(group)
+        # Date pode vir com ou sem timezone (download vs history); a data local e o que importa
+        if 'Date' in dict(schema):
+            scan = scan.with_columns(pl.col('Date').cast(pl.Date, strict=False))
+        scans.append(restrict(scan, restricted))
+
+    variants = len({schema for schema, _ in groups})
+    if variants > 1:
+        print(f"   [INFO] {variants} variantes de schema raw encontradas")
+
+    return scans[0] if len(scans) == 1 else pl.concat(scans, how='diagonal_relaxed')
+
+
+def normalize_raw(lf: pl.LazyFrame, ticker_dtype: pl.DataType = pl.Utf8) -> pl.LazyFrame:
+    """
+    Normaliza qualquer variante de schema raw para o formato longo canonico
+    (Date, Ticker, Open, High, Low, Close, Volume) em um unico select vetorizado:
+    - longo (yf.download/history com coluna Ticker)
+    - wide achatado do MultiIndex do yfinance (Close_ITUB4.SA, Open_ITUB4.SA, ...)
+    - historico misto (wide + longo apos a concatenacao diagonal)
+
+    Cada linha gera um struct por ticker candidato; a lista de structs e explodida
+    e as linhas sem fechamento (ticker ausente naquela linha) sao descartadas.
+    `ticker_dtype` permite manter o Ticker como Categorical (modo COMPACT_DTYPES).
+    """
+    columns = lf.collect_schema().names()
+
+    wide = {}
+    for col in columns:
+        match = WIDE_COLUMN_PATTERN.match(col)
+        if match:
+            wide.setdefault(match.group(2), {})[match.group(1)] = col
+
+    def field(name, source):
+        dtype = pl.Int64 if name == 'Volume' else pl.Float64
+        expr = pl.col(source) if source else pl.lit(None)
+        return expr.cast(dtype, strict=False).alias(name)
+
+    long_fields = [field(name, name if name in columns else None) for name in RAW_PRICE_FIELDS]
+
+    if not wide:
+        return lf.select([pl.col('Date'), pl.col('Ticker').cast(ticker_dtype, strict=False), *long_fields])
+
+    candidates = [
+        pl.struct([pl.lit(ticker, dtype=pl.Utf8).cast(ticker_dtype).alias('Ticker'),
+                   *[field(name, sources.get(name)) for name in RAW_PRICE_FIELDS]])
+        for ticker, sources in wide.items()
+    ]
+    if 'Ticker' in columns and 'Close' in columns:
+        candidates.append(pl.struct([pl.col('Ticker').cast(ticker_dtype, strict=False), *long_fields]))
+
+    return (
+        lf.select([pl.col('Date'), pl.concat_list(candidates).alias('_linhas')])
+        .explode('_linhas')
+        .unnest('_linhas')
+        .filter(pl.col('Close').is_not_null())
+    )
+
+
+# Modo COMPACT_DTYPES: floats ja arredondados em 2 casas ficam em Float32 na memoria.
+# Abaixo de 2^16 o erro do Float32 (< 0,004) e desfeito pelo round(2) na gravacao.
+COMPACT_FLOAT_LIMIT = 2 ** 16
+
+
+def to_storage_dtypes(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Converte colunas compactas para os tipos das tabelas no catalogo (Float32 ->
+    Float64 arredondado em 2 casas, Categorical/Enum -> String). Sem colunas
+    compactas o DataFrame e devolvido sem mudancas.
+    """
+    compact = cs.by_dtype(pl.Float32) | cs.categorical() | cs.enum()
+    if not df.select(compact).columns:
+        return df
+    return df.with_columns(
+        cs.by_dtype(pl.Float32).cast(pl.Float64).round(2),
+        (cs.categorical() | cs.enum()).cast(pl.Utf8),
+    )
+
+
+def manifest_index_entry(partition: str, entry: dict) -> dict:
+    """Entrada do indice para uma particao do manifesto de save_partitioned_by_date."""
+    return index_entry(partition, f"{partition}/data.parquet", entry['rows'], entry['bytes'],
+                       tickers=[entry.get('min_ticker'), entry.get('max_ticker')])
+
+
+def layer_index(manifest: dict, existing_keys: set, prefix: str, deleted: list) -> list:
+    """
+    Entradas do indice de uma camada gravada por save_partitioned_by_date: as do
+    manifesto mais as particoes que ja existiam sem entrada (gravadas antes do manifesto).
+    """
+    entries = [manifest_index_entry(partition, entry) for partition, entry in manifest.items()]
+    for key in existing_keys:
+        parts = relative_key(prefix, key).split('/')
+        if (len(parts) == 2 and parts[1] == 'data.parquet' and parts[0] not in manifest
+                and parts[0] not in deleted and parse_partition_date(parts[0])):
+            entries.append(index_entry(parts[0], '/'.join(parts)))
+    return entries
+
+
+def save_partitioned_by_date(df: pl.DataFrame, output_path: str, date_column: str,
+                             max_workers: int = DEFAULT_MAX_WORKERS, prune=None, profile: dict = None) -> dict:
     """
     Salva DataFrame particionado por data no formato Hive: coluna=YYYY-MM-DD/data.parquet
+    O DataFrame e dividido em uma unica passada (partition_by), cada particao
+    e serializada uma unica vez e os uploads rodam em paralelo (object_store).
+    Particoes com o mesmo hash de conteudo do manifesto (_manifest.json) nao sao
+    reenviadas; o indice da camada (_index.parquet) e atualizado por ultimo.
+    O plano vem do manifesto (um GET), sem LIST: so as particoes com hash igual
+    recebem um HEAD, para regravar as apagadas por fora do pipeline. A camada so
+    e listada quando ainda nao tem manifesto.
     
     Args:
         df: DataFrame Polars a ser salvo
         output_path: Caminho base de saída (local ou S3)
         date_column: Nome da coluna de data para particionamento
-    """
-    import boto3
-    from io import BytesIO
+        max_workers: Numero maximo de uploads simultaneos
+        prune: Particoes do manifesto ausentes do DataFrame a remover: None (nenhuma),
+            'all' ou (inicio, fim) - o intervalo que esta gravacao substitui
+        profile: Perfil de gravacao Parquet (storage_profiles; padrao: zstd-sorted)
     
-    # Obtém as datas únicas
-    dates = df.select(pl.col(date_column)).unique().sort(date_column)
+    Returns:
+        Dict com 'partitions' (lista de dicts com 'partition', 'rows', 'bytes' e
+        'status' written/skipped), 'written', 'skipped' e 'deleted' (contagens)
+    """
+    # Divide o DataFrame em uma unica passada, ja sem a coluna de particao
+    partitions = df.partition_by(date_column, as_dict=True, include_key=False, maintain_order=True)
+    profile = profile or get_profile('zstd-sorted')
+    backend, prefix = open_store(output_path)
     
-    is_s3 = output_path.startswith('s3://')
+    manifest = read_manifest(backend, prefix)
+    listed = manifest is None
+    if listed:
+        # Primeira gravacao (ou manifesto antigo): lista a camada uma unica vez
+        present = set(backend.list(prefix))
+        manifest = {}
     
-    if is_s3:
-        s3_client = boto3.client('s3')
-        bucket = output_path.replace('s3://', '').split('/')[0]
-        prefix = '/'.join(output_path.replace('s3://', '').split('/')[1:])
+    print(f"  Salvando {len(partitions)} partições no formato Hive "
+          f"({max_workers} uploads simultâneos, perfil {profile['name']})...")
     
-    print(f"  Salvando {len(dates)} partições no formato Hive...")
+    entries = {}
+    bodies = {}
     
-    for row in dates.iter_rows(named=True):
-        date_value = str(row[date_column])
-        df_partition = df.filter(pl.col(date_column) == row[date_column])
-        
-        # Remove a coluna de partição do DataFrame
-        df_to_save = df_partition.drop(date_column)
-        
+    for (partition_value,), df_to_save in sorted(partitions.items(), key=lambda item: item[0]):
         # Formato Hive: coluna=valor
-        hive_partition = f"{date_column}={date_value}"
+        hive_partition = f"{date_column}={partition_value}"
         
-        if is_s3:
-            # Salva para S3
-            buffer = BytesIO()
-            df_to_save.write_parquet(buffer)
-            buffer.seek(0)
-            
-            s3_key = f"{prefix}/{hive_partition}/data.parquet" if prefix else f"{hive_partition}/data.parquet"
-            s3_client.put_object(Bucket=bucket, Key=s3_key, Body=buffer.getvalue())
-            print(f"    -> {hive_partition}: {len(df_partition)} registros -> s3://{bucket}/{s3_key}")
-        else:
-            # Salva localmente
-            partition_dir = Path(output_path) / hive_partition
-            partition_dir.mkdir(parents=True, exist_ok=True)
-            
-            output_file = partition_dir / 'data.parquet'
-            df_to_save.write_parquet(output_file)
-            print(f"    -> {hive_partition}: {len(df_partition)} registros")
+        body = write_parquet_polars(to_storage_dtypes(df_to_save), profile)
+        
+        bodies[hive_partition] = body
+        entries[hive_partition] = {'sha256': content_hash(body), 'rows': len(df_to_save), 'bytes': len(body)}
+        if 'nome_acao' in df_to_save.columns:
+            entries[hive_partition]['min_ticker'] = df_to_save['nome_acao'].min()
+            entries[hive_partition]['max_ticker'] = df_to_save['nome_acao'].max()
     
-    print(f"  [OK] Todas as partições salvas em formato Hive")
-
-
-print("=" * 80)
-print("INICIANDO TRANSFORMACAO DE DADOS - BLUE CHIPS B3")
-print(f"Ambiente: {'AWS Glue' if RUNNING_ON_GLUE else 'Local/Container'}")
-print("=" * 80)
-
-if RUNNING_ON_GLUE:
-    try:
-        args = getResolvedOptions(sys.argv, ['JOB_NAME', 'BUCKET_NAME', 'INPUT_PREFIX'])
-        bucket_name = args['BUCKET_NAME']
-        input_prefix = args['INPUT_PREFIX']
-    except Exception:
-        args = getResolvedOptions(sys.argv, ['JOB_NAME', 'BUCKET_NAME', 'INPUT_KEY'])
-        bucket_name = args['BUCKET_NAME']
-        input_key = args['INPUT_KEY']
-        input_prefix = input_key.rsplit('/', 1)[0] + '/'
-else:
-    bucket_name = os.environ.get('BUCKET_NAME', 'default-bucket')
-    input_prefix = os.environ.get('INPUT_PREFIX', 'raw/')
-    print(f"[WARN] Usando variaveis de ambiente: BUCKET_NAME={bucket_name}")
-
-is_local = (
-    bucket_name.startswith('/') or 
-    bucket_name.startswith('C:') or 
-    bucket_name.startswith('\\') or
-    input_prefix.startswith('/') or 
-    input_prefix.startswith('C:') or 
-    input_prefix.startswith('\\')
-)
-
-if is_local:
-    input_path = input_prefix
-    if not (bucket_name.startswith('/') or bucket_name.startswith('C:')):
-        bucket_name = input_prefix.rsplit('/', 1)[0] if '/' in input_prefix else bucket_name
-else:
-    input_path = f"s3://{bucket_name}/{input_prefix}"
-
-print(f"\n[INFO] Lendo dados de: {input_path}")
-
-# ============================================================================
-# 1. LEITURA E LIMPEZA DOS DADOS RAW
-# ============================================================================
-
-if input_path.endswith('/'):
-    parquet_pattern = f"{input_path}**/*.parquet"
-else:
-    parquet_pattern = f"{input_path}/**/*.parquet"
-
-print(f"   Pattern: {parquet_pattern}")
-
-df_raw = pl.read_parquet(parquet_pattern)
-print(f"[OK] Dados carregados: {df_raw.shape[0]:,} registros, {df_raw.shape[1]} colunas")
-print(f"  Colunas: {', '.join(df_raw.columns)}\n")
-
-is_wide_format = any('_' in col and col.split('_')[0] in ['Close', 'Open', 'High', 'Low', 'Volume'] 
-                     for col in df_raw.columns if col not in ['Date', 'Ticker', 'data_particao'])
-
-if is_wide_format:
-    print("[INFO] Detectado formato WIDE - convertendo para formato LONG...\n")
+    if df.is_empty() and prune is not None:
+        print("  [WARN] Nenhuma linha para gravar; particoes existentes mantidas")
+        prune = None
+    if not listed:
+        # HEAD so das particoes tocadas que seriam puladas (hash igual ao do manifesto)
+        unchanged = [join_key(prefix, partition, 'data.parquet') for partition, entry in entries.items()
+                     if manifest.get(partition, {}).get('sha256') == entry['sha256']]
+        present = existing_keys(backend, unchanged, max_workers)
+    plan = plan_sync(manifest, entries, present, prefix, prune)
     
-    tickers = []
-    for col in df_raw.columns:
-        if '_' in col and col.split('_')[0] in ['Close', 'Open', 'High', 'Low', 'Volume']:
-            ticker = '_'.join(col.split('_')[1:])
-            if ticker not in tickers:
-                tickers.append(ticker)
+    uploads = [(join_key(prefix, partition, 'data.parquet'), bodies[partition]) for partition in plan['write']]
+    results = put_many(backend, uploads, max_workers=max_workers)
     
-    print(f"  Tickers encontrados: {', '.join(tickers)}")
+    for partition, result in zip(plan['write'], results):
+        print(f"    -> {partition}: {entries[partition]['rows']} registros, "
+              f"{result['bytes']:,} bytes -> {backend.uri(result['key'])}")
     
-    dfs = []
-    for ticker in tickers:
-        df_ticker = df_raw.select([
-            pl.col("Date"),
-            pl.lit(ticker).alias("Ticker"),
-            pl.col(f"Close_{ticker}").alias("Close"),
-            pl.col(f"Open_{ticker}").alias("Open"),
-            pl.col(f"High_{ticker}").alias("High"),
-            pl.col(f"Low_{ticker}").alias("Low"),
-            pl.col(f"Volume_{ticker}").alias("Volume"),
-        ])
-        dfs.append(df_ticker)
+    for partition in plan['delete']:
+        with_retries(lambda: backend.delete(join_key(prefix, partition, 'data.parquet')))
+        print(f"    x  {partition}: removida (ausente no reprocessamento)")
     
-    df_raw = pl.concat(dfs)
-    print(f"[OK] Conversao concluida: {df_raw.shape[0]:,} registros\n")
-
-df_clean = df_raw.with_columns([
-    pl.col("Ticker").cast(pl.Utf8, strict=False),
-    pl.col("Date").cast(pl.Date, strict=False),
-]).sort(["Ticker", "Date"])
-
-df_clean = df_clean.filter(
-    pl.col("Ticker").is_not_null() & 
-    pl.col("Date").is_not_null() &
-    pl.col("Close").is_not_null()
-)
+    updated = {partition: entry for partition, entry in manifest.items() if partition not in plan['delete']}
+    updated.update(entries)
+    if plan['write'] or plan['delete'] or updated != manifest:
+        write_manifest(backend, prefix, updated)
+    changed = plan['write'] or plan['delete'] or updated != manifest
+    if listed:
+        if changed or join_key(prefix, INDEX_FILE) not in present:
+            write_index(backend, prefix, layer_index(updated, present, prefix, plan['delete']))
+    elif changed or not backend.exists(join_key(prefix, INDEX_FILE)):
+        # Atualiza so as particoes tocadas; sem indice, ele e recriado listando a camada uma vez
+        update_index(
+            backend, prefix,
+            [manifest_index_entry(partition, entries[partition]) for partition in entries],
+            [f"{partition}/data.parquet" for partition in plan['delete']],
+            bootstrap=lambda backend, prefix: layer_index(updated, set(backend.list(prefix)), prefix, plan['delete']),
+        )
+    
+    written = set(plan['write'])
+    report = {
+        'partitions': [
+            {'partition': partition, 'rows': entry['rows'], 'bytes': entry['bytes'],
+             'status': 'written' if partition in written else 'skipped'}
+            for partition, entry in entries.items()
+        ],
+        'written': len(plan['write']),
+        'skipped': len(plan['skip']),
+        'deleted': len(plan['delete']),
+    }
+    
+    written_bytes = sum(entries[partition]['bytes'] for partition in written)
+    print(f"  [OK] Partições em formato Hive: {report['written']} gravadas ({written_bytes:,} bytes), "
+          f"{report['skipped']} sem mudança, {report['deleted']} removidas")
+    return report
 
-print(f"[OK] Apos limpeza: {df_clean.shape[0]:,} registros\n")
 
 # ============================================================================
-# 2. FEATURE ENGINEERING
+# PIPELINE EM ESTAGIOS
+# Cada estagio recebe a configuracao do job e o contexto da execucao (dict),
+# le o que precisa do contexto e grava nele os seus resultados. Assim os
+# estagios podem ser executados, medidos e repetidos isoladamente no mesmo
+# processo (ex.: so reagregar reaproveitando o plano de leitura).
 # ============================================================================
 
-print("[INFO] Aplicando transformacoes e criando features...\n")
-
-df_refined = df_clean.with_columns([
-    pl.col("Date").alias("data_pregao"),
-    pl.col("Ticker").str.replace(".SA", "").str.to_lowercase().alias("nome_acao"),
-    pl.col("Open").alias("abertura"),
-    pl.col("Close").alias("fechamento"),
-    pl.col("High").alias("max"),
-    pl.col("Low").alias("min"),
-    pl.col("Volume").alias("volume_negociado"),
-    
-    pl.col("Close").rolling_mean(window_size=7).over("Ticker").alias("media_movel_7d"),
-    pl.col("Close").rolling_mean(window_size=14).over("Ticker").alias("media_movel_14d"),
-    pl.col("Close").rolling_mean(window_size=30).over("Ticker").alias("media_movel_30d"),
-    
-    pl.col("Close").shift(1).over("Ticker").alias("lag_1d"),
-    pl.col("Close").shift(2).over("Ticker").alias("lag_2d"),
-    pl.col("Close").shift(3).over("Ticker").alias("lag_3d"),
-    
-    ((pl.col("Close") - pl.col("Open")) / pl.col("Open") * 100).alias("variacao_pct_dia"),
-    (pl.col("High") - pl.col("Low")).alias("amplitude_dia"),
-    pl.col("Close").rolling_std(window_size=7).over("Ticker").alias("volatilidade_7d"),
-])
-
-df_refined = df_refined.drop_nulls()
-df_refined = df_refined.with_columns(cs.float().round(2))
+OPTIONAL_ARGS = ['START_DATE', 'END_DATE', 'PROCESS_DATE', 'STREAMING', 'IO_MAX_WORKERS',
+                 'RAW_SCHEMA', 'INCREMENTAL_AGG', 'PARTITION_PROJECTION', 'STORAGE_PROFILE',
+                 'COMPACT_DTYPES']
 
-df_final = df_refined.select([
+REFINED_COLUMNS = [
     "data_pregao",
     "nome_acao",
     "abertura",
@@ -220,415 +487,488 @@ df_final = df_refined.select([
     "volume_negociado",
     "variacao_pct_dia",
     "amplitude_dia",
-    "media_movel_7d",
-    "media_movel_14d",
-    "media_movel_30d",
-    "volatilidade_7d",
-    "lag_1d",
-    "lag_2d",
-    "lag_3d",
-])
-
-print(f"[OK] Features criadas: {df_final.shape[1]} colunas")
-print(f"[OK] Registros finais: {df_final.shape[0]:,}\n")
+    *[feature['name'] for feature in FEATURES],
+]
 
-# ============================================================================
-# 3. SALVAR DADOS REFINED (PARTICIONADOS POR DATA E NOME DA ACAO)
-# ============================================================================
 
-if is_local:
-    output_path_refined = f"{bucket_name}/refined"
-else:
-    output_path_refined = f"s3://{bucket_name}/refined"
+def is_true(value) -> bool:
+    return str(value).lower() in ('true', '1', 'yes')
 
-print(f"[INFO] Salvando dados REFINED em: {output_path_refined}")
-print(f"   Particionamento: data_pregao\n")
 
-save_partitioned_by_date(df_final, output_path_refined, "data_pregao")
+def build_config(argv: list = None, environ: dict = None) -> dict:
+    """
+    Monta a configuracao do job a partir dos argumentos do Glue ou do ambiente local.
 
-print("\n[OK] Dados refined salvos com sucesso!\n")
+    Args:
+        argv: Argumentos da linha de comando (padrao: sys.argv)
+        environ: Variaveis de ambiente (padrao: os.environ)
 
-# ============================================================================
-# 4. DADOS AGREGADOS MENSAIS
-# ============================================================================
+    Returns:
+        Dict com caminhos de entrada/saida e opcoes do job
+    """
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
 
-print("[INFO] Gerando agregacoes mensais...\n")
+    if RUNNING_ON_GLUE:
+        try:
+            args = getResolvedOptions(argv, ['JOB_NAME', 'BUCKET_NAME', 'INPUT_PREFIX'])
+            bucket_name = args['BUCKET_NAME']
+            input_prefix = args['INPUT_PREFIX']
+        except Exception:
+            args = getResolvedOptions(argv, ['JOB_NAME', 'BUCKET_NAME', 'INPUT_KEY'])
+            bucket_name = args['BUCKET_NAME']
+            input_key = args['INPUT_KEY']
+            input_prefix = input_key.rsplit('/', 1)[0] + '/'
+    else:
+        bucket_name = environ.get('BUCKET_NAME', 'default-bucket')
+        input_prefix = environ.get('INPUT_PREFIX', 'raw/')
+        print(f"[WARN] Usando variaveis de ambiente: BUCKET_NAME={bucket_name}")
+
+    is_local = (
+        bucket_name.startswith('/') or 
+        bucket_name.startswith('C:') or 
+        bucket_name.startswith('\\') or
+        input_prefix.startswith('/') or 
+        input_prefix.startswith('C:') or 
+        input_prefix.startswith('\\')
+    )
+
+    if is_local:
+        input_path = input_prefix
+        if not (bucket_name.startswith('/') or bucket_name.startswith('C:')):
+            bucket_name = input_prefix.rsplit('/', 1)[0] if '/' in input_prefix else bucket_name
+        output_base = bucket_name
+    else:
+        input_path = f"s3://{bucket_name}/{input_prefix}"
+        output_base = f"s3://{bucket_name}"
+
+    optional_args = get_optional_args(OPTIONAL_ARGS, argv, environ)
+
+    return {
+        'bucket_name': bucket_name,
+        'input_path': input_path,
+        'is_local': is_local,
+        'output_path_refined': f"{output_base}/refined",
+        'output_path_agg': f"{output_base}/agg",
+        # Estados parciais da agregacao mensal (agg_state/ fica fora da location da tabela agg)
+        'output_path_state': f"{output_base}/{STATE_DIR}",
+        'processing_range': resolve_processing_range(optional_args),
+        'use_streaming': is_true(optional_args.get('STREAMING', 'false')),
+        'io_max_workers': int(optional_args.get('IO_MAX_WORKERS', DEFAULT_MAX_WORKERS)),
+        'raw_schema': optional_args.get('RAW_SCHEMA', 'auto'),
+        'incremental_agg': is_true(optional_args.get('INCREMENTAL_AGG', 'false')),
+        'partition_projection': is_true(optional_args.get('PARTITION_PROJECTION', 'false')),
+        # Perfil Parquet por camada: 'zstd-sorted' ou 'refined=zstd-sorted,agg=snappy-fast'
+        'storage_profiles': layer_profiles(optional_args.get('STORAGE_PROFILE')),
+        # Tickers Categorical, floats do refined em Float32 e descarte antecipado de colunas
+        'compact_dtypes': is_true(optional_args.get('COMPACT_DTYPES', 'false')),
+    }
+
+
+def stage_read(config: dict, ctx: dict):
+    """1. Lista as particoes raw necessarias e cria o scan lazy (ctx['lf_raw'])."""
+    input_path = config['input_path']
+    processing_range = config['processing_range']
+    ctx['previous_states'] = None
+
+    print(f"\n[INFO] Lendo dados de: {input_path}")
+
+    if processing_range:
+        start_date, end_date = processing_range
+        # O /agg precisa do mes inteiro; o /refined so e regravado para [start_date, end_date]
+        compute_start, compute_end = month_bounds(start_date, end_date)
+
+        raw_partitions = list_raw_partitions(input_path)
+
+        if config['incremental_agg']:
+            # Se o estado do mes termina antes de start_date, so as novas linhas sao lidas e somadas
+            states = read_states(config['output_path_state'], month_starts(compute_start, compute_end))
+            if can_fold(states, start_date, raw_partitions):
+                ctx['previous_states'] = states
+                compute_start = start_date
+                print(f"   [INFO] Agregacao incremental: somando a partir de {start_date} "
+                      f"ao estado ate {states['ultima_data'].max()}")
+            else:
+                print("   [INFO] Agregacao incremental indisponivel para o periodo; recalculando os meses")
+
+        print(f"   Periodo: {start_date} ate {end_date} (calculo {compute_start} ate {compute_end})")
+
+        parquet_files = select_partitions(raw_partitions, compute_start, compute_end)
+        print(f"   Particoes lidas: {len(parquet_files)} de {len(raw_partitions)} "
+              f"(inclui ate {WARMUP_TRADING_DAYS} pregoes de aquecimento)")
+
+        ctx['compute_range'] = (compute_start, compute_end)
+        ctx['raw_files'] = len(parquet_files)
+
+        if not parquet_files:
+            print("[WARN] Nenhuma particao raw encontrada para o periodo. Nada a processar.")
+            ctx['stop'] = True
+            return
+
+        ctx['lf_raw'] = scan_raw_files(parquet_files, config['raw_schema'],
+                                       only_dates=compacted_file_dates(raw_partitions, parquet_files))
+    else:
+        # Historico completo: le pelo mapa de particoes (diarias + compactadas, sem duplicar datas)
+        raw_partitions = list_raw_partitions(input_path)
+        parquet_files = list(dict.fromkeys(raw_partitions[d] for d in sorted(raw_partitions)))
+        ctx['compute_range'] = None
+        ctx['raw_files'] = len(parquet_files)
+
+        if parquet_files:
+            print(f"   Arquivos: {len(parquet_files)} (particoes diarias + compactadas)")
+            ctx['lf_raw'] = scan_raw_files(parquet_files, config['raw_schema'],
+                                           only_dates=compacted_file_dates(raw_partitions, parquet_files))
+        else:
+            if input_path.endswith('/'):
+                parquet_pattern = f"{input_path}**/*.parquet"
+            else:
+                parquet_pattern = f"{input_path}/**/*.parquet"
+
+            print(f"   Pattern: {parquet_pattern}")
+
+            ctx['lf_raw'] = pl.scan_parquet(parquet_pattern)
+
+    # Apenas o schema e lido aqui (metadados); os dados so sao lidos no collect
+    raw_columns = ctx['lf_raw'].collect_schema().names()
+    print(f"[OK] Schema carregado: {len(raw_columns)} colunas")
+    print(f"  Colunas: {', '.join(raw_columns)}\n")
+
+
+def stage_normalize(config: dict, ctx: dict):
+    """2. Normaliza o raw (longo, wide ou misto) para o schema canonico (ctx['lf_clean'])."""
+    # Colunas nao usadas (ex.: data_particao) nunca sao decodificadas
+    ticker_dtype = pl.Categorical if config['compact_dtypes'] else pl.Utf8
+    lf_clean = normalize_raw(ctx['lf_raw'], ticker_dtype).with_columns([
+        pl.col("Date").cast(pl.Date, strict=False),
+    ]).sort(["Ticker", "Date"])
+
+    ctx['lf_clean'] = lf_clean.filter(
+        pl.col("Ticker").is_not_null() & 
+        pl.col("Date").is_not_null() &
+        pl.col("Close").is_not_null()
+    )
+
+
+def stage_features(config: dict, ctx: dict):
+    """3. Monta o plano lazy das features da camada refined (ctx['lf_refined'])."""
+    print("[INFO] Aplicando transformacoes e criando features...\n")
+
+    compact = config['compact_dtypes']
+    nome_acao = pl.col("Ticker").cast(pl.Utf8).str.replace(".SA", "").str.to_lowercase()
+    refined_expressions = [
+        pl.col("Date").alias("data_pregao"),
+        (nome_acao.cast(pl.Categorical) if compact else nome_acao).alias("nome_acao"),
+        pl.col("Open").alias("abertura"),
+        pl.col("Close").alias("fechamento"),
+        pl.col("High").alias("max"),
+        pl.col("Low").alias("min"),
+        pl.col("Volume").alias("volume_negociado"),
+        
+        ((pl.col("Close") - pl.col("Open")) / pl.col("Open") * 100).alias("variacao_pct_dia"),
+        (pl.col("High") - pl.col("Low")).alias("amplitude_dia"),
+    ]
 
-df_agregado = df_refined.group_by([
-    "nome_acao",
-    pl.col("data_pregao").dt.truncate("1mo").alias("mes_referencia")
-]).agg([
-    pl.col("fechamento").mean().alias("preco_medio_mensal"),
-    pl.col("fechamento").min().alias("preco_minimo_mensal"),
-    pl.col("fechamento").max().alias("preco_maximo_mensal"),
-    pl.col("volume_negociado").sum().alias("volume_total_mensal"),
-    pl.col("volume_negociado").mean().alias("volume_medio_diario"),
-    pl.col("variacao_pct_dia").mean().alias("variacao_media_diaria_pct"),
-    pl.col("volatilidade_7d").mean().alias("volatilidade_media_mensal"),
-    pl.col("data_pregao").n_unique().alias("dias_negociacao"),
-]).sort(["nome_acao", "mes_referencia"])
+    # Janelas e lags declarados em features.FEATURES, calculados com um unico agrupamento por ticker
+    lf_refined = add_features(ctx['lf_clean'], FEATURES)
+    if compact:
+        # Descarte antecipado: um unico select ja com os nomes finais, sem as colunas originais
+        lf_refined = lf_refined.select([*refined_expressions, *[feature['name'] for feature in FEATURES]])
+    else:
+        lf_refined = lf_refined.with_columns(refined_expressions)
 
-df_agregado = df_agregado.with_columns(cs.float().round(2))
+    lf_refined = lf_refined.drop_nulls()
+    # Features e precos sao calculados em Float64; no modo compacto so o resultado
+    # arredondado fica em Float32 (restaurado por to_storage_dtypes na gravacao)
+    rounded = cs.float().round(2)
+    lf_refined = lf_refined.with_columns(rounded.cast(pl.Float32) if compact else rounded)
 
-print(f"[OK] Agregacoes geradas: {df_agregado.shape[0]:,} registros mensais\n")
+    if ctx.get('compute_range'):
+        # Descarta o aquecimento: so os meses afetados entram na agregacao
+        lf_refined = lf_refined.filter(pl.col("data_pregao").is_between(*ctx['compute_range']))
 
-if is_local:
-    output_path_agg = f"{bucket_name}/agg"
-else:
-    output_path_agg = f"s3://{bucket_name}/agg"
+    ctx['lf_refined'] = lf_refined.select(REFINED_COLUMNS)
+    ctx.pop('df_refined', None)
 
-print(f"[INFO] Salvando dados AGREGADOS em: {output_path_agg}")
-print(f"   Particionamento: mes_referencia\n")
 
-save_partitioned_by_date(df_agregado, output_path_agg, "mes_referencia")
+def engine_for(config: dict) -> str:
+    return "streaming" if config['use_streaming'] else "auto"
 
-print("\n[OK] Dados agregados salvos com sucesso!\n")
 
-# ============================================================================
-# 5. CATALOGACAO AUTOMATICA NO GLUE CATALOG
-# ============================================================================
+def stage_write_refined(config: dict, ctx: dict):
+    """
+    4. Executa o plano de features e grava /refined.
+    O resultado fica em memoria (ctx['df_refined']) para a agregacao, que assim
+    nao relê o raw nem recalcula as features.
+    """
+    engine = engine_for(config)
+    print(f"[INFO] Executando plano lazy (engine={engine})...\n")
+    df_refined = ctx['lf_refined'].collect(engine=engine)
+    ctx['df_refined'] = df_refined
 
-print("[INFO] Catalogando dados no Glue Catalog...\n")
+    if config['compact_dtypes']:
+        # Acima de COMPACT_FLOAT_LIMIT o Float32 pode perder os centavos
+        largest = df_refined.select(cs.by_dtype(pl.Float32).abs().max()).max_horizontal().item()
+        if largest is not None and largest >= COMPACT_FLOAT_LIMIT:
+            print(f"[WARN] COMPACT_DTYPES: valor {largest:,.2f} acima de {COMPACT_FLOAT_LIMIT:,}; "
+                  f"centavos podem ser arredondados de forma diferente do modo padrao")
+
+    df_final = df_refined
+    if config['processing_range']:
+        # Apenas as particoes data_pregao= do periodo solicitado sao regravadas
+        df_final = df_final.filter(pl.col("data_pregao").is_between(*config['processing_range']))
+    ctx['df_final'] = df_final
+
+    print(f"[OK] Features criadas: {df_final.shape[1]} colunas")
+    print(f"[OK] Registros finais: {df_final.shape[0]:,}\n")
+
+    output_path_refined = config['output_path_refined']
+    print(f"[INFO] Salvando dados REFINED em: {output_path_refined}")
+    print(f"   Particionamento: data_pregao\n")
+
+    # Sem PROCESS_DATE/START_DATE o refined inteiro e substituido (remove datas que sairam do raw)
+    ctx['written_refined'] = save_partitioned_by_date(
+        df_final, output_path_refined, "data_pregao", config['io_max_workers'],
+        prune=config['processing_range'] or 'all', profile=config['storage_profiles']['refined'],
+    )
+
+    print("\n[OK] Dados refined salvos com sucesso!\n")
+
+
+def stage_aggregate(config: dict, ctx: dict):
+    """
+    5. Calcula os estados parciais e a agregacao mensal (ctx['df_agregado']).
+    Parte do refined ja materializado por write_refined (ctx['df_refined']): o
+    plano de leitura e features nao e executado de novo. Os estados sao coletados
+    uma unica vez e a agregacao final sai deles, sem depender da eliminacao de
+    subplanos comuns do engine (o streaming nao a faz entre consultas).
+    """
+    # Sem write_refined (reexecucao parcial) o plano lazy e executado aqui, uma unica vez
+    lf_refined = ctx['df_refined'].lazy() if ctx.get('df_refined') is not None else ctx['lf_refined']
+
+    # Estados parciais por acao/mes: somados ao estado anterior no modo incremental
+    lf_states = partial_states(lf_refined)
+    if ctx.get('previous_states') is not None:
+        lf_states = merge_states(ctx['previous_states'].lazy(), lf_states)
+
+    ctx['df_states'] = lf_states.collect(engine=engine_for(config))
+    ctx['df_agregado'] = finalize_states(ctx['df_states'].lazy()).collect()
+    print(f"[OK] Agregacoes geradas: {ctx['df_agregado'].shape[0]:,} registros mensais\n")
+
+
+def stage_write_agg(config: dict, ctx: dict):
+    """6. Grava /agg e os estados parciais em agg_state/."""
+    output_path_agg = config['output_path_agg']
+    print(f"[INFO] Salvando dados AGREGADOS em: {output_path_agg}")
+    print(f"   Particionamento: mes_referencia\n")
+
+    # Os meses do intervalo calculado sao recalculados por inteiro
+    compute_range = ctx.get('compute_range')
+    prune = (compute_range[0].replace(day=1), compute_range[1]) if compute_range else 'all'
+
+    ctx['written_agg'] = save_partitioned_by_date(
+        ctx['df_agregado'], output_path_agg, "mes_referencia", config['io_max_workers'],
+        prune=prune, profile=config['storage_profiles']['agg'],
+    )
+    ctx['written_state'] = save_partitioned_by_date(
+        ctx['df_states'], config['output_path_state'], "mes_referencia", config['io_max_workers'],
+        prune=prune, profile=config['storage_profiles']['agg_state'],
+    )
+
+    print("\n[OK] Dados agregados salvos com sucesso!\n")
+
+
+def stage_catalog(config: dict, ctx: dict, glue_client=None, athena_client=None):
+    """7. Cria/atualiza as tabelas e registra as particoes gravadas (nao-bloqueante)."""
+    print("[INFO] Catalogando dados no Glue Catalog...\n")
+
+    output_path_refined = config['output_path_refined']
+    output_path_agg = config['output_path_agg']
+    bucket_name = config['bucket_name']
 
-try:
-    import boto3
-    import time
-    
-    glue_client = boto3.client('glue')
-    athena_client = boto3.client('athena')
-    
-    database_name = 'default'
-    table_refined = 'refined_stocks'
-    table_aggregated = 'aggregated_stocks_monthly'
-    
-    # Garantir que as locations sejam S3 URIs válidos
-    if not output_path_refined.startswith('s3://'):
-        print(f"[WARN] output_path_refined não é S3 URI: {output_path_refined}")
-        print(f"       Pulando catalogação (apenas para ambiente local)")
-        raise Exception("Catalogacao requer S3 URIs")
-    
-    if not output_path_agg.startswith('s3://'):
-        print(f"[WARN] output_path_agg não é S3 URI: {output_path_agg}")
-        print(f"       Pulando catalogação (apenas para ambiente local)")
-        raise Exception("Catalogacao requer S3 URIs")
-    
-    # Configurar bucket para resultados do Athena
-    # Extrai account_id do bucket_name (formato: ACCOUNT_ID-data-lake-bucket)
-    account_id = bucket_name.split('-')[0] if '-' in bucket_name else 'unknown'
-    athena_result_bucket = f"s3://{account_id}-athena-results-bucket/"
-    
-    print(f"[INFO] Location Refined: {output_path_refined}/")
-    print(f"[INFO] Location Aggregated: {output_path_agg}/")
-    print(f"[INFO] Athena Results: {athena_result_bucket}\n")
-    
-    refined_schema = [
-        {'Name': 'nome_acao', 'Type': 'string'},
-        {'Name': 'abertura', 'Type': 'double'},
-        {'Name': 'fechamento', 'Type': 'double'},
-        {'Name': 'max', 'Type': 'double'},
-        {'Name': 'min', 'Type': 'double'},
-        {'Name': 'volume_negociado', 'Type': 'bigint'},
-        {'Name': 'variacao_pct_dia', 'Type': 'double'},
-        {'Name': 'amplitude_dia', 'Type': 'double'},
-        {'Name': 'media_movel_7d', 'Type': 'double'},
-        {'Name': 'media_movel_14d', 'Type': 'double'},
-        {'Name': 'media_movel_30d', 'Type': 'double'},
-        {'Name': 'volatilidade_7d', 'Type': 'double'},
-        {'Name': 'lag_1d', 'Type': 'double'},
-        {'Name': 'lag_2d', 'Type': 'double'},
-        {'Name': 'lag_3d', 'Type': 'double'},
-    ]
-    
-    aggregated_schema = [
-        {'Name': 'nome_acao', 'Type': 'string'},
-        {'Name': 'preco_medio_mensal', 'Type': 'double'},
-        {'Name': 'preco_minimo_mensal', 'Type': 'double'},
-        {'Name': 'preco_maximo_mensal', 'Type': 'double'},
-        {'Name': 'volume_total_mensal', 'Type': 'bigint'},
-        {'Name': 'volume_medio_diario', 'Type': 'double'},
-        {'Name': 'variacao_media_diaria_pct', 'Type': 'double'},
-        {'Name': 'volatilidade_media_mensal', 'Type': 'double'},
-        {'Name': 'dias_negociacao', 'Type': 'bigint'},
-    ]
-    
-    # Criar/atualizar tabela refined
-    try:
-        glue_client.create_table(
-            DatabaseName=database_name,
-            TableInput={
-                'Name': table_refined,
-                'StorageDescriptor': {
-                    'Columns': refined_schema,
-                    'Location': output_path_refined + '/',
-                    'InputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat',
-                    'OutputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat',
-                    'SerdeInfo': {
-                        'SerializationLibrary': 'org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe'
-                    }
-                },
-                'PartitionKeys': [
-                    {'Name': 'data_pregao', 'Type': 'string'}
-                ],
-                'TableType': 'EXTERNAL_TABLE'
-            }
-        )
-        print(f"[OK] Tabela '{table_refined}' criada no database '{database_name}'")
-    except glue_client.exceptions.AlreadyExistsException:
-        # Tabela existe, tentar atualizar
-        try:
-            glue_client.update_table(
-                DatabaseName=database_name,
-                TableInput={
-                    'Name': table_refined,
-                    'StorageDescriptor': {
-                        'Columns': refined_schema,
-                        'Location': output_path_refined + '/',
-                        'InputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat',
-                        'OutputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat',
-                        'SerdeInfo': {
-                            'SerializationLibrary': 'org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe'
-                        }
-                    },
-                    'PartitionKeys': [
-                        {'Name': 'data_pregao', 'Type': 'string'}
-                    ],
-                    'TableType': 'EXTERNAL_TABLE'
-                }
-            )
-            print(f"[OK] Tabela '{table_refined}' atualizada no database '{database_name}'")
-        except Exception as update_error:
-            print(f"[WARN] Erro ao atualizar tabela: {update_error}")
-            print(f"[INFO] Deletando e recriando tabela '{table_refined}'...")
-            try:
-                glue_client.delete_table(DatabaseName=database_name, Name=table_refined)
-                glue_client.create_table(
-                    DatabaseName=database_name,
-                    TableInput={
-                        'Name': table_refined,
-                        'StorageDescriptor': {
-                            'Columns': refined_schema,
-                            'Location': output_path_refined + '/',
-                            'InputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat',
-                            'OutputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat',
-                            'SerdeInfo': {
-                                'SerializationLibrary': 'org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe'
-                            }
-                        },
-                        'PartitionKeys': [
-                            {'Name': 'data_pregao', 'Type': 'string'}
-                        ],
-                        'TableType': 'EXTERNAL_TABLE'
-                    }
-                )
-                print(f"[OK] Tabela '{table_refined}' recriada com sucesso")
-            except Exception as recreate_error:
-                print(f"[ERROR] Falha ao recriar tabela: {recreate_error}")
-                raise
-    
-    print("[INFO] Descobrindo particoes automaticamente (MSCK REPAIR)...")
     try:
-        # Usar o Athena client para rodar MSCK REPAIR TABLE
-        athena_client = boto3.client('athena')
-        athena_result_bucket = os.environ.get('ATHENA_RESULTS_BUCKET', f's3://{bucket_name}-athena-results/')
+        # Garantir que as locations sejam S3 URIs válidos
+        if not output_path_refined.startswith('s3://'):
+            print(f"[WARN] output_path_refined não é S3 URI: {output_path_refined}")
+            print(f"       Pulando catalogação (apenas para ambiente local)")
+            raise Exception("Catalogacao requer S3 URIs")
         
-        # MSCK REPAIR TABLE para refined_stocks
-        query_refined = f"MSCK REPAIR TABLE {database_name}.{table_refined}"
-        print(f"   Executando: {query_refined}")
+        if not output_path_agg.startswith('s3://'):
+            print(f"[WARN] output_path_agg não é S3 URI: {output_path_agg}")
+            print(f"       Pulando catalogação (apenas para ambiente local)")
+            raise Exception("Catalogacao requer S3 URIs")
         
-        response = athena_client.start_query_execution(
-            QueryString=query_refined,
-            QueryExecutionContext={'Database': database_name},
-            ResultConfiguration={'OutputLocation': athena_result_bucket}
-        )
+        glue_client = glue_client or boto3.client('glue')
+        athena_client = athena_client or boto3.client('athena')
         
-        query_execution_id = response['QueryExecutionId']
-        print(f"   Query ID: {query_execution_id}")
+        database_name = 'default'
+        table_refined = 'refined_stocks'
+        table_aggregated = 'aggregated_stocks_monthly'
         
-        # Aguarda conclusão (timeout de 30s)
-        import time
-        max_wait = 30
-        for i in range(max_wait):
-            status = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
-            state = status['QueryExecution']['Status']['State']
-            
-            if state in ['SUCCEEDED']:
-                print(f"[OK] Partições da tabela refined descobertas automaticamente")
-                break
-            elif state in ['FAILED', 'CANCELLED']:
-                reason = status['QueryExecution']['Status'].get('StateChangeReason', 'Unknown')
-                print(f"[WARN] MSCK REPAIR falhou: {reason}")
-                break
-            
-            time.sleep(1)
-        else:
-            print(f"[WARN] MSCK REPAIR timeout após {max_wait}s")
-            
-    except Exception as e:
-        print(f"[WARN] Erro ao executar MSCK REPAIR para refined: {str(e)}")
-        print("   Tentando registrar partições manualmente...")
+        # Configurar bucket para resultados do Athena
+        # Extrai account_id do bucket_name (formato: ACCOUNT_ID-data-lake-bucket)
+        account_id = bucket_name.split('-')[0] if '-' in bucket_name else 'unknown'
+        athena_result_bucket = os.environ.get('ATHENA_RESULTS_BUCKET', f"s3://{account_id}-athena-results-bucket/")
         
-        # Fallback: registro manual apenas das partições processadas agora
-        try:
-            partitions = df_final.select(['data_pregao']).unique().sort(['data_pregao'])
-            partitions_added = 0
-            
-            for row in partitions.iter_rows(named=True):
-                data_pregao = str(row['data_pregao'])
-                partition_location = f"{output_path_refined}/data_pregao={data_pregao}/"
-                
-                try:
-                    glue_client.create_partition(
-                        DatabaseName=database_name,
-                        TableName=table_refined,
-                        PartitionInput={
-                            'Values': [data_pregao],
-                            'StorageDescriptor': {
-                                'Columns': refined_schema,
-                                'Location': partition_location,
-                                'InputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat',
-                                'OutputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat',
-                                'SerdeInfo': {
-                                    'SerializationLibrary': 'org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe'
-                                }
-                            }
-                        }
-                    )
-                    partitions_added += 1
-                except glue_client.exceptions.AlreadyExistsException:
-                    pass
-            
-            print(f"[OK] {partitions_added} partições registradas manualmente para tabela refined")
-        except Exception as manual_error:
-            print(f"[WARN] Erro no registro manual: {str(manual_error)}")
-    
-    try:
-        glue_client.create_table(
-            DatabaseName=database_name,
-            TableInput={
-                'Name': table_aggregated,
-                'StorageDescriptor': {
-                    'Columns': aggregated_schema,
-                    'Location': output_path_agg + '/',
-                    'InputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat',
-                    'OutputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat',
-                    'SerdeInfo': {
-                        'SerializationLibrary': 'org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe'
-                    }
+        print(f"[INFO] Location Refined: {output_path_refined}/")
+        print(f"[INFO] Location Aggregated: {output_path_agg}/")
+        print(f"[INFO] Athena Results: {athena_result_bucket}")
+        print(f"[INFO] Partition projection: {'sim' if config['partition_projection'] else 'nao'}\n")
+        
+        refined_schema = [
+            {'Name': 'nome_acao', 'Type': 'string'},
+            {'Name': 'abertura', 'Type': 'double'},
+            {'Name': 'fechamento', 'Type': 'double'},
+            {'Name': 'max', 'Type': 'double'},
+            {'Name': 'min', 'Type': 'double'},
+            {'Name': 'volume_negociado', 'Type': 'bigint'},
+            {'Name': 'variacao_pct_dia', 'Type': 'double'},
+            {'Name': 'amplitude_dia', 'Type': 'double'},
+            *[{'Name': feature['name'], 'Type': 'double'} for feature in FEATURES],
+        ]
+        
+        aggregated_schema = [
+            {'Name': 'nome_acao', 'Type': 'string'},
+            {'Name': 'preco_medio_mensal', 'Type': 'double'},
+            {'Name': 'preco_minimo_mensal', 'Type': 'double'},
+            {'Name': 'preco_maximo_mensal', 'Type': 'double'},
+            {'Name': 'volume_total_mensal', 'Type': 'bigint'},
+            {'Name': 'volume_medio_diario', 'Type': 'double'},
+            {'Name': 'variacao_media_diaria_pct', 'Type': 'double'},
+            {'Name': 'volatilidade_media_mensal', 'Type': 'double'},
+            {'Name': 'dias_negociacao', 'Type': 'bigint'},
+        ]
+        
+        # Apenas as particoes gravadas nesta execucao sao registradas (sem MSCK REPAIR);
+        # os comandos das duas tabelas rodam juntos no Athena
+        ctx['catalog'] = catalog_tables(
+            glue_client, athena_client, database_name,
+            [
+                {
+                    'name': table_refined,
+                    'columns': refined_schema,
+                    'location': output_path_refined,
+                    'partition_key': 'data_pregao',
+                    'values': [str(value) for value in ctx['df_final']['data_pregao'].unique().to_list()],
                 },
-                'PartitionKeys': [
-                    {'Name': 'mes_referencia', 'Type': 'string'}
-                ],
-                'TableType': 'EXTERNAL_TABLE'
-            }
-        )
-        print(f"[OK] Tabela '{table_aggregated}' criada no database '{database_name}'")
-    except glue_client.exceptions.AlreadyExistsException:
-        glue_client.update_table(
-            DatabaseName=database_name,
-            TableInput={
-                'Name': table_aggregated,
-                'StorageDescriptor': {
-                    'Columns': aggregated_schema,
-                    'Location': output_path_agg + '/',
-                    'InputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat',
-                    'OutputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat',
-                    'SerdeInfo': {
-                        'SerializationLibrary': 'org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe'
-                    }
+                {
+                    'name': table_aggregated,
+                    'columns': aggregated_schema,
+                    'location': output_path_agg,
+                    'partition_key': 'mes_referencia',
+                    'values': [str(value) for value in ctx['df_agregado']['mes_referencia'].unique().to_list()],
                 },
-                'PartitionKeys': [
-                    {'Name': 'mes_referencia', 'Type': 'string'}
-                ],
-                'TableType': 'EXTERNAL_TABLE'
-            }
+            ],
+            athena_result_bucket, projection=config['partition_projection'],
         )
-        print(f"[OK] Tabela '{table_aggregated}' atualizada no database '{database_name}'")
-    
-    print("[INFO] Descobrindo particoes automaticamente para tabela agregada (MSCK REPAIR)...")
-    try:
-        # MSCK REPAIR TABLE para aggregated_stocks_monthly
-        query_agg = f"MSCK REPAIR TABLE {database_name}.{table_aggregated}"
-        print(f"   Executando: {query_agg}")
         
-        response = athena_client.start_query_execution(
-            QueryString=query_agg,
-            QueryExecutionContext={'Database': database_name},
-            ResultConfiguration={'OutputLocation': athena_result_bucket}
-        )
+        for table_name, entry in ctx['catalog'].items():
+            print(f"   - {table_name}: {entry['partitions']} particao(oes), registro via {entry['method']}")
         
-        query_execution_id = response['QueryExecutionId']
-        print(f"   Query ID: {query_execution_id}")
+        print("\n[OK] Catalogacao concluida com sucesso!\n")
         
-        # Aguarda conclusão
-        for i in range(30):
-            status = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
-            state = status['QueryExecution']['Status']['State']
-            
-            if state == 'SUCCEEDED':
-                print(f"[OK] Partições da tabela agregada descobertas automaticamente")
-                break
-            elif state in ['FAILED', 'CANCELLED']:
-                reason = status['QueryExecution']['Status'].get('StateChangeReason', 'Unknown')
-                print(f"[WARN] MSCK REPAIR falhou: {reason}")
-                break
-            
-            time.sleep(1)
-            
     except Exception as e:
-        print(f"[WARN] Erro ao executar MSCK REPAIR para agregada: {str(e)}")
-        print("   Tentando registrar partições manualmente...")
-        
-        # Fallback: registro manual
-        try:
-            partitions_agg = df_agregado.select(['mes_referencia']).unique().sort(['mes_referencia'])
-            partitions_agg_added = 0
-            
-            for row in partitions_agg.iter_rows(named=True):
-                mes_referencia = str(row['mes_referencia'])
-                partition_location_agg = f"{output_path_agg}/mes_referencia={mes_referencia}/"
-                
-                try:
-                    glue_client.create_partition(
-                        DatabaseName=database_name,
-                        TableName=table_aggregated,
-                        PartitionInput={
-                            'Values': [mes_referencia],
-                            'StorageDescriptor': {
-                                'Columns': aggregated_schema,
-                                'Location': partition_location_agg,
-                                'InputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat',
-                                'OutputFormat': 'org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat',
-                                'SerdeInfo': {
-                                    'SerializationLibrary': 'org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe'
-                                }
-                            }
-                        }
-                    )
-                    partitions_agg_added += 1
-                except glue_client.exceptions.AlreadyExistsException:
-                    pass
-            
-            print(f"[OK] {partitions_agg_added} partições registradas manualmente para tabela agregada")
-        except Exception as manual_error:
-            print(f"[WARN] Erro no registro manual: {str(manual_error)}")
-    
-    print("\n[OK] Catalogacao concluida com sucesso!\n")
-    
-except Exception as e:
-    print(f"[WARN] Erro na catalogacao (nao-bloqueante): {str(e)}\n")
-    print("   (Os dados foram salvos, mas talvez seja necessario executar o Crawler)")
+        print(f"[WARN] Erro na catalogacao (nao-bloqueante): {str(e)}\n")
+        print("   (Os dados foram salvos, mas talvez seja necessario executar o Crawler)")
+
+
+STAGES = {
+    'read': stage_read,
+    'normalize': stage_normalize,
+    'features': stage_features,
+    'write_refined': stage_write_refined,
+    'aggregate': stage_aggregate,
+    'write_agg': stage_write_agg,
+    'catalog': stage_catalog,
+}
+
+DEFAULT_STAGES = list(STAGES)
+
+
+def written_counts(*reports: dict) -> dict:
+    """Soma os relatorios de save_partitioned_by_date (bytes = bytes efetivamente enviados)."""
+    written = [p for report in reports for p in report['partitions'] if p['status'] == 'written']
+    return {
+        'partitions': sum(report['written'] for report in reports),
+        'partitions_skipped': sum(report['skipped'] for report in reports),
+        'partitions_deleted': sum(report['deleted'] for report in reports),
+        'bytes': sum(partition['bytes'] for partition in written),
+    }
+
+
+# Contagens emitidas nas metricas de cada estagio (alem de duracao e pico de memoria);
+# normalize/features so montam o plano lazy e nao tem contagens proprias
+STAGE_COUNTS = {
+    'read': lambda ctx: {'partitions': ctx.get('raw_files', 0)},
+    'write_refined': lambda ctx: {'rows': ctx['df_final'].height,
+                                  **written_counts(ctx['written_refined'])},
+    'aggregate': lambda ctx: {'rows': ctx['df_agregado'].height},
+    'write_agg': lambda ctx: {'rows': ctx['df_agregado'].height,
+                              **written_counts(ctx['written_agg'], ctx['written_state'])},
+    'catalog': lambda ctx: {'partitions': sum(entry['partitions'] for entry in ctx.get('catalog', {}).values())},
+}
+
+
+def run_pipeline(config: dict, stages: list = None, ctx: dict = None) -> dict:
+    """
+    Executa os estagios em ordem, medindo o tempo de cada um. Cada estagio emite
+    um registro de metricas EMF (duracao, pico de memoria e STAGE_COUNTS).
 
-# ============================================================================
-# RESUMO FINAL
-# ============================================================================
+    Args:
+        config: Configuracao do job (build_config)
+        stages: Nomes dos estagios (padrao: todos, ver STAGES); ex.: reagregar sem
+            regravar o refined: ['read', 'normalize', 'features', 'aggregate', 'write_agg']
+        ctx: Contexto de uma execucao anterior para reaproveitar resultados
 
-print("=" * 80)
-print("[OK] TRANSFORMACAO CONCLUIDA COM SUCESSO!")
-print("=" * 80)
-print(f"[INFO] Estatisticas finais:")
-print(f"   - Registros refined:  {df_final.shape[0]:,}")
-print(f"   - Registros agregados: {df_agregado.shape[0]:,}")
-print(f"   - Acoes processadas:  {df_final['nome_acao'].n_unique()}")
-print(f"   - Features criadas:   {df_final.shape[1]}")
-print(f"   - Tabelas catalogadas: refined_stocks, aggregated_stocks_monthly")
-print("=" * 80)
\ No newline at end of file
+    Returns:
+        Contexto com os resultados de cada estagio e ctx['timings'] {estagio: segundos}
+    """
+    ctx = {} if ctx is None else ctx
+    ctx.setdefault('timings', {})
+    ctx['stop'] = False
+
+    for name in stages or DEFAULT_STAGES:
+        started = time.perf_counter()
+        with stage_metrics('transform', name) as metrics:
+            STAGES[name](config, ctx)
+            if not ctx['stop'] and name in STAGE_COUNTS:
+                metrics.update(STAGE_COUNTS[name](ctx))
+        ctx['timings'][name] = round(time.perf_counter() - started, 3)
+        if ctx['stop']:
+            break
+
+    return ctx
+
+
+def print_summary(ctx: dict):
+    """Resumo final da execucao."""
+    df_final = ctx['df_final']
+    print("=" * 80)
+    print("[OK] TRANSFORMACAO CONCLUIDA COM SUCESSO!")
+    print("=" * 80)
+    print(f"[INFO] Estatisticas finais:")
+    print(f"   - Registros refined:  {df_final.shape[0]:,}")
+    print(f"   - Registros agregados: {ctx['df_agregado'].shape[0]:,}")
+    print(f"   - Acoes processadas:  {df_final['nome_acao'].n_unique()}")
+    print(f"   - Features criadas:   {df_final.shape[1]}")
+    print(f"   - Tabelas catalogadas: refined_stocks, aggregated_stocks_monthly")
+    print(f"   - Tempo por estagio:  {', '.join(f'{k}={v}s' for k, v in ctx['timings'].items())}")
+    print("=" * 80)
+
+
+def main(argv: list = None, environ: dict = None) -> dict:
+    """Ponto de entrada do Glue Job (e da execucao local via `python src/transform.py`)."""
+    print("=" * 80)
+    print("INICIANDO TRANSFORMACAO DE DADOS - BLUE CHIPS B3")
+    print(f"Ambiente: {'AWS Glue' if RUNNING_ON_GLUE else 'Local/Container'}")
+    print("=" * 80)
+
+    config = build_config(argv, environ)
+    ctx = run_pipeline(config)
+
+    if not ctx['stop']:
+        print_summary(ctx)
+    return ctx
+
+
+if __name__ == "__main__":
+    main()
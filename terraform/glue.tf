@@ -1,3 +1,8 @@
+locals {
+  # Modulos Python importados pelo transform.py (enviados via --extra-py-files)
+  glue_python_modules = ["object_store.py", "compact_raw.py", "features.py", "aggregates.py", "catalog.py", "metrics.py", "manifest.py", "partition_index.py", "storage_profiles.py"]
+}
+
 # Glue Job - Transform
 resource "aws_glue_job" "transform_job" {
   name              = "transform_job"
@@ -17,6 +22,7 @@ resource "aws_glue_job" "transform_job" {
 
   default_arguments = {
     "--additional-python-modules" = "polars,yfinance"
+    "--extra-py-files"            = join(",", [for module in local.glue_python_modules : "s3://${aws_s3_bucket.source_code_bucket.bucket}/${module}"])
     "--enable-continuous-logs"    = "true"
     "--enable-glue-datacatalog"   = "true"
   }
@@ -62,6 +68,7 @@ resource "aws_iam_policy" "glue_policy" {
         Action = [
           "athena:StartQueryExecution",
           "athena:GetQueryExecution",
+          "athena:BatchGetQueryExecution",
           "athena:GetQueryResults"
         ]
         Effect   = "Allow"
@@ -87,6 +94,64 @@ resource "aws_s3_object" "transform_code" {
   tags   = local.default_tags
 }
 
+resource "aws_s3_object" "transform_modules" {
+  for_each   = toset(local.glue_python_modules)
+  depends_on = [aws_s3_bucket.source_code_bucket]
+
+  bucket = aws_s3_bucket.source_code_bucket.id
+  key    = each.value
+  source = "../src/${each.value}"
+  etag   = filemd5("../src/${each.value}")
+  tags   = local.default_tags
+}
+
+# Glue Job - Compactacao mensal da camada raw (small files)
+resource "aws_glue_job" "compact_raw_job" {
+  name              = "compact_raw_job"
+  description       = "Job responsible to compact closed months of raw daily partitions"
+  role_arn          = aws_iam_role.glue_job_role.arn
+  glue_version      = "5.0"
+  worker_type       = "G.1X"
+  number_of_workers = 2
+  timeout           = 60
+  execution_class   = "STANDARD"
+
+  command {
+    script_location = "s3://${aws_s3_bucket.source_code_bucket.bucket}/compact_raw.py"
+    name            = "glueetl"
+    python_version  = "3"
+  }
+
+  default_arguments = {
+    # boto3 >= 1.36: PUT condicional (IfMatch) do _index.parquet, compartilhado com a Lambda de extracao
+    "--additional-python-modules" = "polars,boto3>=1.36"
+    "--extra-py-files"            = "s3://${aws_s3_bucket.source_code_bucket.bucket}/object_store.py,s3://${aws_s3_bucket.source_code_bucket.bucket}/partition_index.py"
+    "--enable-continuous-logs"    = "true"
+    "--BUCKET_NAME"               = aws_s3_bucket.data_lake_bucket.bucket
+    "--INPUT_PREFIX"              = "raw/"
+    "--GRANULARITY"               = "month"
+  }
+
+  execution_property {
+    max_concurrent_runs = 1
+  }
+
+  tags = local.default_tags
+}
+
+# Roda no dia 2 de cada mes (06:00 UTC), longe da janela diaria do transform
+resource "aws_glue_trigger" "compact_raw_monthly" {
+  name     = "compact_raw_monthly"
+  type     = "SCHEDULED"
+  schedule = "cron(0 6 2 * ? *)"
+
+  actions {
+    job_name = aws_glue_job.compact_raw_job.name
+  }
+
+  tags = local.default_tags
+}
+
 # Crawler para catalogar automaticamente os dados refinados no Glue Catalog
 resource "aws_glue_crawler" "refined_crawler" {
   name          = "refined_crawler"
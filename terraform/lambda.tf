@@ -8,8 +8,22 @@ data "archive_file" "extract_lambda_zip" {
 # Zip da função de Gatilho
 data "archive_file" "trigger_lambda_zip" {
   type        = "zip"
-  source_file = "../functions/trigger_glue.py"
   output_path = "../functions/trigger_glue.zip"
+
+  source {
+    content  = file("../functions/trigger_glue.py")
+    filename = "trigger_glue.py"
+  }
+
+  source {
+    content  = file("../src/metrics.py")
+    filename = "metrics.py"
+  }
+
+  source {
+    content  = file("../src/object_store.py")
+    filename = "object_store.py"
+  }
 }
 
 # IAM Roles e Policies 
@@ -56,6 +70,7 @@ resource "aws_iam_policy" "lambda_policy" {
         Action = [
           "s3:PutObject",
           "s3:GetObject",
+          "s3:DeleteObject",
           "s3:ListBucket"
         ]
         # Dá permissão para ler/escrever no bucket do Data Lake
@@ -112,7 +127,8 @@ resource "aws_lambda_function" "s3_trigger_glue" {
 
   environment {
     variables = {
-      GLUE_JOB_NAME = aws_glue_job.transform_job.name
+      GLUE_JOB_NAME        = aws_glue_job.transform_job.name
+      TRIGGER_QUEUE_BUCKET = aws_s3_bucket.data_lake_bucket.bucket
     }
   }
 
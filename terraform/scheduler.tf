@@ -23,4 +23,35 @@ resource "aws_lambda_permission" "allow_cloudwatch_extract" {
   function_name = aws_lambda_function.extract_lambda.function_name
   principal     = "events.amazonaws.com"
   source_arn    = aws_cloudwatch_event_rule.daily_etl_trigger.arn
-}
\ No newline at end of file
+}
+
+# 4. Fim do transform_job: a Lambda de gatilho drena a fila de disparos recebidos durante a execucao
+resource "aws_cloudwatch_event_rule" "transform_job_finished" {
+  name        = "b3_transform_job_finished"
+  description = "Aciona a trigger_glue quando o transform_job termina (drena a fila de disparos)"
+  event_pattern = jsonencode({
+    source        = ["aws.glue"]
+    "detail-type" = ["Glue Job State Change"]
+    detail = {
+      jobName = [aws_glue_job.transform_job.name]
+      state   = ["SUCCEEDED", "FAILED", "TIMEOUT", "STOPPED"]
+    }
+  })
+  tags = local.default_tags
+
+  depends_on = [aws_iam_policy_attachment.github_actions_deploy_attachment]
+}
+
+resource "aws_cloudwatch_event_target" "drain_trigger_queue_target" {
+  rule      = aws_cloudwatch_event_rule.transform_job_finished.name
+  target_id = "DrainTriggerQueue"
+  arn       = aws_lambda_function.s3_trigger_glue.arn
+}
+
+resource "aws_lambda_permission" "allow_cloudwatch_trigger" {
+  statement_id  = "AllowExecutionFromCloudWatchTrigger"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.s3_trigger_glue.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.transform_job_finished.arn
+}
@@ -0,0 +1,74 @@
+"""
+Testes da agregação mensal incremental (src/aggregates.py + INCREMENTAL_AGG no transform.py).
+"""
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from test_compact_raw import assert_same_outputs
+from test_transform_smoke import create_mock_raw_data, run_transform_local
+
+
+def test_incremental_agg_matches_full_rebuild():
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        raw_dir = tmp_dir / 'raw'
+        raw_dir.mkdir()
+        create_mock_raw_data(str(raw_dir), periods=75)
+        
+        full_dir = tmp_dir / 'full'
+        full_dir.mkdir()
+        run_transform_local(str(raw_dir), str(full_dir))
+        
+        # Simula os pregões ainda não extraídos: as últimas 4 partições chegam uma por dia
+        pending_dir = tmp_dir / 'pending'
+        pending_dir.mkdir()
+        pending = sorted(raw_dir.iterdir())[-4:]
+        for partition in pending:
+            shutil.move(str(partition), pending_dir / partition.name)
+        
+        daily_dir = tmp_dir / 'daily'
+        daily_dir.mkdir()
+        run_transform_local(str(raw_dir), str(daily_dir))
+        
+        for partition in pending:
+            shutil.move(str(pending_dir / partition.name), raw_dir / partition.name)
+            day = partition.name.split('=')[1]
+            
+            agg_before = {p.name: p.stat().st_mtime_ns for p in (daily_dir / 'agg').glob('mes_referencia=*')}
+            stdout = run_transform_local(str(raw_dir), str(daily_dir),
+                                         {'PROCESS_DATE': day, 'INCREMENTAL_AGG': 'true'})
+            agg_after = {p.name: p.stat().st_mtime_ns for p in (daily_dir / 'agg').glob('mes_referencia=*')}
+            
+            current_month = f"mes_referencia={day[:8]}01"
+            assert {name for name in agg_after if agg_after[name] != agg_before.get(name)} == {current_month}
+            if not day.endswith('-01'):
+                assert 'Agregacao incremental: somando' in stdout
+        
+        assert_same_outputs(full_dir, daily_dir)
+
+
+def test_incremental_agg_falls_back_when_reprocessing_a_day():
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        raw_dir = tmp_dir / 'raw'
+        raw_dir.mkdir()
+        create_mock_raw_data(str(raw_dir), periods=40)
+        day = sorted(p.name.split('=')[1] for p in raw_dir.iterdir())[-1]
+        
+        full_dir = tmp_dir / 'full'
+        full_dir.mkdir()
+        run_transform_local(str(raw_dir), str(full_dir))
+        
+        # O estado já contém o dia: somar de novo duplicaria as linhas
+        stdout = run_transform_local(str(raw_dir), str(full_dir),
+                                     {'PROCESS_DATE': day, 'INCREMENTAL_AGG': 'true'})
+        assert 'recalculando os meses' in stdout
+        
+        rebuild_dir = tmp_dir / 'rebuild'
+        rebuild_dir.mkdir()
+        run_transform_local(str(raw_dir), str(rebuild_dir))
+        assert_same_outputs(rebuild_dir, full_dir)
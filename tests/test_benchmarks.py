@@ -0,0 +1,78 @@
+"""
+Testes da suite de benchmarks (benchmarks/run_benchmarks.py): comparacao com
+baseline e execucao da config pequena contra o baseline versionado.
+
+A comparacao de tempo e pico de RSS com o baseline (gravado em uma maquina de
+1 CPU) so roda com BENCH_THRESHOLD definido, ex: BENCH_THRESHOLD=3 pytest tests/test_benchmarks.py
+"""
+import json
+import os
+import sys
+from pathlib import Path
+
+import polars as pl
+import pytest
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+from run_benchmarks import compare_to_baseline, run_benchmarks
+from synthetic import SCHEMAS, generate_raw_dataset
+
+BASELINE = ROOT / 'benchmarks' / 'baselines' / 'small.json'
+
+
+def report(seconds: float, rss: float) -> dict:
+    return {'results': {'long': {'stages': {'read': {'seconds': seconds, 'peak_rss_mb': rss, 'bytes': 0}}}}}
+
+
+def test_compare_to_baseline_flags_only_real_regressions():
+    baseline = report(2.0, 200.0)
+
+    assert compare_to_baseline(report(4.0, 300.0), baseline, threshold=2.0) == []
+    # Tempos curtos: a folga absoluta evita falso positivo
+    assert compare_to_baseline(report(0.3, 200.0), report(0.01, 200.0), threshold=2.0) == []
+
+    regressions = compare_to_baseline(report(5.0, 500.0), baseline, threshold=2.0)
+    assert [(r['stage'], r['metric']) for r in regressions] == [('read', 'seconds'), ('read', 'peak_rss_mb')]
+
+
+def test_synthetic_schemas_hold_same_prices(tmp_path):
+    frames = {}
+    for schema in SCHEMAS:
+        stats = generate_raw_dataset(str(tmp_path / schema), tickers=3, years=0.05, schema=schema)
+        assert stats['partitions'] == len(list((tmp_path / schema).glob('*/data.parquet')))
+        frames[schema] = stats['rows']
+    assert len(set(frames.values())) == 1
+
+    long = pl.read_parquet(tmp_path / 'long' / '*' / 'data.parquet')
+    canonical = pl.read_parquet(tmp_path / 'canonical' / '*' / 'data.parquet')
+    assert long.select(canonical.columns).sort(['Date', 'Ticker']).equals(canonical.sort(['Date', 'Ticker']))
+
+
+@pytest.fixture(scope='module')
+def small_run():
+    """Config pequena do baseline versionado, executada uma vez para os testes do modulo."""
+    baseline = json.loads(BASELINE.read_text())
+    config = baseline['config']
+    current = run_benchmarks(config['tickers'], config['years'], config['schemas'],
+                             config['extract_days'], config['seed'])
+    return current, baseline
+
+
+def test_small_benchmark_matches_baseline_outputs(small_run):
+    current, baseline = small_run
+    for variant, result in current['results'].items():
+        expected = baseline['results'][variant]
+        assert result['rows'] == expected['rows']
+        # Bytes dependem so dos dados (semente fixa) e do codec do Polars
+        for stage in ('read', 'write_refined', 'write_agg'):
+            if stage in result['stages']:
+                assert result['stages'][stage]['bytes'] > 0
+
+
+@pytest.mark.skipif(not os.environ.get('BENCH_THRESHOLD'),
+                    reason="comparacao de tempo/RSS com o baseline: defina BENCH_THRESHOLD")
+def test_small_benchmark_within_baseline_threshold(small_run):
+    current, baseline = small_run
+    assert compare_to_baseline(current, baseline, float(os.environ['BENCH_THRESHOLD'])) == []
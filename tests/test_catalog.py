@@ -0,0 +1,228 @@
+"""
+Testes da catalogação (src/catalog.py) com stubs dos clientes Glue e Athena.
+"""
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+import catalog
+
+
+class AlreadyExistsException(Exception):
+    pass
+
+
+class FakeGlueClient:
+    """Stub do cliente Glue: tabelas e partições em memória."""
+
+    class exceptions:
+        AlreadyExistsException = AlreadyExistsException
+
+    def __init__(self, page_size=2, transient_failures=0):
+        self.tables = {}
+        self.partitions = {}
+        self.calls = []
+        self.batches = []
+        self.page_size = page_size
+        self.transient_failures = transient_failures
+        self.failed = {}
+        self.lock = threading.Lock()
+
+    def create_table(self, DatabaseName, TableInput):
+        self.calls.append('create_table')
+        if TableInput['Name'] in self.tables:
+            raise AlreadyExistsException(TableInput['Name'])
+        self.tables[TableInput['Name']] = TableInput
+
+    def update_table(self, DatabaseName, TableInput):
+        self.calls.append('update_table')
+        self.tables[TableInput['Name']] = TableInput
+
+    def delete_table(self, DatabaseName, Name):
+        self.tables.pop(Name, None)
+
+    def create_partition(self, DatabaseName, TableName, PartitionInput):
+        self.calls.append('create_partition')
+        key = (TableName, tuple(PartitionInput['Values']))
+        if key in self.partitions:
+            raise AlreadyExistsException(str(key))
+        self.partitions[key] = PartitionInput
+
+
+    def get_partitions(self, DatabaseName, TableName, ExcludeColumnSchema, NextToken=None):
+        self.calls.append('get_partitions')
+        values = sorted(values for table, values in self.partitions if table == TableName)
+        start = int(NextToken or 0)
+        page = values[start:start + self.page_size]
+        response = {'Partitions': [{'Values': list(v)} for v in page]}
+        if start + self.page_size < len(values):
+            response['NextToken'] = str(start + self.page_size)
+        return response
+
+    def batch_create_partition(self, DatabaseName, TableName, PartitionInputList):
+        """Cada partição falha `transient_failures` vezes com erro interno antes de ser criada."""
+        with self.lock:
+            self.batches.append([item['Values'][0] for item in PartitionInputList])
+            errors = []
+            for item in PartitionInputList:
+                key = (TableName, tuple(item['Values']))
+                if key in self.partitions:
+                    errors.append({'PartitionValues': item['Values'],
+                                   'ErrorDetail': {'ErrorCode': 'AlreadyExistsException'}})
+                elif self.failed.get(key, 0) < self.transient_failures:
+                    self.failed[key] = self.failed.get(key, 0) + 1
+                    errors.append({'PartitionValues': item['Values'],
+                                   'ErrorDetail': {'ErrorCode': 'InternalServiceException'}})
+                else:
+                    self.partitions[key] = item
+            return {'Errors': errors}
+
+
+class FakeAthenaClient:
+    """Stub do Athena: cada query termina em `state` após `polls` consultas de status."""
+
+    def __init__(self, state='SUCCEEDED', polls=1):
+        self.state = state
+        self.polls = polls
+        self.queries = []
+        self.events = []
+        self.seen = {}
+
+    def start_query_execution(self, QueryString, QueryExecutionContext, ResultConfiguration):
+        self.queries.append(QueryString)
+        self.events.append('start')
+        return {'QueryExecutionId': f'q-{len(self.queries)}'}
+
+    def batch_get_query_execution(self, QueryExecutionIds):
+        self.events.append('poll')
+        executions = []
+        for query_id in QueryExecutionIds:
+            self.seen[query_id] = self.seen.get(query_id, 0) + 1
+            polls = self.polls(query_id) if callable(self.polls) else self.polls
+            state = self.state if self.seen[query_id] >= polls else 'RUNNING'
+            executions.append({'QueryExecutionId': query_id,
+                               'Status': {'State': state, 'StateChangeReason': 'stub'}})
+        return {'QueryExecutions': executions}
+
+
+def table(name='refined_stocks', values=('2024-01-02',), location='s3://bucket/refined', key='data_pregao'):
+    return {'name': name, 'columns': COLUMNS, 'location': location, 'partition_key': key, 'values': list(values)}
+
+
+COLUMNS = [{'Name': 'nome_acao', 'Type': 'string'}]
+LOCATION = 's3://bucket/refined'
+
+
+def test_registers_only_written_partitions_without_msck():
+    glue, athena = FakeGlueClient(), FakeAthenaClient()
+    values = ['2024-01-03', '2024-01-02', '2024-01-03']
+
+    report = catalog.catalog_tables(glue, athena, 'default', [table(values=values)], 's3://results/')
+
+    assert len(athena.queries) == 1
+    query = athena.queries[0]
+    assert 'MSCK' not in query
+    assert query.startswith('ALTER TABLE default.refined_stocks ADD IF NOT EXISTS')
+    assert query.count('PARTITION (') == 2
+    assert f"LOCATION '{LOCATION}/data_pregao=2024-01-02/'" in query
+    assert 'create_partition' not in glue.calls
+    assert report['refined_stocks']['method'] == 'athena'
+    assert report['refined_stocks']['queries'][0]['state'] == 'SUCCEEDED'
+
+
+def test_add_partition_queries_are_chunked():
+    values = [f'2024-01-{day:02d}' for day in range(1, 11)]
+
+    queries = catalog.add_partition_queries('default', 't', LOCATION, 'data_pregao', values, chunk_size=4)
+
+    assert len(queries) == 3
+    assert [q.count('PARTITION (') for q in queries] == [4, 4, 2]
+
+
+def test_falls_back_to_glue_api_when_athena_fails():
+    glue, athena = FakeGlueClient(), FakeAthenaClient(state='FAILED')
+    glue.partitions[('refined_stocks', ('2024-01-02',))] = {}
+
+    report = catalog.register_partitions(glue, athena, 'default', [table(values=['2024-01-02', '2024-01-03'])],
+                                         's3://results/')
+
+    assert ('refined_stocks', ('2024-01-03',)) in glue.partitions
+    assert glue.partitions[('refined_stocks', ('2024-01-03',))]['StorageDescriptor']['Location'] == \
+        f"{LOCATION}/data_pregao=2024-01-03/"
+    assert glue.batches == [['2024-01-03']]
+    assert report['refined_stocks']['method'] == 'glue'
+    assert report['refined_stocks']['glue'] == {'created': 1, 'skipped': 1, 'failed': []}
+
+
+def test_batch_registration_skips_existing_and_retries_only_failures():
+    glue = FakeGlueClient(transient_failures=1)
+    values = [f'2023-{month:02d}-{day:02d}' for month in range(1, 13) for day in range(1, 26)]
+    for value in values[:5]:
+        glue.partitions[('refined_stocks', (value,))] = {}
+
+    summary = catalog.create_partitions_glue(glue, 'default', 'refined_stocks', COLUMNS, LOCATION,
+                                             'data_pregao', values, batch_size=100, max_workers=3,
+                                             backoff_seconds=0)
+
+    assert summary == {'created': len(values) - 5, 'skipped': 5, 'failed': []}
+    assert glue.calls.count('get_partitions') == 3
+    assert 'create_partition' not in glue.calls
+    assert all(len(batch) <= 100 for batch in glue.batches)
+    # Cada entrada falha uma vez: o retry reenvia só as que falharam
+    assert sum(len(batch) for batch in glue.batches) == 2 * (len(values) - 5)
+    assert all(('refined_stocks', (v,)) in glue.partitions for v in values)
+
+
+def test_batch_registration_reports_persistent_failures():
+    glue = FakeGlueClient(transient_failures=10)
+
+    summary = catalog.create_partitions_glue(glue, 'default', 'refined_stocks', COLUMNS, LOCATION,
+                                             'data_pregao', ['2024-01-02'], max_retries=2, backoff_seconds=0)
+
+    assert summary == {'created': 0, 'skipped': 0, 'failed': [['2024-01-02']]}
+    assert len(glue.batches) == 3
+
+
+def test_partition_projection_skips_registration():
+    glue, athena = FakeGlueClient(), FakeAthenaClient()
+    glue.tables['aggregated_stocks_monthly'] = {}
+
+    catalog.catalog_tables(glue, athena, 'default',
+                           [table('aggregated_stocks_monthly', ['2024-01-01'], 's3://bucket/agg', 'mes_referencia')],
+                           's3://results/', projection=True)
+
+    parameters = glue.tables['aggregated_stocks_monthly']['Parameters']
+    assert parameters['projection.enabled'] == 'true'
+    assert parameters['projection.mes_referencia.interval.unit'] == 'MONTHS'
+    assert parameters['storage.location.template'] == 's3://bucket/agg/mes_referencia=${mes_referencia}/'
+    assert glue.calls == ['create_table', 'update_table']
+    assert athena.queries == []
+
+
+def test_queries_for_both_tables_are_submitted_and_awaited_together():
+    athena = FakeAthenaClient(polls=lambda query_id: 3 if query_id == 'q-2' else 1)
+
+    report = catalog.register_partitions(
+        FakeGlueClient(), athena, 'default',
+        [table(), table('aggregated_stocks_monthly', ['2024-01-01'], 's3://bucket/agg', 'mes_referencia')],
+        's3://results/',
+    )
+
+    # Ambas as queries sao submetidas antes da primeira consulta de status
+    assert athena.events[:3] == ['start', 'start', 'poll']
+    assert athena.events.count('poll') == 3
+    assert [entry['method'] for entry in report.values()] == ['athena', 'athena']
+
+
+def test_run_athena_queries_reports_timeout_and_failures():
+    athena = FakeAthenaClient(state='FAILED', polls=lambda query_id: 1 if query_id == 'q-1' else 10 ** 6)
+
+    results = catalog.run_athena_queries(athena, ['SELECT 1', 'SELECT 2'], 'default', 's3://results/',
+                                         timeout=0.05, initial_delay=0.01, max_delay=0.01)
+
+    assert [r['state'] for r in results] == ['FAILED', 'TIMEOUT']
+    assert results[0]['reason'] == 'stub'
+    assert results[0]['query_id'] == 'q-1'
+    assert all(r['seconds'] is not None for r in results)
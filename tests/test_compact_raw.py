@@ -0,0 +1,192 @@
+"""
+Testes da compactação da camada RAW (src/compact_raw.py) e da leitura
+transparente de arquivos compactados + diários pelo transform.py.
+"""
+import json
+import sys
+import tempfile
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from compact_raw import compact_raw, COMPACTED_DIR, COMPACTED_MANIFEST
+from object_store import LocalBackend
+from partition_index import INDEX_FILE, index_entry, update_index
+from test_transform_smoke import create_mock_raw_data, run_transform_local
+
+
+def read_layer(bucket_dir: Path, layer: str) -> dict:
+    """Lê todas as partições de uma camada de saída do transform."""
+    return {
+        p.name: pd.read_parquet(p / 'data.parquet')
+        for p in sorted((bucket_dir / layer).glob('*=*'))
+    }
+
+
+def assert_same_outputs(expected_dir: Path, result_dir: Path):
+    for layer in ['refined', 'agg']:
+        expected = read_layer(expected_dir, layer)
+        result = read_layer(result_dir, layer)
+        assert list(result) == list(expected)
+        for partition in expected:
+            pd.testing.assert_frame_equal(result[partition], expected[partition])
+
+
+def test_compaction_keeps_transform_outputs_identical():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = Path(tmp_dir) / 'raw'
+        raw_dir.mkdir()
+        create_mock_raw_data(str(raw_dir), periods=90)
+        last_date = max(p.name.split('=')[1] for p in raw_dir.iterdir())
+        
+        before_dir = Path(tmp_dir) / 'before'
+        before_dir.mkdir()
+        run_transform_local(str(raw_dir), str(before_dir))
+        
+        summary = compact_raw(str(raw_dir), today=date.fromisoformat(last_date))
+        
+        manifest = json.loads((raw_dir / COMPACTED_DIR / COMPACTED_MANIFEST).read_text())
+        assert sorted(manifest['periods']) == summary['periods']
+        assert last_date[:7] not in manifest['periods']
+        
+        # Carência: as diárias substituídas continuam no bucket até a próxima compactação
+        assert summary['deleted_files'] == 0
+        assert len(manifest['superseded']) == summary['source_files']
+        assert all((raw_dir / key).exists() for key in manifest['superseded'])
+        
+        after_dir = Path(tmp_dir) / 'after'
+        after_dir.mkdir()
+        run_transform_local(str(raw_dir), str(after_dir))
+        assert_same_outputs(before_dir, after_dir)
+        
+        summary = compact_raw(str(raw_dir), today=date.fromisoformat(last_date))
+        assert summary['periods'] == [] and summary['deleted_files'] == len(manifest['superseded'])
+        assert json.loads((raw_dir / COMPACTED_DIR / COMPACTED_MANIFEST).read_text())['superseded'] == []
+        daily_left = sorted(p.name for p in raw_dir.iterdir() if p.is_dir() and p.name != COMPACTED_DIR)
+        assert daily_left and all(name.split('=')[1][:7] == last_date[:7] for name in daily_left)
+        
+        cleaned_dir = Path(tmp_dir) / 'cleaned'
+        cleaned_dir.mkdir()
+        run_transform_local(str(raw_dir), str(cleaned_dir))
+        assert_same_outputs(before_dir, cleaned_dir)
+        
+        # Leitura por período também enxerga o histórico compactado (aquecimento)
+        first_daily = daily_left[0].split('=')[1]
+        incremental_dir = Path(tmp_dir) / 'incremental'
+        incremental_dir.mkdir()
+        run_transform_local(str(raw_dir), str(incremental_dir), {'PROCESS_DATE': first_daily})
+        refined = read_layer(incremental_dir, 'refined')
+        assert list(refined) == [f"data_pregao={first_daily}"]
+        pd.testing.assert_frame_equal(refined[f"data_pregao={first_daily}"],
+                                      read_layer(before_dir, 'refined')[f"data_pregao={first_daily}"])
+
+
+def test_recompaction_folds_late_daily_partition():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = Path(tmp_dir) / 'raw'
+        raw_dir.mkdir()
+        create_mock_raw_data(str(raw_dir), periods=60)
+        next_year = date(int(max(p.name.split('=')[1] for p in raw_dir.iterdir())[:4]) + 1, 1, 1)
+        
+        compact_raw(str(raw_dir), today=next_year, granularity='year')
+        manifest = json.loads((raw_dir / COMPACTED_DIR / COMPACTED_MANIFEST).read_text())
+        period, entry = next(iter(manifest['periods'].items()))
+        
+        # Reextração de um dia já compactado: volta como partição diária
+        day = entry['dates'][0]
+        late = pd.read_parquet(raw_dir / entry['path'])
+        late = late[pd.to_datetime(late['Date']).dt.strftime('%Y-%m-%d') == day].copy()
+        late['Close'] = 999.0
+        (raw_dir / day).mkdir()
+        late.to_parquet(raw_dir / day / 'data.parquet', index=False)
+        
+        summary = compact_raw(str(raw_dir), today=next_year, granularity='year')
+        
+        assert summary['periods'] == [period]
+        assert (raw_dir / day).exists() and (raw_dir / entry['path']).exists()
+        
+        # Os substituídos pela recompactação saem na execução seguinte
+        compact_raw(str(raw_dir), today=next_year, granularity='year')
+        assert not (raw_dir / day).exists()
+        assert not (raw_dir / entry['path']).exists()
+        manifest = json.loads((raw_dir / COMPACTED_DIR / COMPACTED_MANIFEST).read_text())
+        compacted = pd.read_parquet(raw_dir / manifest['periods'][period]['path'])
+        assert len(compacted) == entry['rows']
+        on_day = compacted[pd.to_datetime(compacted['Date']).dt.strftime('%Y-%m-%d') == day]
+        assert (on_day['Close'] == 999.0).all()
+
+
+def test_reextracted_day_wins_over_compacted_month():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = Path(tmp_dir) / 'raw'
+        raw_dir.mkdir()
+        create_mock_raw_data(str(raw_dir), periods=90)
+        last_date = max(p.name.split('=')[1] for p in raw_dir.iterdir())
+        compact_raw(str(raw_dir), today=date.fromisoformat(last_date))
+        
+        manifest = json.loads((raw_dir / COMPACTED_DIR / COMPACTED_MANIFEST).read_text())
+        entry = manifest['periods'][max(manifest['periods'])]
+        day = entry['dates'][-1]
+        
+        # Reextração de um dia do mês compactado (como o extract.py: arquivo diário + índice)
+        late = pd.read_parquet(raw_dir / entry['path'])
+        late = late[pd.to_datetime(late['Date']).dt.strftime('%Y-%m-%d') == day].copy()
+        late['Close'] = 999.0
+        (raw_dir / day).mkdir()
+        late.to_parquet(raw_dir / day / 'data.parquet', index=False)
+        update_index(LocalBackend(raw_dir), '', [index_entry(day, f"{day}/data.parquet", len(late))])
+        
+        for name in ['indexed', 'listed']:
+            if name == 'listed':
+                (raw_dir / INDEX_FILE).unlink()
+            output_dir = Path(tmp_dir) / name
+            output_dir.mkdir()
+            run_transform_local(str(raw_dir), str(output_dir), {'PROCESS_DATE': day})
+            refined = read_layer(output_dir, 'refined')[f"data_pregao={day}"]
+            assert (refined['fechamento'] == 999.0).all()
+
+
+def test_compaction_mixes_naive_and_tz_aware_dates():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = Path(tmp_dir) / 'raw'
+        # yf.download grava Date sem timezone; o fallback yf.Ticker().history, com timezone
+        download = pd.DataFrame({'Date': pd.to_datetime(['2024-02-01']), 'Ticker': ['ITUB4.SA'],
+                                 'Open': [30.0], 'High': [31.0], 'Low': [29.0], 'Close': [30.5], 'Volume': [100]})
+        history = download.assign(Date=pd.to_datetime(['2024-02-02']).tz_localize('America/Sao_Paulo'), Close=[31.5])
+        for day, df in [('2024-02-01', download), ('2024-02-02', history)]:
+            (raw_dir / day).mkdir(parents=True)
+            df.to_parquet(raw_dir / day / 'data.parquet', index=False)
+        
+        summary = compact_raw(str(raw_dir), today=date(2024, 3, 1))
+        
+        assert summary['periods'] == ['2024-02']
+        manifest = json.loads((raw_dir / COMPACTED_DIR / COMPACTED_MANIFEST).read_text())
+        compacted = pd.read_parquet(raw_dir / manifest['periods']['2024-02']['path'])
+        assert [str(day) for day in compacted['Date']] == ['2024-02-01', '2024-02-02']
+        assert compacted['Close'].tolist() == [30.5, 31.5]
+
+
+def test_paths_resolved_before_compaction_stay_readable():
+    import polars as pl
+    import transform
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = Path(tmp_dir) / 'raw'
+        raw_dir.mkdir()
+        create_mock_raw_data(str(raw_dir), periods=60)
+        last_date = max(p.name.split('=')[1] for p in raw_dir.iterdir())
+        
+        # Transform em andamento: caminhos resolvidos antes da troca de layout
+        paths = sorted(set(transform.list_raw_partitions(str(raw_dir)).values()))
+        compact_raw(str(raw_dir), today=date.fromisoformat(last_date))
+        assert pl.scan_parquet(paths).select(pl.len()).collect().item() == 120
+        
+        # Sem índice, a listagem ignora as diárias já compactadas que aguardam remoção
+        (raw_dir / INDEX_FILE).unlink()
+        partitions = transform.list_raw_partitions(str(raw_dir))
+        compacted = {day for day, path in partitions.items() if COMPACTED_DIR in path}
+        assert compacted and all(day.strftime('%Y-%m') < last_date[:7] for day in compacted)
+        assert all(day.strftime('%Y-%m') == last_date[:7] for day in set(partitions) - compacted)
@@ -0,0 +1,90 @@
+"""
+Testes do cache em disco das respostas do yfinance (src/download_cache.py).
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, str(Path(__file__).parent.parent / 'functions'))
+
+import extract
+from download_cache import DownloadCache, open_cache
+from test_extract_download import FakeYahoo
+from test_extract_write import create_yfinance_like_frame
+
+
+def test_cache_round_trips_multiindex_frame():
+    df = create_yfinance_like_frame()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = DownloadCache(tmp_dir)
+        assert cache.get('ITUB4.SA', '1d', '2024-01-02', '2024-01-07') is None
+
+        cache.put('ITUB4.SA', '1d', '2024-01-02', '2024-01-07', df)
+        cached = cache.get('ITUB4.SA', '1d', '2024-01-02', '2024-01-07')
+
+        assert cached.columns.equals(df.columns)
+        pd.testing.assert_frame_equal(cached, df, check_dtype=False)
+        assert cache.stats == {'hits': 1, 'misses': 1, 'writes': 1, 'evictions': 0}
+
+
+def test_cache_skips_empty_and_expires_entries():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = DownloadCache(tmp_dir, ttl_seconds=60)
+        cache.put('A.SA', '1d', '2024-01-02', '2024-01-03', pd.DataFrame())
+        assert list(Path(tmp_dir).glob('*')) == []
+
+        cache.put('A.SA', '1d', '2024-01-02', '2024-01-03', pd.DataFrame({'Close': [1.0]}))
+        path = cache.path('A.SA', '1d', '2024-01-02', '2024-01-03')
+        old = time.time() - 120
+        os.utime(path, (old, old))
+
+        assert cache.get('A.SA', '1d', '2024-01-02', '2024-01-03') is None
+        assert not path.exists()
+        assert cache.stats['evictions'] == 1
+
+
+def test_cache_evicts_oldest_entries_above_max_bytes():
+    frame = pd.DataFrame({'Close': [float(i) for i in range(1000)]})
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = DownloadCache(tmp_dir)
+        for i, ticker in enumerate(['A.SA', 'B.SA', 'C.SA']):
+            cache.put(ticker, '1d', '2024-01-02', '2024-01-03', frame)
+            stamp = time.time() - 100 + i
+            os.utime(cache.path(ticker, '1d', '2024-01-02', '2024-01-03'), (stamp, stamp))
+
+        size = cache.path('A.SA', '1d', '2024-01-02', '2024-01-03').stat().st_size
+        cache.max_bytes = 2 * size
+        cache.evict()
+
+        assert sorted(p.name.split('_')[0] for p in Path(tmp_dir).glob('*.parquet')) == ['B.SA', 'C.SA']
+
+
+def test_download_all_tickers_reads_cache_before_downloading():
+    tickers = ['A.SA', 'B.SA']
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = DownloadCache(tmp_dir)
+        first_fake = FakeYahoo()
+        first, _ = extract.download_all_tickers(tickers, '2024-01-02', '2024-01-04', downloader=first_fake,
+                                                batch_downloader=None, rate_per_second=0, cache=cache)
+
+        second_fake = FakeYahoo()
+        second, report = extract.download_all_tickers(tickers, '2024-01-02', '2024-01-04', downloader=second_fake,
+                                                      batch_downloader=None, rate_per_second=0, cache=cache)
+
+        assert sorted(first_fake.calls) == tickers
+        assert second_fake.calls == []
+        assert {result['method'] for result in report.values()} == {'cache'}
+        assert cache.stats == {'hits': 2, 'misses': 2, 'writes': 2, 'evictions': 0}
+        pd.testing.assert_frame_equal(second, first, check_dtype=False)
+
+
+def test_open_cache_reads_environment():
+    assert open_cache({'DOWNLOAD_CACHE_DIR': 'off'}) is None
+    cache = open_cache({'DOWNLOAD_CACHE_DIR': '/tmp/x', 'DOWNLOAD_CACHE_TTL_SECONDS': '10',
+                        'DOWNLOAD_CACHE_MAX_MB': '1'})
+    assert (cache.directory, cache.ttl_seconds, cache.max_bytes) == (Path('/tmp/x'), 10.0, 1024 * 1024)
@@ -0,0 +1,128 @@
+"""
+Testes do modo backfill do extract.py (pedaços mensais retomáveis) com um
+downloader falso no lugar do Yahoo Finance.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, str(Path(__file__).parent.parent / 'functions'))
+
+import extract
+import trigger_glue
+from object_store import LocalBackend
+
+
+class FakeYahoo:
+    """Downloader local com data final exclusiva (como o yfinance)."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, ticker, start_date, end_date):
+        with self.lock:
+            self.calls.append((ticker, start_date, end_date))
+        if (ticker, start_date) in self.failing:
+            raise ConnectionError("Yahoo indisponivel")
+        dates = pd.bdate_range(start_date, end_date, inclusive='left')
+        return pd.DataFrame({
+            'Date': dates, 'Close': 10.0, 'High': 11.0, 'Low': 9.0,
+            'Open': 10.0, 'Volume': 1000, 'Ticker': ticker,
+        })
+
+
+def backfill(backend, fake, **kwargs):
+    return extract.run_backfill(backend, 'raw', '2023-11-15', '2024-02-10', tickers=['A.SA', 'B.SA'],
+                                downloader=fake, batch_downloader=None, rate_per_second=0, **kwargs)
+
+
+def test_month_chunks_split_calendar_months():
+    assert extract.month_chunks('2023-11-15', '2024-02-10') == [
+        ('2023-11-15', '2023-11-30'),
+        ('2023-12-01', '2023-12-31'),
+        ('2024-01-01', '2024-01-31'),
+        ('2024-02-01', '2024-02-10'),
+    ]
+    assert extract.month_chunks('2024-03-05', '2024-03-05') == [('2024-03-05', '2024-03-05')]
+
+
+def test_run_backfill_writes_every_business_day_and_checkpoint():
+    fake = FakeYahoo()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = LocalBackend(tmp_dir)
+        result = backfill(backend, fake)
+
+        expected_days = {day.strftime('%Y-%m-%d') for day in pd.bdate_range('2023-11-15', '2024-02-10')}
+        written = {p.name for p in (Path(tmp_dir) / 'raw').glob('20*') if p.is_dir()}
+        assert written == expected_days
+        assert result['complete'] and result['pending'] == [] and result['failed'] == []
+        assert result['partitions'] == len(expected_days)
+        assert result['rows'] == 2 * len(expected_days)
+
+        checkpoint = json.loads(backend.get('raw/_backfill/2023-11-15_2024-02-10.json'))
+        assert sorted(checkpoint['completed']) == ['2023-11-15', '2023-12-01', '2024-01-01', '2024-02-01']
+        # Data final exclusiva no yfinance: o ultimo pedaco pede ate o dia seguinte
+        assert ('A.SA', '2024-02-01', '2024-02-11') in fake.calls
+
+
+def test_run_backfill_resumes_after_time_budget_runs_out():
+    fake = FakeYahoo()
+    budget = iter([300, 300, 10])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = LocalBackend(tmp_dir)
+        partial = backfill(backend, fake, max_workers=1, remaining_seconds=lambda: next(budget, 0))
+        assert not partial['complete']
+        assert partial['completed'] == ['2023-11-15', '2023-12-01']
+        assert partial['pending'] == [['2024-01-01', '2024-01-31'], ['2024-02-01', '2024-02-10']]
+
+        fake.calls.clear()
+        resumed = backfill(backend, fake)
+        assert resumed['complete']
+        assert sorted({start for _, start, _ in fake.calls}) == ['2024-01-01', '2024-02-01']
+
+
+def test_run_backfill_keeps_chunk_with_failed_ticker_pending():
+    fake = FakeYahoo(failing=[('B.SA', '2024-01-01')])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = LocalBackend(tmp_dir)
+        result = backfill(backend, fake)
+        assert not result['complete']
+        assert result['failed'] == [{'chunk': ['2024-01-01', '2024-01-31'], 'tickers': ['B.SA']}]
+        assert '2024-01-01' not in result['completed']
+
+        fake.failing.clear()
+        fake.calls.clear()
+        assert backfill(backend, fake)['complete']
+        assert {start for _, start, _ in fake.calls} == {'2024-01-01'}
+
+
+def test_backfill_handler_marker_carries_backfilled_window(monkeypatch, tmp_path):
+    fake = FakeYahoo()
+    backend = LocalBackend(tmp_path)
+    run_backfill = extract.run_backfill
+
+    def fake_run_backfill(*args, **kwargs):
+        return run_backfill(*args, **{**kwargs, 'tickers': ['A.SA', 'B.SA'], 'downloader': fake,
+                                      'batch_downloader': None, 'rate_per_second': 0, 'cache': None})
+
+    monkeypatch.setenv('EMIT_METRICS', 'false')
+    monkeypatch.setattr(extract, 'S3Backend', lambda bucket, client=None: backend)
+    monkeypatch.setattr(extract, 'get_s3_client', lambda: None)
+    monkeypatch.setattr(extract, 'run_backfill', fake_run_backfill)
+
+    event = {'backfill': {'start_date': '2023-11-15', 'end_date': '2024-02-10'}}
+    assert extract.lambda_handler(event, None)['statusCode'] == 200
+
+    markers = [key for key in backend.list('raw') if key.endswith('_SUCCESS')]
+    assert markers == ['raw/_success/2023-11-15_2024-02-10/_SUCCESS']
+    request = trigger_glue.trigger_request('lake', key=markers[0])
+    assert trigger_glue.job_arguments(request)['--START_DATE'] == '2023-11-15'
+    assert trigger_glue.job_arguments(request)['--END_DATE'] == '2024-02-10'
@@ -0,0 +1,114 @@
+"""
+Testes do download concorrente/em lote do extract.py com um downloader falso
+no lugar do Yahoo Finance.
+"""
+import os
+import sys
+import time
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, str(Path(__file__).parent.parent / 'functions'))
+
+import extract
+
+
+class FakeYahoo:
+    """Downloader local que gera dados sintéticos e registra a concorrência."""
+    
+    def __init__(self, empty=(), failing=(), slow=(), delay=0.0):
+        self.empty = set(empty)
+        self.failing = set(failing)
+        self.slow = set(slow)
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.calls = []
+        self.lock = threading.Lock()
+    
+    def __call__(self, ticker, start_date, end_date):
+        with self.lock:
+            self.calls.append(ticker)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay * (20 if ticker in self.slow else 1))
+            if ticker in self.failing:
+                raise ConnectionError("Yahoo indisponivel")
+            if ticker in self.empty:
+                return pd.DataFrame()
+            dates = pd.date_range(start_date, end_date, freq='D')
+            return pd.DataFrame({
+                'Date': dates, 'Close': 10.0, 'High': 11.0, 'Low': 9.0,
+                'Open': 10.0, 'Volume': 1000, 'Ticker': ticker,
+            })
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def test_download_all_tickers_runs_in_parallel_and_reports():
+    tickers = [f'T{i}.SA' for i in range(8)]
+    fake = FakeYahoo(empty=['T3.SA'], failing=['T5.SA'], delay=0.05)
+    
+    df, report = extract.download_all_tickers(
+        tickers, '2024-01-02', '2024-01-04',
+        downloader=fake, batch_downloader=None, max_workers=4, rate_per_second=0,
+    )
+    
+    assert fake.max_active > 1
+    assert sorted(df['Ticker'].unique()) == sorted(set(tickers) - {'T3.SA', 'T5.SA'})
+    assert report['T3.SA']['status'] == 'empty'
+    assert report['T5.SA']['status'] == 'error'
+    assert 'ConnectionError' in report['T5.SA']['error']
+    assert report['T0.SA'] == {**report['T0.SA'], 'status': 'ok', 'method': 'single', 'records': 3}
+
+
+def test_download_all_tickers_times_out_slow_ticker():
+    fake = FakeYahoo(slow=['SLOW.SA'], delay=0.05)
+    
+    started = time.monotonic()
+    df, report = extract.download_all_tickers(
+        ['FAST.SA', 'SLOW.SA'], '2024-01-02', '2024-01-02',
+        downloader=fake, batch_downloader=None, rate_per_second=0, timeout=0.3,
+    )
+    
+    assert time.monotonic() - started < 0.9
+    assert report['SLOW.SA']['status'] == 'timeout'
+    assert list(df['Ticker'].unique()) == ['FAST.SA']
+
+
+def test_download_all_tickers_uses_batch_and_falls_back():
+    fake = FakeYahoo()
+    
+    def batch(tickers, start_date, end_date):
+        return {t: fake(t, start_date, end_date) for t in tickers if t != 'MISSING.SA'}
+    
+    df, report = extract.download_all_tickers(
+        ['A.SA', 'B.SA', 'MISSING.SA'], '2024-01-02', '2024-01-03',
+        downloader=fake, batch_downloader=batch, rate_per_second=0,
+    )
+    
+    assert report['A.SA']['method'] == 'batch'
+    assert report['MISSING.SA']['method'] == 'single'
+    assert fake.calls == ['A.SA', 'B.SA', 'MISSING.SA']
+    assert len(df) == 6
+
+
+def test_download_tickers_batch_splits_multiindex(monkeypatch):
+    dates = pd.DatetimeIndex(pd.date_range('2024-01-02', periods=2), name='Date')
+    columns = pd.MultiIndex.from_product([['Close', 'Volume'], ['ITUB4.SA', 'BBAS3.SA']],
+                                         names=['Price', 'Ticker'])
+    raw = pd.DataFrame([[1.0, float('nan'), 10, float('nan')], [2.0, float('nan'), 20, float('nan')]],
+                       index=dates, columns=columns)
+    monkeypatch.setattr(extract.yf, 'download', lambda *args, **kwargs: raw)
+    
+    result = extract.download_tickers_batch(['ITUB4.SA', 'BBAS3.SA'], '2024-01-02', '2024-01-04')
+    
+    assert list(result) == ['ITUB4.SA']
+    df = result['ITUB4.SA']
+    assert ('Close', 'ITUB4.SA') in df.columns
+    assert df['Ticker'].tolist() == ['ITUB4.SA', 'ITUB4.SA']
@@ -0,0 +1,24 @@
+"""
+Testes da partida da Lambda de extração (benchmarks/startup.py): cada modo roda
+em um processo novo, com dry_run e cache de downloads pré-populado.
+"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+from startup import run_startup
+
+
+def test_fast_start_defers_unused_dependencies():
+    results = run_startup(repeats=1, invocations=2)
+
+    eager, fast = results['eager'], results['fast']
+    assert eager['cache_hits'] == fast['cache_hits'] == 3
+    assert {'pandas', 'yfinance', 'boto3', 'partition_index', 'storage_profiles'} <= set(eager['imports'])
+
+    # Todos os tickers vieram do cache e o dry_run nao usa o S3: yfinance e boto3 nunca sao importados
+    assert 'pandas' in fast['imports']
+    assert not {'yfinance', 'boto3'} & set(fast['imports'])
+    assert fast['import_ms'] < eager['import_ms']
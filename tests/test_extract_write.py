@@ -0,0 +1,70 @@
+"""
+Testes da gravação de partições RAW do extract.py (sem acesso ao Yahoo ou à AWS).
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, str(Path(__file__).parent.parent / 'functions'))
+
+import extract
+from object_store import LocalBackend
+
+
+def create_yfinance_like_frame(periods: int = 5) -> pd.DataFrame:
+    """Simula o retorno de yf.download(...).reset_index() com colunas MultiIndex."""
+    dates = pd.date_range('2024-01-02', periods=periods, freq='D')
+    frames = []
+    for i, ticker in enumerate(['ITUB4.SA', 'BBAS3.SA']):
+        df = pd.DataFrame({
+            ('Date', ''): dates,
+            ('Close', ticker): [30.0 + i + d for d in range(periods)],
+            ('High', ticker): [31.0 + i + d for d in range(periods)],
+            ('Low', ticker): [29.0 + i + d for d in range(periods)],
+            ('Open', ticker): [29.5 + i + d for d in range(periods)],
+            ('Volume', ticker): [1_000_000 + d for d in range(periods)],
+            ('Ticker', ''): ticker,
+        })
+        df.columns = pd.MultiIndex.from_tuples(df.columns)
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_write_partitions_direct_matches_tmp_layout():
+    df = create_yfinance_like_frame()
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_dir = Path(tmp_dir) / 'legacy'
+        direct_dir = Path(tmp_dir) / 'direct'
+        
+        extract.save_to_parquet_partitioned(df, str(legacy_dir))
+        written = extract.write_partitions_direct(df, LocalBackend(direct_dir), '')
+        
+        legacy_files = sorted(p.relative_to(legacy_dir).as_posix() for p in legacy_dir.rglob('*.parquet'))
+        direct_files = sorted(p.relative_to(direct_dir).as_posix() for p in direct_dir.rglob('*/*.parquet'))
+        assert direct_files == legacy_files
+        assert [w['partition'] for w in written] == [f.split('/')[0] for f in legacy_files]
+        assert sum(w['rows'] for w in written) == len(df)
+        
+        for relative in legacy_files:
+            expected = pd.read_parquet(legacy_dir / relative)
+            result = pd.read_parquet(direct_dir / relative)
+            pd.testing.assert_frame_equal(result, expected)
+
+
+def test_write_partitions_direct_does_not_mutate_input():
+    df = create_yfinance_like_frame()
+    columns_before = df.columns.copy()
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        extract.write_partitions_direct(df, LocalBackend(tmp_dir), 'raw')
+        
+        assert sorted(p.name for p in (Path(tmp_dir) / 'raw').iterdir()) == [
+            f'2024-01-0{d}' for d in range(2, 7)
+        ] + ['_index.parquet']
+    
+    assert df.columns.equals(columns_before)
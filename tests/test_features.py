@@ -0,0 +1,103 @@
+"""
+Testes do registro declarativo de features (src/features.py), comparando com
+os rolling/shift nativos do Polars avaliados por ticker.
+"""
+import sys
+from pathlib import Path
+
+import polars as pl
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from features import FEATURES, add_features, required_history, validate_features
+
+
+def create_prices(lengths=(45, 3, 80)) -> pl.LazyFrame:
+    """Séries de tamanhos diferentes (inclusive menor que as janelas), ordenadas por ticker/data."""
+    rows = []
+    for i, length in enumerate(lengths):
+        for d in range(length):
+            rows.append({'Ticker': f'T{i}.SA', 'Date': d, 'Close': 1000.0 * (i + 1) + ((d * 37 + i) % 19) * 0.37})
+    return pl.LazyFrame(rows).sort(['Ticker', 'Date'])
+
+
+def reference_expr(feature: dict) -> pl.Expr:
+    close = pl.col('Close')
+    if feature['kind'] == 'mean':
+        expr = close.rolling_mean(window_size=feature['window'])
+    elif feature['kind'] == 'std':
+        expr = close.rolling_std(window_size=feature['window'])
+    else:
+        expr = close.shift(feature['periods'])
+    return expr.over('Ticker').alias(feature['name'])
+
+
+def test_add_features_matches_native_rolling():
+    features = FEATURES + [
+        {'name': 'media_movel_60d', 'kind': 'mean', 'window': 60},
+        {'name': 'volatilidade_21d', 'kind': 'std', 'window': 21},
+    ]
+    lf = create_prices()
+
+    result = add_features(lf, features).collect()
+    expected = lf.with_columns([reference_expr(feature) for feature in features]).collect()
+
+    assert result.columns == expected.columns
+    for feature in features:
+        name = feature['name']
+        assert result[name].is_null().to_list() == expected[name].is_null().to_list(), name
+        diff = (result[name] - expected[name]).abs().max()
+        assert diff is None or diff < 1e-8, name
+
+
+def test_registry_helpers():
+    assert required_history(FEATURES) == 30
+    assert required_history([{'name': 'lag_40d', 'kind': 'lag', 'periods': 40}]) == 40
+
+    with pytest.raises(ValueError):
+        validate_features([{'name': 'x', 'kind': 'median', 'window': 5}])
+    with pytest.raises(ValueError):
+        validate_features([{'name': 'x', 'kind': 'std', 'window': 1}])
+    with pytest.raises(ValueError):
+        validate_features(FEATURES + [FEATURES[0]])
+
+
+def create_tie_prices(days=2500) -> pl.LazyFrame:
+    """Precos em oitavos (exatos em float): muitas medias caem em x,xx5 (empate do round(2))."""
+    rows = []
+    for i in range(3):
+        close = 40.0 + 10 * i
+        for d in range(days):
+            close = max(1.0, close + ((d * d * 7 + d * 3 + i) % 13 - 6) / 8)
+            rows.append({'Ticker': f'T{i}.SA', 'Date': d, 'Close': close})
+    return pl.LazyFrame(rows).sort(['Ticker', 'Date'])
+
+
+def test_rounded_means_match_rolling_mean_on_ties():
+    lf = create_tie_prices()
+    means = [feature for feature in FEATURES if feature['kind'] == 'mean']
+
+    result = add_features(lf, means).collect()
+    expected = lf.with_columns([reference_expr(feature) for feature in means]).collect()
+
+    for feature in means:
+        name = feature['name']
+        exact = expected[name].drop_nulls()
+        ties = ((exact * 1000) % 10 == 5).sum()
+        assert ties > 100, name
+        # Com somas exatas, o rolling do Polars tambem e exato: os empates tem de coincidir
+        assert result[name].round(2).to_list() == expected[name].round(2).to_list(), name
+
+
+def test_features_do_not_depend_on_series_start():
+    # Uma execucao com PROCESS_DATE le so o aquecimento: mesmas features da serie completa
+    lf = create_prices(lengths=(1500, 1500)).with_columns(pl.col('Close').round(2))
+    full = add_features(lf).collect()
+    ranged = add_features(lf.filter(pl.col('Date') >= 1234)).collect()
+
+    joined = full.join(ranged, on=['Ticker', 'Date'], suffix='_ranged').drop_nulls()
+    assert joined.height > 0
+    for feature in FEATURES:
+        name = feature['name']
+        assert (joined[name] == joined[f'{name}_ranged']).all(), name
@@ -0,0 +1,105 @@
+"""
+Testes do manifesto de conteudo (src/manifest.py) usado por
+save_partitioned_by_date para pular particoes sem mudanca.
+"""
+import contextlib
+import io
+import json
+import sys
+from datetime import date
+from pathlib import Path
+
+import polars as pl
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from manifest import MANIFEST_FILE, plan_sync
+from transform import save_partitioned_by_date
+
+
+def prices(days: list, close: float = 10.0) -> pl.DataFrame:
+    return pl.DataFrame({
+        'data_pregao': [date(2024, 1, d) for d in days],
+        'nome_acao': ['petr4'] * len(days),
+        'fechamento': [close + d for d in days],
+    })
+
+
+def save(df: pl.DataFrame, path: Path, prune=None) -> dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return save_partitioned_by_date(df, str(path), 'data_pregao', max_workers=2, prune=prune)
+
+
+def mtimes(path: Path) -> dict:
+    return {p.parent.name: p.stat().st_mtime_ns for p in path.glob('*/data.parquet')}
+
+
+def test_unchanged_partitions_are_skipped(tmp_path):
+    first = save(prices([2, 3, 4]), tmp_path)
+    assert (first['written'], first['skipped'], first['deleted']) == (3, 0, 0)
+    before = mtimes(tmp_path)
+
+    again = save(prices([2, 3, 4]), tmp_path)
+    assert (again['written'], again['skipped'], again['deleted']) == (0, 3, 0)
+    assert mtimes(tmp_path) == before
+
+    # So o dia alterado e regravado
+    changed = pl.concat([prices([2, 3]), prices([4], close=99.0)])
+    report = save(changed, tmp_path)
+    assert [p['partition'] for p in report['partitions'] if p['status'] == 'written'] == ['data_pregao=2024-01-04']
+    assert pl.read_parquet(tmp_path / 'data_pregao=2024-01-04' / 'data.parquet')['fechamento'].to_list() == [103.0]
+
+    manifest = json.loads((tmp_path / MANIFEST_FILE).read_text())['partitions']
+    assert sorted(manifest) == ['data_pregao=2024-01-02', 'data_pregao=2024-01-03', 'data_pregao=2024-01-04']
+    assert manifest['data_pregao=2024-01-04']['rows'] == 1
+
+
+def test_missing_object_is_rewritten_and_prune_deletes(tmp_path):
+    save(prices([2, 3, 4, 5]), tmp_path)
+    (tmp_path / 'data_pregao=2024-01-02' / 'data.parquet').unlink()
+
+    # Reprocessa 03..04 sem o dia 03: so ele e removido; o 05 fica fora do intervalo
+    report = save(prices([2, 4]), tmp_path, prune=(date(2024, 1, 3), date(2024, 1, 4)))
+    assert (report['written'], report['skipped'], report['deleted']) == (1, 1, 1)
+    assert sorted(p.name for p in tmp_path.glob('data_pregao=*')) == [
+        'data_pregao=2024-01-02', 'data_pregao=2024-01-04', 'data_pregao=2024-01-05',
+    ]
+
+    report = save(prices([2]), tmp_path, prune='all')
+    assert report['deleted'] == 2
+    assert sorted(json.loads((tmp_path / MANIFEST_FILE).read_text())['partitions']) == ['data_pregao=2024-01-02']
+
+
+def test_plan_sync_without_manifest_writes_everything():
+    entries = {'d=2024-01-02': {'sha256': 'a'}, 'd=2024-01-03': {'sha256': 'b'}}
+    plan = plan_sync({}, entries, {'raw/d=2024-01-02/data.parquet'}, 'raw', prune='all')
+    assert plan == {'write': ['d=2024-01-02', 'd=2024-01-03'], 'skip': [], 'delete': []}
+
+
+def test_incremental_save_plans_from_manifest_without_listing(tmp_path, monkeypatch):
+    from object_store import LocalBackend
+
+    calls = {'list': [], 'exists': []}
+    list_keys, exists = LocalBackend.list, LocalBackend.exists
+    monkeypatch.setattr(LocalBackend, 'list', lambda self, prefix='': calls['list'].append(prefix) or list_keys(self, prefix))
+    monkeypatch.setattr(LocalBackend, 'exists', lambda self, key: calls['exists'].append(key) or exists(self, key))
+
+    # Sem manifesto a camada e listada uma vez
+    save(prices(list(range(2, 20))), tmp_path)
+    assert len(calls['list']) == 1
+
+    # Reprocessamento de um dia: nenhum LIST, so HEAD da particao tocada (e do indice)
+    calls['list'].clear()
+    calls['exists'].clear()
+    report = save(prices([10]), tmp_path, prune=(date(2024, 1, 10), date(2024, 1, 10)))
+    assert (report['written'], report['skipped']) == (0, 1)
+    assert calls['list'] == []
+    assert calls['exists'] == ['data_pregao=2024-01-10/data.parquet', '_index.parquet']
+
+    # Dia alterado: regrava a particao e atualiza o indice sem listar
+    report = save(prices([10], close=50.0), tmp_path, prune=(date(2024, 1, 10), date(2024, 1, 10)))
+    assert report['written'] == 1 and calls['list'] == []
+
+    from partition_index import read_index
+    entries = {entry['partition']: entry for entry in read_index(LocalBackend(str(tmp_path)), '')}
+    assert len(entries) == 18 and entries['data_pregao=2024-01-10']['rows'] == 1
@@ -0,0 +1,88 @@
+"""
+Testes das metricas EMF (src/metrics.py) e dos registros emitidos pelos
+estagios do transform.
+"""
+import importlib.util
+import io
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from metrics import emf_record, stage_metrics
+from test_transform_smoke import create_mock_raw_data, run_transform_local
+
+
+def emf_lines(output: str) -> list:
+    return [json.loads(line) for line in output.splitlines() if line.startswith('{"_aws"')]
+
+
+def test_emf_record_declares_metrics_and_dimensions():
+    record = emf_record({'rows': 10, 'bytes': 2048}, {'component': 'extract', 'stage': 'write'},
+                        {'status': 'ok'}, namespace='Test', timestamp_ms=1)
+
+    directive = record['_aws']['CloudWatchMetrics'][0]
+    assert record['_aws']['Timestamp'] == 1
+    assert directive['Namespace'] == 'Test'
+    assert directive['Dimensions'] == [['component', 'stage']]
+    assert directive['Metrics'] == [{'Name': 'rows', 'Unit': 'Count'}, {'Name': 'bytes', 'Unit': 'Bytes'}]
+    assert (record['component'], record['stage'], record['rows'], record['status']) == ('extract', 'write', 10, 'ok')
+
+
+def test_stage_metrics_emits_one_line_even_on_error():
+    stream = io.StringIO()
+    with stage_metrics('transform', 'read', stream=stream) as metrics:
+        metrics['rows'] = 3
+    with pytest.raises(RuntimeError):
+        with stage_metrics('transform', 'write_agg', stream=stream):
+            raise RuntimeError("falha")
+
+    ok, failed = emf_lines(stream.getvalue())
+    assert ok['rows'] == 3 and ok['status'] == 'ok'
+    assert ok['duration_ms'] >= 0 and ok['peak_rss_mb'] > 0
+    assert failed['stage'] == 'write_agg' and failed['status'] == 'error'
+
+
+def test_metrics_import_and_emit_without_resource_module(monkeypatch):
+    # Windows: sem o modulo resource e sem /proc; o registro sai sem peak_rss_mb
+    monkeypatch.setitem(sys.modules, 'resource', None)
+    spec = importlib.util.spec_from_file_location('metrics_windows', Path(__file__).parent.parent / 'src' / 'metrics.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    def no_proc(*args, **kwargs):
+        raise OSError("sem /proc")
+
+    monkeypatch.setattr(module, 'open', no_proc, raising=False)
+    assert module.resource is None and module.current_rss_mb() is None
+
+    stream = io.StringIO()
+    with module.stage_metrics('extract', 'write', stream=stream) as metrics:
+        metrics['rows'] = 1
+    (record,) = emf_lines(stream.getvalue())
+    assert record['rows'] == 1 and 'peak_rss_mb' not in record
+
+
+def test_transform_emits_metrics_per_stage():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        raw_path = Path(tmpdir) / "raw"
+        bucket_path = Path(tmpdir) / "bucket"
+        raw_path.mkdir()
+        bucket_path.mkdir()
+        create_mock_raw_data(str(raw_path), periods=40)
+
+        output = run_transform_local(str(raw_path), str(bucket_path))
+
+    records = {record['stage']: record for record in emf_lines(output)}
+    assert list(records) == ['read', 'normalize', 'features', 'write_refined', 'aggregate', 'write_agg', 'catalog']
+    assert all(record['component'] == 'transform' for record in records.values())
+    assert records['read']['partitions'] == 40
+    assert records['write_refined']['rows'] == 2 * (40 - 29)
+    assert records['write_refined']['partitions'] == 40 - 29
+    assert records['write_refined']['bytes'] > 0
+    assert records['write_agg']['bytes'] > 0
@@ -0,0 +1,200 @@
+"""
+Testes da camada de I/O compartilhada (src/object_store.py).
+Usa o backend local e stubs do cliente S3, sem acesso à AWS.
+"""
+import io
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+import pytest
+
+from object_store import LocalBackend, PreconditionFailed, S3Backend, is_not_found, open_store, join_key, put_many
+
+
+class FakeS3Client:
+    """Stub mínimo do cliente S3 que registra as chamadas recebidas."""
+
+    def __init__(self):
+        self.objects = {}
+        self.parts = {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None):
+        with self.lock:
+            self.calls.append('put_object')
+            etag = f'"{len(self.objects.get(Key, b""))}"' if Key in self.objects else None
+            if (IfMatch and IfMatch != etag) or (IfNoneMatch == '*' and etag):
+                error = Exception("PreconditionFailed")
+                error.response = {'Error': {'Code': 'PreconditionFailed'}}
+                raise error
+            self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            error = Exception("NoSuchKey")
+            error.response = {'Error': {'Code': 'NoSuchKey'}}
+            raise error
+        body = self.objects[Key]
+        return {'Body': io.BytesIO(body), 'ETag': f'"{len(body)}"'}
+
+    def head_object(self, Bucket, Key):
+        return {k: v for k, v in self.get_object(Bucket, Key).items() if k != 'Body'}
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.calls.append('create_multipart_upload')
+        self.parts[Key] = {}
+        return {'UploadId': 'upload-1'}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.calls.append('upload_part')
+        self.parts[Key][PartNumber] = Body
+        return {'ETag': f'etag-{PartNumber}'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.calls.append('complete_multipart_upload')
+        numbers = [part['PartNumber'] for part in MultipartUpload['Parts']]
+        self.objects[Key] = b''.join(self.parts[Key][n] for n in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append('abort_multipart_upload')
+
+
+class FlakyBackend:
+    """Backend que falha nas primeiras `failures` tentativas de cada chave."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.attempts = {}
+        self.stored = {}
+        self.lock = threading.Lock()
+
+    def put(self, key, body):
+        with self.lock:
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            if self.attempts[key] <= self.failures:
+                raise ConnectionError(f"falha simulada em {key}")
+            self.stored[key] = body
+
+
+def test_local_backend_roundtrip_and_list():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend, prefix = open_store(tmp_dir)
+        assert isinstance(backend, LocalBackend)
+        assert prefix == ''
+
+        results = put_many(backend, [
+            ('refined/data_pregao=2024-01-02/data.parquet', b'a'),
+            ('refined/data_pregao=2024-01-03/data.parquet', b'bb'),
+        ], max_workers=4)
+
+        assert [r['bytes'] for r in results] == [1, 2]
+        assert backend.list('refined') == [
+            'refined/data_pregao=2024-01-02/data.parquet',
+            'refined/data_pregao=2024-01-03/data.parquet',
+        ]
+        assert backend.get('refined/data_pregao=2024-01-03/data.parquet') == b'bb'
+
+
+def test_local_put_of_same_key_from_many_threads():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = LocalBackend(tmp_dir)
+        bodies = [bytes([i]) * 4096 for i in range(16)]
+
+        put_many(backend, [('agg/data.parquet', body) for body in bodies], max_workers=16, max_retries=0)
+
+        assert backend.get('agg/data.parquet') in bodies
+        assert backend.list('agg') == ['agg/data.parquet']
+
+
+def test_put_many_accepts_local_paths():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = Path(tmp_dir) / 'source.parquet'
+        source.write_bytes(b'conteudo')
+        backend = LocalBackend(Path(tmp_dir) / 'dest')
+
+        put_many(backend, [('raw/2024-01-02/data.parquet', source)])
+
+        assert backend.get('raw/2024-01-02/data.parquet') == b'conteudo'
+
+
+def test_put_many_retries_transient_failures():
+    backend = FlakyBackend(failures=2)
+    items = [(f'key-{i}', b'x') for i in range(10)]
+
+    results = put_many(backend, items, max_workers=3, max_retries=2, backoff_seconds=0)
+
+    assert all(r['attempts'] == 3 for r in results)
+    assert sorted(backend.stored) == sorted(key for key, _ in items)
+
+
+def test_put_many_raises_after_exhausting_retries():
+    backend = FlakyBackend(failures=5)
+
+    with pytest.raises(ConnectionError):
+        put_many(backend, [('key', b'x')], max_retries=1, backoff_seconds=0)
+
+
+def test_s3_backend_uses_multipart_for_large_objects():
+    client = FakeS3Client()
+    backend = S3Backend('bucket', client=client, multipart_threshold=10, chunk_size=4)
+    body = bytes(range(25))
+
+    put_many(backend, [('agg/big.parquet', body), ('agg/small.parquet', b'tiny')])
+
+    assert client.objects['agg/big.parquet'] == body
+    assert client.objects['agg/small.parquet'] == b'tiny'
+    assert client.calls.count('upload_part') == 7
+    assert client.calls.count('put_object') == 1
+
+
+def test_conditional_put_rejects_stale_version():
+    backend = S3Backend('bucket', client=FakeS3Client())
+    backend.put_if('raw/_index.parquet', b'v1')
+    with pytest.raises(PreconditionFailed):
+        backend.put_if('raw/_index.parquet', b'v1', None)
+
+    _, version = backend.get_versioned('raw/_index.parquet')
+    backend.put_if('raw/_index.parquet', b'v2-longer', version)
+    with pytest.raises(PreconditionFailed):
+        backend.put_if('raw/_index.parquet', b'v3', version)
+    assert backend.get('raw/_index.parquet') == b'v2-longer'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        local = LocalBackend(tmp)
+        local.put_if('_index.parquet', b'v1')
+        _, version = local.get_versioned('_index.parquet')
+        local.put('_index.parquet', b'outro escritor')
+        with pytest.raises(PreconditionFailed):
+            local.put_if('_index.parquet', b'v2', version)
+
+
+def test_only_missing_objects_count_as_not_found():
+    client = FakeS3Client()
+    with pytest.raises(Exception) as missing:
+        S3Backend('lake', client=client).get('raw/_index.parquet')
+    assert is_not_found(missing.value)
+    assert is_not_found(FileNotFoundError('raw/_index.parquet'))
+
+    backend = S3Backend('lake', client=client)
+    backend.put('refined/data_pregao=2024-01-02/data.parquet', b'x')
+    assert backend.exists('refined/data_pregao=2024-01-02/data.parquet')
+    assert not backend.exists('refined/data_pregao=2024-01-03/data.parquet')
+
+    denied = Exception("AccessDenied")
+    denied.response = {'Error': {'Code': 'AccessDenied'}}
+    throttled = Exception("SlowDown")
+    throttled.response = {'Error': {'Code': 'SlowDown'}}
+    assert not is_not_found(denied) and not is_not_found(throttled)
+
+
+def test_open_store_parses_s3_uri():
+    backend, prefix = open_store('s3://meu-bucket/refined/', client=FakeS3Client())
+
+    assert isinstance(backend, S3Backend)
+    assert backend.bucket == 'meu-bucket'
+    assert join_key(prefix, 'data_pregao=2024-01-02', 'data.parquet') == 'refined/data_pregao=2024-01-02/data.parquet'
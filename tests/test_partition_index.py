@@ -0,0 +1,151 @@
+"""
+Testes do indice de particoes (src/partition_index.py): escrita pelo extract,
+pelo compact_raw e pelo transform, e leitura do raw pelo indice.
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'functions'))
+
+import extract
+from compact_raw import compact_raw
+from object_store import LocalBackend
+from partition_index import INDEX_FILE, index_entry, prune, read_index, update_index
+from test_compact_raw import assert_same_outputs
+from test_extract_write import create_yfinance_like_frame
+from test_transform_smoke import create_mock_raw_data, run_transform_local
+from transform import list_raw_partitions
+
+
+def quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def test_extract_writes_index_used_by_reader():
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_dir = Path(tmp) / 'raw'
+        quiet(extract.write_partitions_direct, create_yfinance_like_frame(periods=5), LocalBackend(tmp), 'raw')
+        quiet(extract.write_partitions_direct, create_yfinance_like_frame(periods=7), LocalBackend(tmp), 'raw')
+
+        entries = read_index(LocalBackend(raw_dir), '')
+        assert [entry['partition'] for entry in entries] == [f'2024-01-0{d}' for d in range(2, 9)]
+        first = entries[0]
+        assert (first['rows'], first['min_ticker'], first['max_ticker']) == (2, 'BBAS3.SA', 'ITUB4.SA')
+        assert first['bytes'] == (raw_dir / first['path']).stat().st_size
+        assert [e['partition'] for e in prune(entries, date(2024, 1, 4), date(2024, 1, 5))] == [
+            '2024-01-04', '2024-01-05',
+        ]
+
+        indexed = quiet(list_raw_partitions, str(raw_dir))
+        assert {day: Path(path).parent.name for day, path in indexed.items()} == {
+            entry['min_date']: entry['partition'] for entry in entries
+        }
+
+        # O indice e o commit da escrita: particao gravada sem atualizar o indice nao e lida
+        shutil.copytree(raw_dir / '2024-01-08', raw_dir / '2024-01-09')
+        assert date(2024, 1, 9) not in quiet(list_raw_partitions, str(raw_dir))
+        (raw_dir / INDEX_FILE).unlink()
+        assert date(2024, 1, 9) in quiet(list_raw_partitions, str(raw_dir))
+
+
+def test_compaction_and_transform_maintain_indexes():
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        raw_dir = tmp_dir / 'raw'
+        raw_dir.mkdir()
+        create_mock_raw_data(str(raw_dir), periods=70)
+        last_date = max(p.name.split('=')[1] for p in raw_dir.iterdir())
+
+        listed_dir = tmp_dir / 'listed'
+        listed_dir.mkdir()
+        run_transform_local(str(raw_dir), str(listed_dir))
+
+        quiet(compact_raw, str(raw_dir), today=date.fromisoformat(last_date))
+        entries = read_index(LocalBackend(raw_dir), '')
+        compacted = [entry for entry in entries if entry['partition'].startswith('period=')]
+        daily = [entry for entry in entries if not entry['partition'].startswith('period=')]
+        assert compacted and all(entry['rows'] and entry['min_ticker'] == 'PETR4.SA' for entry in compacted)
+        assert all(str(entry['min_date'])[:7] == last_date[:7] for entry in daily)
+        assert sum(len(entry['dates']) for entry in entries) == 70
+
+        indexed_dir = tmp_dir / 'indexed'
+        indexed_dir.mkdir()
+        stdout = run_transform_local(str(raw_dir), str(indexed_dir))
+        assert 'Indice de particoes' in stdout
+        assert_same_outputs(listed_dir, indexed_dir)
+
+        refined = read_index(LocalBackend(indexed_dir / 'refined'), '')
+        assert len(refined) == len(list((indexed_dir / 'refined').glob('data_pregao=*')))
+        assert all(entry['rows'] == 2 and entry['max_ticker'] == 'vale3' for entry in refined)
+
+
+class RacingBackend(LocalBackend):
+    """Outro escritor atualiza o indice logo depois da primeira leitura deste escritor."""
+
+    def __init__(self, base_path, other_write):
+        super().__init__(base_path)
+        self.other_write = other_write
+
+    def get_versioned(self, key):
+        result = super().get_versioned(key)
+        if self.other_write:
+            write, self.other_write = self.other_write, None
+            write()
+        return result
+
+
+def test_concurrent_index_updates_keep_both_writers_partitions():
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = LocalBackend(tmp)
+        update_index(backend, 'raw', [index_entry('2024-01-02', '2024-01-02/data.parquet', 2)])
+
+        # Ex: chunk de backfill retomado e extract diario gravando ao mesmo tempo
+        daily = lambda: update_index(backend, 'raw', [index_entry('2024-01-09', '2024-01-09/data.parquet', 2)])
+        racing = RacingBackend(tmp, daily)
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            update_index(racing, 'raw', [index_entry('2023-11-15', '2023-11-15/data.parquet', 2)])
+
+        assert 'alterado por outro escritor' in stdout.getvalue()
+        assert [entry['partition'] for entry in read_index(backend, 'raw')] == [
+            '2023-11-15', '2024-01-02', '2024-01-09',
+        ]
+
+
+class DeniedBackend(LocalBackend):
+    """LocalBackend cujas leituras falham com AccessDenied (como um GET sem permissao no S3)."""
+
+    def get(self, key):
+        error = Exception("AccessDenied")
+        error.response = {'Error': {'Code': 'AccessDenied'}}
+        raise error
+
+    def get_versioned(self, key):
+        return self.get(key), None
+
+
+def test_read_errors_are_not_treated_as_missing_index_or_manifest():
+    from compact_raw import read_manifest
+
+    with tempfile.TemporaryDirectory() as tmp:
+        assert read_index(LocalBackend(tmp), 'raw') is None
+        assert read_manifest(LocalBackend(tmp), 'raw') == {'periods': {}}
+
+        update_index(LocalBackend(tmp), 'raw', [index_entry('2024-01-02', '2024-01-02/data.parquet', 2)])
+        denied = DeniedBackend(tmp)
+        for read in [read_index, read_manifest, lambda backend, prefix: update_index(backend, prefix, [])]:
+            with pytest.raises(Exception, match='AccessDenied'):
+                read(denied, 'raw')
+        assert len(read_index(LocalBackend(tmp), 'raw')) == 1
@@ -0,0 +1,109 @@
+"""
+Testes da normalização da camada RAW: as variantes de schema (longo, wide do
+MultiIndex do yfinance, histórico misto e canônico) geram as mesmas saídas no transform.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, str(Path(__file__).parent.parent / 'functions'))
+
+import extract
+from object_store import LocalBackend
+from test_compact_raw import assert_same_outputs
+from test_transform_smoke import run_transform_local
+
+TICKERS = ['PETR4.SA', 'VALE3.SA', 'ITUB4.SA']
+
+
+def create_long_frame(periods: int = 60) -> pd.DataFrame:
+    """Dados longos determinísticos (Date, Ticker, Open, High, Low, Close, Volume)."""
+    dates = pd.date_range('2024-01-01', periods=periods, freq='D')
+    rows = []
+    for i, ticker in enumerate(TICKERS):
+        for d, day in enumerate(dates):
+            base = 20.0 + 5 * i + (d * 7 + i * 3) % 11
+            rows.append({'Date': day, 'Ticker': ticker, 'Open': base - 0.5, 'High': base + 1.0,
+                         'Low': base - 1.0, 'Close': base, 'Volume': 1_000_000 + 1_000 * ((d * 13 + i) % 97)})
+    return pd.DataFrame(rows)
+
+
+def to_yfinance_wide(df_long: pd.DataFrame) -> pd.DataFrame:
+    """Reproduz o DataFrame combinado do extract: colunas MultiIndex por ticker + coluna Ticker."""
+    frames = []
+    for ticker, group in df_long.groupby('Ticker', sort=False):
+        frame = pd.DataFrame({('Date', ''): group['Date'].values})
+        for field in extract.RAW_PRICE_FIELDS:
+            frame[(field, ticker)] = group[field].values
+        frame[('Ticker', '')] = ticker
+        frame.columns = pd.MultiIndex.from_tuples(frame.columns)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def run_on(tmp_dir: Path, name: str, write, extra_env: dict = None) -> Path:
+    raw_dir = tmp_dir / name / 'raw'
+    raw_dir.mkdir(parents=True)
+    write(raw_dir)
+    output_dir = tmp_dir / name / 'out'
+    output_dir.mkdir()
+    run_transform_local(str(raw_dir), str(output_dir), extra_env)
+    return output_dir
+
+
+def test_schema_variants_produce_identical_outputs():
+    df_long = create_long_frame()
+    df_wide = to_yfinance_wide(df_long)
+    cutoff = df_long['Date'].sort_values().iloc[len(df_long) // 2]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+
+        expected = run_on(tmp_dir, 'long', lambda d: extract.write_partitions_direct(df_long, LocalBackend(d), ''))
+
+        wide = run_on(tmp_dir, 'wide', lambda d: extract.save_to_parquet_partitioned(df_wide, str(d)))
+        assert_same_outputs(expected, wide)
+
+        def write_mixed(raw_dir):
+            backend = LocalBackend(raw_dir)
+            extract.write_partitions_direct(df_long[df_long['Date'] < cutoff], backend, '')
+            extract.write_partitions_direct(df_wide[df_wide[('Date', '')] >= cutoff], backend, '')
+
+        mixed = run_on(tmp_dir, 'mixed', write_mixed)
+        assert_same_outputs(expected, mixed)
+
+        canonical = run_on(
+            tmp_dir, 'canonical',
+            lambda d: extract.write_partitions_direct(extract.to_canonical_long(df_wide), LocalBackend(d), ''),
+            {'RAW_SCHEMA': 'canonical'},
+        )
+        assert_same_outputs(expected, canonical)
+
+
+def test_to_canonical_long_handles_wide_and_long_rows():
+    df_long = create_long_frame(periods=5)
+    df_wide = to_yfinance_wide(df_long)
+
+    # Linha do fallback (Ticker.history): colunas longas e data com timezone
+    fallback = pd.DataFrame({'Date': pd.to_datetime(['2024-01-10']).tz_localize('America/Sao_Paulo'),
+                             'Open': [9.5], 'High': [10.5], 'Low': [9.0], 'Close': [10.0],
+                             'Volume': [500], 'Ticker': ['BBAS3.SA']})
+    mixed = pd.concat([df_wide.set_axis(extract.flatten_column_names(df_wide.columns), axis=1), fallback],
+                      ignore_index=True)
+
+    result = extract.to_canonical_long(mixed)
+
+    assert list(result.columns) == ['Date', 'Ticker'] + extract.RAW_PRICE_FIELDS
+    assert len(result) == len(df_long) + 1
+    assert result['Date'].dt.tz is None
+    assert str(result['Volume'].dtype) == 'Int64'
+    assert result.loc[result['Ticker'] == 'BBAS3.SA', 'Close'].tolist() == [10.0]
+
+    expected = df_long.sort_values(['Ticker', 'Date'], kind='stable').reset_index(drop=True)
+    pd.testing.assert_series_equal(
+        result[result['Ticker'] != 'BBAS3.SA']['Close'].reset_index(drop=True), expected['Close']
+    )
@@ -0,0 +1,54 @@
+"""
+Testes dos perfis de armazenamento Parquet (src/storage_profiles.py).
+"""
+import io
+import sys
+from datetime import date
+from pathlib import Path
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from storage_profiles import get_profile, layer_profiles, write_parquet_arrow, write_parquet_polars
+
+
+def test_layer_profiles_parsing():
+    profiles = layer_profiles()
+    assert profiles['raw']['name'] == 'snappy-fast' and profiles['refined']['name'] == 'zstd-sorted'
+
+    assert {p['name'] for p in layer_profiles('snappy-fast').values()} == {'snappy-fast'}
+
+    profiles = layer_profiles('refined=snappy-fast, agg=zstd-sorted')
+    assert (profiles['refined']['name'], profiles['agg']['name']) == ('snappy-fast', 'zstd-sorted')
+
+    with pytest.raises(ValueError):
+        layer_profiles('gzip-max')
+    with pytest.raises(ValueError):
+        layer_profiles('silver=snappy-fast')
+
+
+def test_sorted_profile_clusters_rows_and_sets_codec():
+    df = pl.DataFrame({
+        'nome_acao': ['vale3', 'itub4', 'petr4'] * 4,
+        'data_pregao': [date(2024, 1, d) for d in (4, 3, 2, 1) for _ in range(3)],
+        'fechamento': [float(i) for i in range(12)],
+    })
+
+    sorted_file = pq.ParquetFile(io.BytesIO(write_parquet_polars(df, get_profile('zstd-sorted'))))
+    table = sorted_file.read()
+    assert table['nome_acao'].to_pylist() == sorted(df['nome_acao'].to_list())
+    assert table['data_pregao'].to_pylist()[:4] == [date(2024, 1, d) for d in (1, 2, 3, 4)]
+    column = sorted_file.metadata.row_group(0).column(0)
+    assert column.compression == 'ZSTD' and column.statistics.has_min_max
+
+    fast_file = pq.ParquetFile(io.BytesIO(write_parquet_polars(df, get_profile('snappy-fast'))))
+    assert fast_file.metadata.row_group(0).column(0).compression == 'SNAPPY'
+    assert fast_file.read()['nome_acao'].to_pylist() == df['nome_acao'].to_list()
+
+    arrow = pa.table({'Ticker': ['B.SA', 'A.SA'], 'Date': [date(2024, 1, 2), date(2024, 1, 2)]})
+    body = write_parquet_arrow(arrow, get_profile('zstd-sorted'))
+    assert pq.read_table(io.BytesIO(body))['Ticker'].to_pylist() == ['A.SA', 'B.SA']
@@ -2,6 +2,8 @@
 Smoke test para transform.py
 Cria dados sintéticos, executa o transform e valida as saídas.
 """
+import contextlib
+import io
 import os
 import sys
 import tempfile
@@ -13,14 +15,15 @@ import pyarrow.parquet as pq
 
 # Adiciona src ao path para importar módulos localmente
 sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
 
 
-def create_mock_raw_data(output_dir: str):
+def create_mock_raw_data(output_dir: str, periods: int = 30):
     """Cria dados RAW sintéticos para teste."""
     print("📦 Criando dados RAW sintéticos...")
     
-    # Simula dados de 30 dias para 2 tickers
-    dates = pd.date_range(end=datetime.now(), periods=30, freq='D')
+    # Simula dados de `periods` dias (padrão: 30) para 2 tickers
+    dates = pd.date_range(end=datetime.now(), periods=periods, freq='D')
     
     data = []
     for ticker in ['PETR4.SA', 'VALE3.SA']:
@@ -51,48 +54,35 @@ def create_mock_raw_data(output_dir: str):
     print(f"✓ Criados {len(df)} registros em: {output_dir}")
 
 
-def run_transform_local(input_path: str, bucket_name: str):
-    """Executa o transform.py localmente com dados de teste."""
+def run_transform_local(input_path: str, bucket_name: str, extra_env: dict = None, stages: list = None):
+    """
+    Executa o transform.py em processo, via API de estágios (sem subprocess).
+    
+    Returns:
+        Saída (stdout) da execução, para verificações nos testes
+    """
     print(f"\n🔧 Executando transform.py...")
     
-    # Define variáveis de ambiente para simular Glue
-    os.environ['BUCKET_NAME'] = bucket_name
-    os.environ['INPUT_PREFIX'] = 'raw/'
-    
-    # Cria argumentos simulando AWS Glue
-    sys.argv = [
-        'transform.py',
-        '--JOB_NAME', 'test_job',
-        '--BUCKET_NAME', bucket_name,
-        '--INPUT_PREFIX', input_path
-    ]
-    
-    # Importa e executa o código do transform
-    # Nota: como o transform.py tem código no nível do módulo,
-    # vamos executá-lo como subprocess para evitar conflitos
-    import subprocess
-    
-    transform_path = Path(__file__).parent.parent / 'src' / 'transform.py'
-    
-    result = subprocess.run(
-        [sys.executable, str(transform_path)],
-        env={
-            **os.environ,
-            'BUCKET_NAME': bucket_name,
-            'INPUT_PREFIX': input_path,
-        },
-        capture_output=True,
-        text=True
-    )
+    import transform
     
-    print(result.stdout)
-    if result.stderr:
-        print("STDERR:", result.stderr)
+    # Variáveis de ambiente simulando os argumentos do Glue
+    environ = {
+        **os.environ,
+        'BUCKET_NAME': bucket_name,
+        'INPUT_PREFIX': input_path,
+        **(extra_env or {}),
+    }
     
-    if result.returncode != 0:
-        raise Exception(f"Transform falhou com código {result.returncode}")
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        config = transform.build_config(argv=['transform.py'], environ=environ)
+        ctx = transform.run_pipeline(config, stages)
+        if not ctx['stop'] and 'df_final' in ctx and 'df_agregado' in ctx:
+            transform.print_summary(ctx)
     
+    print(output.getvalue())
     print("✓ Transform executado com sucesso")
+    return output.getvalue()
 
 
 def validate_output(bucket_path: str):
@@ -112,6 +102,177 @@ def validate_output(bucket_path: str):
     print("\n✅ Todas as validações passaram!")
 
 
+def test_transform_smoke():
+    """Executa o smoke test via pytest."""
+    main()
+
+
+def test_transform_process_date_reads_only_needed_partitions():
+    """PROCESS_DATE regrava só a partição do dia e o mês afetado, com os mesmos valores do full."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = Path(tmp_dir) / 'raw'
+        raw_dir.mkdir(parents=True)
+        create_mock_raw_data(str(raw_dir), periods=90)
+        
+        full_dir = Path(tmp_dir) / 'full'
+        incremental_dir = Path(tmp_dir) / 'incremental'
+        full_dir.mkdir()
+        incremental_dir.mkdir()
+        
+        process_date = max(p.name.split('=')[1] for p in raw_dir.iterdir())
+        
+        run_transform_local(str(raw_dir), str(full_dir))
+        run_transform_local(str(raw_dir), str(incremental_dir), {'PROCESS_DATE': process_date})
+        
+        refined = sorted(p.name for p in (incremental_dir / 'refined').glob('*=*'))
+        agg = sorted(p.name for p in (incremental_dir / 'agg').glob('*=*'))
+        assert refined == [f"data_pregao={process_date}"]
+        assert agg == [f"mes_referencia={process_date[:8]}01"]
+        
+        for partition in [f"refined/{refined[0]}", f"agg/{agg[0]}"]:
+            expected = pd.read_parquet(full_dir / partition / 'data.parquet')
+            result = pd.read_parquet(incremental_dir / partition / 'data.parquet')
+            pd.testing.assert_frame_equal(result, expected)
+
+
+def test_transform_streaming_matches_default_engine():
+    """STREAMING=true gera as mesmas saídas do engine padrão."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = Path(tmp_dir) / 'raw'
+        raw_dir.mkdir(parents=True)
+        create_mock_raw_data(str(raw_dir), periods=60)
+        
+        default_dir = Path(tmp_dir) / 'default'
+        streaming_dir = Path(tmp_dir) / 'streaming'
+        default_dir.mkdir()
+        streaming_dir.mkdir()
+        
+        run_transform_local(str(raw_dir), str(default_dir))
+        run_transform_local(str(raw_dir), str(streaming_dir), {'STREAMING': 'true'})
+        
+        for layer in ['refined', 'agg']:
+            partitions = sorted(p.name for p in (default_dir / layer).glob('*=*'))
+            assert partitions == sorted(p.name for p in (streaming_dir / layer).glob('*=*'))
+            for partition in partitions:
+                expected = pd.read_parquet(default_dir / layer / partition / 'data.parquet')
+                result = pd.read_parquet(streaming_dir / layer / partition / 'data.parquet')
+                pd.testing.assert_frame_equal(result, expected)
+
+
+def test_transform_compact_dtypes_matches_default():
+    """COMPACT_DTYPES=true grava arquivos idênticos (mesmos bytes) aos do modo padrão."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = Path(tmp_dir) / 'raw'
+        raw_dir.mkdir(parents=True)
+        create_mock_raw_data(str(raw_dir), periods=60)
+
+        default_dir = Path(tmp_dir) / 'default'
+        compact_dir = Path(tmp_dir) / 'compact'
+        default_dir.mkdir()
+        compact_dir.mkdir()
+
+        run_transform_local(str(raw_dir), str(default_dir))
+        run_transform_local(str(raw_dir), str(compact_dir), {'COMPACT_DTYPES': 'true'})
+
+        for layer in ['refined', 'agg', 'agg_state']:
+            files = sorted(p.relative_to(default_dir) for p in (default_dir / layer).rglob('*/*.parquet'))
+            assert files
+            assert files == sorted(p.relative_to(compact_dir) for p in (compact_dir / layer).rglob('*/*.parquet'))
+            for path in files:
+                assert (compact_dir / path).read_bytes() == (default_dir / path).read_bytes(), path
+
+
+def test_to_storage_dtypes_restores_catalog_types():
+    import polars as pl
+    import transform
+
+    df = pl.DataFrame({
+        'nome_acao': pl.Series(['PETR4', 'VALE3'], dtype=pl.Categorical),
+        'fechamento': pl.Series([30.12, 61.5], dtype=pl.Float32),
+        'volume_negociado': [1000, 2000],
+    })
+    result = transform.to_storage_dtypes(df)
+    assert result.schema == {'nome_acao': pl.Utf8, 'fechamento': pl.Float64, 'volume_negociado': pl.Int64}
+    assert result['fechamento'].to_list() == [30.12, 61.5]
+
+    plain = df.with_columns(pl.col('nome_acao').cast(pl.Utf8), pl.col('fechamento').cast(pl.Float64))
+    assert transform.to_storage_dtypes(plain) is plain
+
+
+def test_transform_partial_rerun_only_reaggregates():
+    """Estágios podem ser reexecutados isoladamente: reagregar sem regravar o refined."""
+    import transform
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = Path(tmp_dir) / 'raw'
+        raw_dir.mkdir(parents=True)
+        create_mock_raw_data(str(raw_dir), periods=45)
+        
+        config = transform.build_config(argv=['transform.py'], environ={'BUCKET_NAME': tmp_dir,
+                                                                        'INPUT_PREFIX': str(raw_dir)})
+        ctx = transform.run_pipeline(config, ['read', 'normalize', 'features', 'write_refined'])
+        assert (Path(tmp_dir) / 'refined').exists()
+        assert not (Path(tmp_dir) / 'agg').exists()
+        assert set(ctx['timings']) == {'read', 'normalize', 'features', 'write_refined'}
+        
+        # Reaproveita o contexto (refined em memória): nenhum raw é relido
+        hidden_dir = raw_dir.rename(Path(tmp_dir) / 'raw_hidden')
+        ctx = transform.run_pipeline(config, ['aggregate', 'write_agg'], ctx)
+        agg_from_ctx = pd.read_parquet(Path(tmp_dir) / 'agg')
+        hidden_dir.rename(raw_dir)
+        
+        # Reagregação a frio, apenas com o plano lazy (sem write_refined)
+        cold = transform.run_pipeline(config, ['read', 'normalize', 'features', 'aggregate'])
+        assert 'df_refined' not in cold
+        pd.testing.assert_frame_equal(cold['df_agregado'].to_pandas(), ctx['df_agregado'].to_pandas())
+        assert len(agg_from_ctx) == len(ctx['df_agregado'])
+
+
+
+def create_walk_raw_data(output_dir: str, periods: int = 400):
+    """Passeio em centavos por pregão: muitas médias móveis caem em empates x,xx5."""
+    dates = pd.bdate_range(end=datetime.now(), periods=periods)
+    
+    data = []
+    for k, ticker in enumerate(['PETR4.SA', 'VALE3.SA', 'ITUB4.SA']):
+        close = 30.0 + 10 * k
+        for i, date in enumerate(dates):
+            close = max(1.0, round(close + ((i * i * 7 + i * 3 + k) % 41 - 20) / 100, 2))
+            data.append({'Date': date, 'Ticker': ticker, 'Open': close, 'High': close + 0.5,
+                         'Low': close - 0.5, 'Close': close, 'Volume': 1000000 + i})
+    
+    df = pd.DataFrame(data)
+    df['data_particao'] = pd.to_datetime(df['Date']).dt.date
+    pq.write_to_dataset(pa.Table.from_pandas(df, preserve_index=False),
+                        root_path=output_dir, partition_cols=['data_particao'])
+
+
+def test_ranged_runs_publish_same_refined_as_full_rebuild():
+    """Execuções por período (aquecimento curto) publicam as mesmas features da reconstrução completa."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = Path(tmp_dir) / 'raw'
+        raw_dir.mkdir(parents=True)
+        create_walk_raw_data(str(raw_dir), periods=400)
+        days = sorted(p.name.split('=')[1] for p in raw_dir.iterdir())
+        
+        full_dir = Path(tmp_dir) / 'full'
+        full_dir.mkdir()
+        run_transform_local(str(raw_dir), str(full_dir))
+        
+        # Um intervalo dos últimos 40 pregões e dias isolados: cada um lê a partir de outro início
+        runs = [{'START_DATE': days[-40], 'END_DATE': days[-1]}] + [{'PROCESS_DATE': day} for day in days[-37::9]]
+        for n, args in enumerate(runs):
+            ranged_dir = Path(tmp_dir) / f'ranged_{n}'
+            ranged_dir.mkdir()
+            run_transform_local(str(raw_dir), str(ranged_dir), args)
+            
+            partitions = sorted(p.name for p in (ranged_dir / 'refined').glob('*=*'))
+            assert partitions
+            for partition in partitions:
+                expected = pd.read_parquet(full_dir / 'refined' / partition / 'data.parquet')
+                result = pd.read_parquet(ranged_dir / 'refined' / partition / 'data.parquet')
+                pd.testing.assert_frame_equal(result, expected, check_exact=True, obj=partition)
+
 def main():
     """Executa o smoke test completo."""
     print("=" * 80)
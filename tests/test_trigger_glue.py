@@ -0,0 +1,219 @@
+"""
+Testes da Lambda trigger_glue.py com um stub local do Glue e a fila de disparos
+em um LocalBackend no lugar do S3.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from botocore.exceptions import ClientError
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, str(Path(__file__).parent.parent / 'functions'))
+
+import extract
+import trigger_glue
+from object_store import LocalBackend
+
+
+class FakeGlue:
+    """Stub do cliente Glue: estado da execucao ativa e chamadas a start_job_run."""
+
+    def __init__(self, running=False, concurrent_runs_exceeded=False):
+        self.running = running
+        self.concurrent_runs_exceeded = concurrent_runs_exceeded
+        self.started = []
+
+    def get_job_runs(self, JobName, MaxResults):
+        return {'JobRuns': [{'JobRunState': 'RUNNING' if self.running else 'SUCCEEDED'}]}
+
+    def start_job_run(self, JobName, Arguments):
+        if self.concurrent_runs_exceeded:
+            raise ClientError({'Error': {'Code': 'ConcurrentRunsExceededException'}}, 'StartJobRun')
+        self.started.append(Arguments)
+        return {'JobRunId': f"jr_{len(self.started)}"}
+
+
+def s3_event(*keys, bucket='lake'):
+    return {'Records': [{'s3': {'bucket': {'name': bucket}, 'object': {'key': key}}} for key in keys]}
+
+
+GLUE_FINISHED = {'source': 'aws.glue', 'detail-type': 'Glue Job State Change',
+                 'detail': {'jobName': 'transform_job', 'state': 'SUCCEEDED'}}
+
+
+def test_trigger_starts_job_with_layer_prefix():
+    glue = FakeGlue()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        response = trigger_glue.lambda_handler(s3_event('raw/_SUCCESS'), None, glue, LocalBackend(tmp_dir))
+
+    assert response['statusCode'] == 200
+    assert glue.started == [{'--BUCKET_NAME': 'lake', '--INPUT_PREFIX': 'raw/',
+                             '--additional-python-modules': 'polars,yfinance'}]
+
+
+def test_triggers_during_active_run_are_coalesced_into_next_run():
+    glue = FakeGlue(running=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue = LocalBackend(tmp_dir)
+        for day in ['2024-01-03', '2024-01-02']:
+            response = trigger_glue.lambda_handler(s3_event(f'raw/{day}/_SUCCESS'), None, glue, queue)
+            assert response['statusCode'] == 202
+        assert glue.started == []
+        assert len(trigger_glue.read_queue(queue, 'transform_job')) == 2
+
+        # Fim do job: o evento do EventBridge drena a fila em uma unica execucao
+        glue.running = False
+        response = trigger_glue.lambda_handler(GLUE_FINISHED, None, glue, queue)
+
+        assert response['statusCode'] == 200
+        assert glue.started == [{'--BUCKET_NAME': 'lake', '--INPUT_PREFIX': 'raw/',
+                                 '--additional-python-modules': 'polars,yfinance',
+                                 '--START_DATE': '2024-01-02', '--END_DATE': '2024-01-03'}]
+        assert trigger_glue.read_queue(queue, 'transform_job') == {}
+
+        assert trigger_glue.lambda_handler(GLUE_FINISHED, None, glue, queue)['body'] == 'Nada pendente.'
+        assert len(glue.started) == 1
+
+
+def test_concurrent_runs_exceeded_keeps_trigger_and_full_history_wins():
+    glue = FakeGlue(concurrent_runs_exceeded=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue = LocalBackend(tmp_dir)
+        event = {'bucket': 'lake', 'prefix': 'raw/', 'start_date': '2024-02-01', 'end_date': '2024-02-05'}
+        assert trigger_glue.lambda_handler(event, None, glue, queue)['statusCode'] == 202
+        assert trigger_glue.lambda_handler(s3_event('raw/_SUCCESS'), None, glue, queue)['statusCode'] == 202
+        assert len(trigger_glue.read_queue(queue, 'transform_job')) == 2
+
+        glue.concurrent_runs_exceeded = False
+        assert trigger_glue.lambda_handler(s3_event('raw/2024-02-06/_SUCCESS'), None, glue, queue)['statusCode'] == 200
+
+        # Um dos disparos pede o historico inteiro: a execucao coalescida nao recebe intervalo
+        assert glue.started == [{'--BUCKET_NAME': 'lake', '--INPUT_PREFIX': 'raw/',
+                                 '--additional-python-modules': 'polars,yfinance'}]
+        assert trigger_glue.read_queue(queue, 'transform_job') == {}
+
+
+def test_invalid_event_is_rejected():
+    assert trigger_glue.lambda_handler({'foo': 'bar'}, None, FakeGlue(), LocalBackend('/nonexistent'))['statusCode'] == 400
+
+
+def test_coalesce_merges_date_range_and_rejects_mixed_prefixes():
+    requests = [trigger_glue.trigger_request('lake', key='raw/2024-01-05/_SUCCESS'),
+                trigger_glue.trigger_request('lake', prefix='raw/', dates=['2023-12-29'])]
+    assert trigger_glue.coalesce(requests) == {'bucket': 'lake', 'prefix': 'raw/',
+                                               'dates': ['2023-12-29', '2024-01-05']}
+
+    # Sem segmento comum o prefixo seria a raiz do bucket: os disparos nunca sao unidos
+    with pytest.raises(ValueError):
+        trigger_glue.coalesce(requests + [trigger_glue.trigger_request('lake', prefix='refined/')])
+
+
+def test_different_prefixes_start_one_run_each():
+    glue = FakeGlue()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue = LocalBackend(tmp_dir)
+        manual = {'bucket': 'lake', 'prefix': 'refined/', 'start_date': '2024-02-01', 'end_date': '2024-02-05'}
+        glue.running = True
+        assert trigger_glue.lambda_handler(manual, None, glue, queue)['statusCode'] == 202
+
+        # Marker de outra camada com o disparo manual ainda na fila
+        glue.running = False
+        marker = extract.success_marker_key('raw', '2024-03-01', '2024-03-04')
+        assert trigger_glue.lambda_handler(s3_event(marker), None, glue, queue)['statusCode'] == 200
+        assert glue.started == [{'--BUCKET_NAME': 'lake', '--INPUT_PREFIX': 'refined/',
+                                 '--additional-python-modules': 'polars,yfinance',
+                                 '--START_DATE': '2024-02-01', '--END_DATE': '2024-02-05'}]
+        assert [request['prefix'] for request in trigger_glue.read_queue(queue, 'transform_job').values()] == ['raw/']
+
+        # Fim do job: o prefixo que aguardava tem a sua propria execucao
+        assert trigger_glue.lambda_handler(GLUE_FINISHED, None, glue, queue)['statusCode'] == 200
+        assert glue.started[1] == {'--BUCKET_NAME': 'lake', '--INPUT_PREFIX': 'raw/',
+                                   '--additional-python-modules': 'polars,yfinance',
+                                   '--START_DATE': '2024-03-01', '--END_DATE': '2024-03-04'}
+        assert trigger_glue.read_queue(queue, 'transform_job') == {}
+        assert all(run['--INPUT_PREFIX'] for run in glue.started)
+
+
+def test_mixed_prefix_event_during_active_run_is_queued_per_prefix():
+    glue = FakeGlue(running=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue = LocalBackend(tmp_dir)
+        event = s3_event('raw/2024-03-01/_SUCCESS', 'refined/2024-03-01/_SUCCESS', 'raw/2024-03-02/_SUCCESS')
+        assert trigger_glue.lambda_handler(event, None, glue, queue)['statusCode'] == 202
+        queued = sorted((request['prefix'], request['dates'])
+                        for request in trigger_glue.read_queue(queue, 'transform_job').values())
+        assert queued == [('raw/', ['2024-03-01', '2024-03-02']), ('refined/', ['2024-03-01'])]
+
+
+def test_multi_record_event_starts_single_run_with_merged_dates():
+    glue = FakeGlue()
+    event = s3_event('raw/2024-03-04/_SUCCESS', 'raw/2024-03-01/_SUCCESS',
+                     'raw/2024-03-04/_SUCCESS', 'raw/2024-03-05/_SUCCESS')
+    assert len(trigger_glue.parse_event(event)) == 3
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        response = trigger_glue.lambda_handler(event, None, glue, LocalBackend(tmp_dir))
+
+    assert response['statusCode'] == 200
+    assert glue.started == [{'--BUCKET_NAME': 'lake', '--INPUT_PREFIX': 'raw/',
+                             '--additional-python-modules': 'polars,yfinance',
+                             '--START_DATE': '2024-03-01', '--END_DATE': '2024-03-05'}]
+
+
+def test_multi_record_event_during_active_run_is_queued_as_one_trigger():
+    glue = FakeGlue(running=True)
+    event = s3_event('raw/2024-03-01/_SUCCESS', 'raw/2024-03-02/_SUCCESS', 'raw/2024-03-03/_SUCCESS')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queue = LocalBackend(tmp_dir)
+        assert trigger_glue.lambda_handler(event, None, glue, queue)['statusCode'] == 202
+        assert list(trigger_glue.read_queue(queue, 'transform_job').values()) == [
+            {'bucket': 'lake', 'prefix': 'raw/', 'dates': ['2024-03-01', '2024-03-02', '2024-03-03'],
+             'reason': 'active_run', 'queued_at': pytest.approx(time.time(), abs=60)}
+        ]
+
+
+def test_records_from_different_buckets_are_rejected():
+    event = s3_event('raw/_SUCCESS', bucket='a')
+    event['Records'] += s3_event('raw/_SUCCESS', bucket='b')['Records']
+    assert trigger_glue.lambda_handler(event, None, FakeGlue(), LocalBackend('/nonexistent'))['statusCode'] == 400
+
+
+class MarkerS3Client:
+    """Stub do cliente S3 do extract: registra as chaves gravadas com put_object."""
+
+    def __init__(self):
+        self.keys = []
+
+    def put_object(self, Bucket, Key, Body):
+        self.keys.append(Key)
+
+
+def test_daily_extract_marker_limits_run_to_extracted_day(monkeypatch):
+    def download(tickers, start_date, end_date, **kwargs):
+        df = pd.DataFrame({'Date': [pd.Timestamp(start_date)] * 2, 'Ticker': ['ITUB4.SA', 'BBAS3.SA'], 'Close': 30.0})
+        return df, {ticker: {'status': 'ok'} for ticker in tickers}
+
+    client = MarkerS3Client()
+    monkeypatch.setenv('EMIT_METRICS', 'false')
+    monkeypatch.setattr(extract, 'download_all_tickers', download)
+    monkeypatch.setattr(extract, 'write_partitions_direct', lambda df, backend, prefix: [])
+    monkeypatch.setattr(extract, 'get_s3_client', lambda: client)
+
+    assert extract.lambda_handler({}, None)['statusCode'] == 200
+    (marker,) = client.keys
+    day = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    assert marker == f"raw/_success/{day}_{day}/_SUCCESS"
+
+    # O marker real do extract (nao uma chave montada a mao) chega a trigger como evento S3
+    glue = FakeGlue()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        assert trigger_glue.lambda_handler(s3_event(marker), None, glue, LocalBackend(tmp_dir))['statusCode'] == 200
+    assert glue.started == [{'--BUCKET_NAME': 'lake', '--INPUT_PREFIX': 'raw/',
+                             '--additional-python-modules': 'polars,yfinance',
+                             '--START_DATE': day, '--END_DATE': day}]